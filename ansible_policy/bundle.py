@@ -0,0 +1,296 @@
+import os
+import string
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import (
+    init_logger,
+    get_rego_main_package_name,
+)
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+util_rego_path = os.path.join(os.path.dirname(__file__), "rego/utils.rego")
+
+batch_package_prefix = "ansible_policy_batch"
+batch_marker = "__ansible_policy_batch__"
+
+# a wrapper policy which evaluates multiple policy packages over an array of inputs.
+# each item in `input.inputs` has the original policy input and the list of packages to be evaluated for it.
+# the marker printed before each evaluation is used to split `print()` messages per input and package
+batch_wrapper_template = string.Template(
+    """package ${batch_package}
+
+import future.keywords.if
+import future.keywords.in
+
+results[i] := decisions if {
+    item := input.inputs[i]
+    decisions := {pkg: decision | some pkg in item.packages; decision := _decision(pkg, item.input, i)}
+}
+${decision_funcs}"""
+)
+
+batch_decision_func_template = string.Template(
+    """
+_decision("${package}", x, i) := decision if {
+    print("${marker}", i, "${package}")
+    decision := data.${package} with input as x
+}
+"""
+)
+
+
+def make_batch_wrapper(rego_pkg_names: list):
+    rego_pkg_names = sorted(set(rego_pkg_names))
+    wrapper_id = hashlib.sha1(",".join(rego_pkg_names).encode()).hexdigest()[:16]
+    batch_pkg_name = f"{batch_package_prefix}.w{wrapper_id}"
+    decision_funcs = ""
+    for rego_pkg_name in rego_pkg_names:
+        decision_funcs += batch_decision_func_template.safe_substitute(
+            {
+                "marker": batch_marker,
+                "package": rego_pkg_name,
+            }
+        )
+    rego_str = batch_wrapper_template.safe_substitute(
+        {
+            "batch_package": batch_pkg_name,
+            "decision_funcs": decision_funcs,
+        }
+    )
+    return batch_pkg_name, rego_str
+
+
+default_bundle_cache_dir = "/tmp/ansible-policy/bundles"
+default_optimize_level = 1
+
+BundleTargetRego = "rego"
+BundleTargetWasm = "wasm"
+
+_opa_versions = {}
+_file_hashes = {}
+
+
+def get_opa_version(executable_name: str = "opa"):
+    if executable_name in _opa_versions:
+        return _opa_versions[executable_name]
+
+    proc = subprocess.run(
+        [executable_name, "version"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise ValueError(f"failed to run `opa version` command; error details:\nSTDOUT: {proc.stdout}\nSTDERR: {proc.stderr}")
+
+    version = ""
+    for line in proc.stdout.splitlines():
+        if line.startswith("Version:"):
+            version = line.split(":", 1)[-1].strip()
+            break
+    if not version:
+        version = proc.stdout.strip()
+    _opa_versions[executable_name] = version
+    return version
+
+
+def get_file_hash(fpath: str):
+    # the hash is cached by the file stat so that a large data file is read only once
+    stat = os.stat(fpath)
+    stat_key = (fpath, stat.st_mtime_ns, stat.st_size)
+    if stat_key in _file_hashes:
+        return _file_hashes[stat_key]
+
+    sha256 = hashlib.sha256()
+    with open(fpath, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    file_hash = sha256.hexdigest()
+    _file_hashes[stat_key] = file_hash
+    return file_hash
+
+
+@dataclass
+class PolicyBundle(object):
+    path: str = ""
+    key: str = ""
+    # package name of the batch wrapper built into this bundle
+    batch_package: str = ""
+    packages: list = field(default_factory=list)
+
+
+def compute_bundle_key(files: list, opa_version: str, optimize_level: int, entrypoints: list, target: str = BundleTargetRego):
+    sha256 = hashlib.sha256()
+    # the key depends only on the file contents, not on their locations
+    for file_hash in sorted([get_file_hash(fpath) for fpath in files]):
+        sha256.update(file_hash.encode())
+    sha256.update(f"opa={opa_version}".encode())
+    sha256.update(f"optimize={optimize_level}".encode())
+    sha256.update(f"target={target}".encode())
+    for entrypoint in sorted(entrypoints):
+        sha256.update(f"entrypoint={entrypoint}".encode())
+    return sha256.hexdigest()
+
+
+def build_opa_bundle(
+    files: list,
+    entrypoints: list,
+    output_path: str,
+    optimize_level: int = default_optimize_level,
+    target: str = BundleTargetRego,
+    executable_name: str = "opa",
+):
+    cmd = [executable_name, "build", "--target", target, "--output", output_path]
+    if optimize_level > 0:
+        cmd.extend(["--optimize", str(optimize_level)])
+    for entrypoint in entrypoints:
+        cmd.extend(["--entrypoint", entrypoint])
+    cmd.extend(files)
+    logger.debug(f"command: {cmd}")
+    proc = subprocess.run(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    logger.debug(f"proc.stdout: {proc.stdout}")
+    logger.debug(f"proc.stderr: {proc.stderr}")
+    if proc.returncode != 0:
+        raise ValueError(f"failed to run `opa build` command; error details:\nSTDOUT: {proc.stdout}\nSTDERR: {proc.stderr}")
+    return
+
+
+def get_or_build_bundle(
+    policy_files: list,
+    external_data_path: str = "",
+    cache_dir: str = default_bundle_cache_dir,
+    optimize_level: int = default_optimize_level,
+    executable_name: str = "opa",
+):
+    packages = []
+    for policy_path in policy_files:
+        rego_pkg_name = get_rego_main_package_name(rego_path=policy_path)
+        if not rego_pkg_name:
+            raise ValueError(f"`package` must be defined in the rego policy file `{policy_path}`")
+        packages.append(rego_pkg_name)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as work_dir:
+        # a batch wrapper for all the packages is built into the bundle,
+        # because the bundle owns the whole data tree and no policy can be added later
+        batch_package, wrapper_str = make_batch_wrapper(rego_pkg_names=packages)
+        wrapper_path = os.path.join(work_dir, f"{batch_package}.rego")
+        with open(wrapper_path, "w") as file:
+            file.write(wrapper_str)
+
+        files = [util_rego_path] + sorted(policy_files) + [wrapper_path]
+        if external_data_path:
+            files.append(external_data_path)
+        entrypoints = [pkg.replace(".", "/") for pkg in sorted(set(packages))]
+        entrypoints.append(f"{batch_package}.results".replace(".", "/"))
+
+        opa_version = get_opa_version(executable_name=executable_name)
+        key = compute_bundle_key(files=files, opa_version=opa_version, optimize_level=optimize_level, entrypoints=entrypoints)
+        bundle_path = os.path.join(cache_dir, f"{key}.tar.gz")
+        if os.path.exists(bundle_path):
+            logger.debug(f"use the cached bundle `{bundle_path}`")
+        else:
+            logger.debug(f"building a policy bundle `{bundle_path}`")
+            tmp_bundle_path = os.path.join(work_dir, "bundle.tar.gz")
+            build_opa_bundle(
+                files=files,
+                entrypoints=entrypoints,
+                output_path=tmp_bundle_path,
+                optimize_level=optimize_level,
+                executable_name=executable_name,
+            )
+            # rename is atomic, so concurrent runs never see a partially written bundle
+            os.replace(tmp_bundle_path, bundle_path)
+
+    bundle = PolicyBundle(
+        path=bundle_path,
+        key=key,
+        batch_package=batch_package,
+        packages=packages,
+    )
+    return bundle
+
+
+@dataclass
+class WasmModule(object):
+    path: str = ""
+    key: str = ""
+    packages: list = field(default_factory=list)
+    # entrypoint name for each package
+    entrypoints: dict = field(default_factory=dict)
+
+
+def get_or_build_wasm_module(
+    policy_files: list,
+    cache_dir: str = default_bundle_cache_dir,
+    optimize_level: int = default_optimize_level,
+    executable_name: str = "opa",
+):
+    packages = []
+    for policy_path in policy_files:
+        rego_pkg_name = get_rego_main_package_name(rego_path=policy_path)
+        if not rego_pkg_name:
+            raise ValueError(f"`package` must be defined in the rego policy file `{policy_path}`")
+        packages.append(rego_pkg_name)
+
+    # external data is not built into the module; it is set to the module memory at runtime
+    files = [util_rego_path] + sorted(policy_files)
+    entrypoints = {pkg: pkg.replace(".", "/") for pkg in sorted(set(packages))}
+
+    opa_version = get_opa_version(executable_name=executable_name)
+    key = compute_bundle_key(
+        files=files,
+        opa_version=opa_version,
+        optimize_level=optimize_level,
+        entrypoints=list(entrypoints.values()),
+        target=BundleTargetWasm,
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    wasm_path = os.path.join(cache_dir, f"{key}.wasm")
+    if os.path.exists(wasm_path):
+        logger.debug(f"use the cached wasm module `{wasm_path}`")
+    else:
+        logger.debug(f"building a wasm module `{wasm_path}`")
+        with tempfile.TemporaryDirectory(dir=cache_dir) as work_dir:
+            tmp_bundle_path = os.path.join(work_dir, "bundle.tar.gz")
+            build_opa_bundle(
+                files=files,
+                entrypoints=list(entrypoints.values()),
+                output_path=tmp_bundle_path,
+                optimize_level=optimize_level,
+                target=BundleTargetWasm,
+                executable_name=executable_name,
+            )
+            tmp_wasm_path = os.path.join(work_dir, "policy.wasm")
+            with tarfile.open(tmp_bundle_path, "r:gz") as tar:
+                member = None
+                for _member in tar.getmembers():
+                    if _member.name.lstrip("/") == "policy.wasm":
+                        member = _member
+                        break
+                if not member:
+                    raise ValueError(f"`policy.wasm` is not found in the wasm bundle built by `opa build`; members: {tar.getnames()}")
+                with tar.extractfile(member) as src, open(tmp_wasm_path, "wb") as dst:
+                    dst.write(src.read())
+            os.replace(tmp_wasm_path, wasm_path)
+
+    wasm_module = WasmModule(
+        path=wasm_path,
+        key=key,
+        packages=packages,
+        entrypoints=entrypoints,
+    )
+    return wasm_module
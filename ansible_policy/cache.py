@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import init_logger, get_policy_metadata
+from ansible_policy.bundle import get_file_hash
+from ansible_policy.serializer import to_jsonable
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+default_decision_cache_size = 10000
+persistent_cache_filename = "decisions.sqlite"
+
+
+def canonical_json_hash(json_str: str):
+    # the same document gives the same hash regardless of the key order in the JSON string
+    canonical = json.dumps(json.loads(json_str), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def make_input_hash(input_data: any):
+    # the hash of the input itself; `_agk` is excluded because it contains the data of the whole project.
+    # the input is flattened by the same encoder as the JSON given to OPA, so that objects in it are hashed
+    # by their attributes instead of their `str()` which may contain a memory address
+    data = dict(input_data.to_dict())
+    data.pop("_agk", None)
+    canonical = json.dumps(to_jsonable(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def make_decision_key(policy_hash: str, input_hash: str, external_data_hash: str = "", scope_hash: str = ""):
+    return f"{policy_hash}:{input_hash}:{external_data_hash}:{scope_hash}"
+
+
+def policy_uses_project_data(rego_path: str):
+    # `resolve_var()` in utils.rego also reads `input._agk`
+    return get_policy_metadata(rego_path).uses_project_data
+
+
+def compute_project_hash(project_dir: str, extra_files: list = None):
+    sha256 = hashlib.sha256()
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = sorted([d for d in dirs if d != ".git"])
+        for fname in sorted(files):
+            fpath = os.path.join(root, fname)
+            if not os.path.isfile(fpath):
+                continue
+            relpath = os.path.relpath(fpath, project_dir)
+            sha256.update(f"{relpath}:{get_file_hash(fpath)}\n".encode())
+    for fpath in extra_files or []:
+        if fpath and os.path.isfile(fpath):
+            sha256.update(f"{fpath}:{get_file_hash(fpath)}\n".encode())
+    return sha256.hexdigest()
+
+
+# DecisionCache is an in-memory LRU cache of evaluation results with an optional TTL.
+@dataclass
+class DecisionCache(object):
+    maxsize: int = default_decision_cache_size
+    # seconds until a cached decision expires; 0 means no expiration
+    ttl: float = 0
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    _entries: OrderedDict = field(default_factory=OrderedDict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at and expires_at < time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: any):
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# PersistentDecisionCache keeps evaluation results in a SQLite file, so that they are reused across runs.
+# New results are buffered and written by `flush()`.
+@dataclass
+class PersistentDecisionCache(object):
+    cache_dir: str = ""
+    buffer_size: int = 1000
+
+    hits: int = 0
+    misses: int = 0
+
+    _conn: sqlite3.Connection = None
+    _pending: list = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        if not self.cache_dir:
+            raise ValueError("`cache_dir` must be specified for the persistent decision cache")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        db_path = os.path.join(self.cache_dir, persistent_cache_filename)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM decisions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: any):
+        with self._lock:
+            self._pending.append((key, json.dumps(value), time.time()))
+            need_flush = len(self._pending) >= self.buffer_size
+        if need_flush:
+            self.flush()
+        return
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._conn.executemany("INSERT OR REPLACE INTO decisions (key, result, created_at) VALUES (?, ?, ?)", self._pending)
+            self._conn.commit()
+            self._pending = []
+        return
+
+    def close(self):
+        if self._conn:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+        return
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
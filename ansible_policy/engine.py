@@ -0,0 +1,797 @@
+import os
+import re
+import json
+import time
+import shutil
+import socket
+import tempfile
+import select
+import weakref
+import threading
+import subprocess
+from multiprocessing.util import Finalize
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ansible_policy.bundle import (
+    util_rego_path,
+    batch_marker,
+    make_batch_wrapper,
+    default_bundle_cache_dir,
+    default_optimize_level,
+    get_or_build_wasm_module,
+)
+from ansible_policy.utils import (
+    init_logger,
+    eval_opa_policy,
+    eval_opa_policy_async,
+    run_opa_eval,
+    run_opa_eval_async,
+    get_rego_main_package_name,
+    get_policy_metadata,
+)
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+EngineTypeSubprocess = "subprocess"
+EngineTypeServer = "server"
+EngineTypeWasm = "wasm"
+EngineTypeNative = "native"
+supported_engine_types = [EngineTypeSubprocess, EngineTypeServer, EngineTypeWasm, EngineTypeNative]
+
+default_batch_size = 500
+
+
+def make_batch_input(batch_items: list):
+    # each input is already a JSON string, so they are just concatenated here
+    items = []
+    for input_data, rego_pkg_names in batch_items:
+        items.append('{"packages":' + json.dumps(rego_pkg_names) + ',"input":' + input_data + "}")
+    return '{"inputs":[' + ",".join(items) + "]}"
+
+
+def split_batch_messages(lines: list):
+    messages = {}
+    current = None
+    for line in lines:
+        if line.startswith(batch_marker):
+            parts = line[len(batch_marker) :].split()
+            current = None
+            if len(parts) == 2 and parts[0].isdigit():
+                current = (int(parts[0]), parts[1])
+            continue
+        if current is not None:
+            messages.setdefault(current, []).append(line)
+    return {key: "".join([f"{m}\n" for m in _messages]) for key, _messages in messages.items()}
+
+
+def make_batch_eval_results(result_value: dict, batch_items: list, lines: list):
+    if not isinstance(result_value, dict):
+        raise ValueError(f"batch evaluation result must be a dict, but received `{type(result_value)}`")
+
+    messages = split_batch_messages(lines=lines)
+    eval_results = []
+    for i, (_, rego_pkg_names) in enumerate(batch_items):
+        # numeric keys of a rego object become strings in the JSON output
+        decisions = result_value.get(str(i), {})
+        eval_results_per_input = {}
+        for rego_pkg_name in rego_pkg_names:
+            if rego_pkg_name not in decisions:
+                raise ValueError(f"batch evaluation result does not contain a decision of `{rego_pkg_name}` for the input #{i}")
+            eval_results_per_input[rego_pkg_name] = {
+                "value": decisions[rego_pkg_name],
+                "message": messages.get((i, rego_pkg_name), ""),
+            }
+        eval_results.append(eval_results_per_input)
+    return eval_results
+
+
+def get_rego_package_names(rego_paths: list):
+    rego_pkg_names = {}
+    for rego_path in rego_paths:
+        rego_pkg_name = get_rego_main_package_name(rego_path=rego_path)
+        if not rego_pkg_name:
+            raise ValueError("`package` must be defined in the rego policy file")
+        rego_pkg_names[rego_path] = rego_pkg_name
+    return rego_pkg_names
+
+
+def resolve_batch_items(batch_items: list):
+    # convert policy paths in `batch_items` to package names
+    rego_paths = []
+    for _, _rego_paths in batch_items:
+        for rego_path in _rego_paths:
+            if rego_path not in rego_paths:
+                rego_paths.append(rego_path)
+    rego_pkg_names = get_rego_package_names(rego_paths=rego_paths)
+    pkg_batch_items = [(input_data, [rego_pkg_names[p] for p in _rego_paths]) for input_data, _rego_paths in batch_items]
+    return rego_pkg_names, pkg_batch_items
+
+
+def to_path_keyed_results(eval_results: list, rego_pkg_names: dict, batch_items: list):
+    path_keyed_results = []
+    for eval_results_per_input, (_, rego_paths) in zip(eval_results, batch_items):
+        path_keyed_results.append({p: eval_results_per_input[rego_pkg_names[p]] for p in rego_paths})
+    return path_keyed_results
+
+
+def parse_server_log(data: bytes):
+    # returns the `print()` outputs and the responses in the JSON log of OPA server, and the last incomplete line
+    lines = data.split(b"\n")
+    entries = []
+    for line in lines[:-1]:
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except Exception:
+            continue
+        # only log entries from `print()` have the `line` field, and "Sent response." has `resp_status`
+        if isinstance(entry, dict) and ("line" in entry or "resp_status" in entry):
+            entries.append(entry)
+    return entries, lines[-1]
+
+
+def stop_opa_process(proc: subprocess.Popen):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    if proc.stderr:
+        proc.stderr.close()
+    return
+
+
+def find_free_port(host: str = "127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+# SubprocessEngine runs `opa eval` command for every single evaluation
+@dataclass
+class SubprocessEngine(object):
+    executable_name: str = "opa"
+    work_dir: str = ""
+    # a compiled policy bundle; if set, it is used instead of the policy and data files
+    bundle: any = None
+
+    batch_wrappers: dict = field(default_factory=dict)
+
+    def load(self, policy_files: list, external_data_path: str = "", bundle: any = None):
+        # nothing is preloaded; every `opa eval` reads the policy and data files by itself
+        self.bundle = bundle
+        return
+
+    def eval(self, rego_path: str, input_data: str, external_data_path: str = ""):
+        if self.bundle:
+            result_value, message = run_opa_eval(input_data=input_data, **self._bundle_query_kwargs(rego_path=rego_path))
+            return {"value": result_value, "message": message}
+
+        return eval_opa_policy(
+            rego_path=rego_path,
+            input_data=input_data,
+            external_data_path=external_data_path,
+            executable_name=self.executable_name,
+        )
+
+    async def eval_async(self, rego_path: str, input_data: str, external_data_path: str = ""):
+        if self.bundle:
+            result_value, message = await run_opa_eval_async(input_data=input_data, **self._bundle_query_kwargs(rego_path=rego_path))
+            return {"value": result_value, "message": message}
+
+        return await eval_opa_policy_async(
+            rego_path=rego_path,
+            input_data=input_data,
+            external_data_path=external_data_path,
+            executable_name=self.executable_name,
+        )
+
+    def _bundle_query_kwargs(self, rego_path: str):
+        rego_pkg_name = get_rego_main_package_name(rego_path=rego_path)
+        if not rego_pkg_name:
+            raise ValueError("`package` must be defined in the rego policy file")
+        return {
+            "query": f"data.{rego_pkg_name}",
+            "data_paths": [],
+            "executable_name": self.executable_name,
+            "bundle_paths": [self.bundle.path],
+        }
+
+    def eval_batch(self, batch_items: list, external_data_path: str = ""):
+        """
+        Evaluate multiple inputs against multiple policies in a single `opa eval`.
+        `batch_items` is a list of (input_data, rego_paths) and the result is
+        a list of {rego_path: eval_result} in the same order.
+        """
+        if not batch_items:
+            return []
+
+        rego_pkg_names, pkg_batch_items = resolve_batch_items(batch_items=batch_items)
+        query_kwargs = self._batch_query_kwargs(rego_pkg_names=rego_pkg_names, external_data_path=external_data_path)
+        result_value, stderr = run_opa_eval(input_data=make_batch_input(pkg_batch_items), **query_kwargs)
+        eval_results = make_batch_eval_results(result_value=result_value, batch_items=pkg_batch_items, lines=stderr.splitlines())
+        return to_path_keyed_results(eval_results=eval_results, rego_pkg_names=rego_pkg_names, batch_items=batch_items)
+
+    async def eval_batch_async(self, batch_items: list, external_data_path: str = ""):
+        if not batch_items:
+            return []
+
+        rego_pkg_names, pkg_batch_items = resolve_batch_items(batch_items=batch_items)
+        query_kwargs = self._batch_query_kwargs(rego_pkg_names=rego_pkg_names, external_data_path=external_data_path)
+        result_value, stderr = await run_opa_eval_async(input_data=make_batch_input(pkg_batch_items), **query_kwargs)
+        eval_results = make_batch_eval_results(result_value=result_value, batch_items=pkg_batch_items, lines=stderr.splitlines())
+        return to_path_keyed_results(eval_results=eval_results, rego_pkg_names=rego_pkg_names, batch_items=batch_items)
+
+    def _batch_query_kwargs(self, rego_pkg_names: dict, external_data_path: str = ""):
+        if self.bundle:
+            # the bundle contains a batch wrapper for all policies in it
+            return {
+                "query": f"data.{self.bundle.batch_package}.results",
+                "data_paths": [],
+                "executable_name": self.executable_name,
+                "bundle_paths": [self.bundle.path],
+            }
+
+        batch_pkg_name, wrapper_path = self.prepare_batch_wrapper(rego_pkg_names=list(rego_pkg_names.values()))
+        return {
+            "query": f"data.{batch_pkg_name}.results",
+            "data_paths": [util_rego_path] + list(rego_pkg_names.keys()) + [wrapper_path, external_data_path],
+            "executable_name": self.executable_name,
+        }
+
+    def prepare_batch_wrapper(self, rego_pkg_names: list):
+        batch_pkg_name, rego_str = make_batch_wrapper(rego_pkg_names=rego_pkg_names)
+        if batch_pkg_name in self.batch_wrappers:
+            return batch_pkg_name, self.batch_wrappers[batch_pkg_name]
+
+        if not self.work_dir:
+            self.work_dir = tempfile.mkdtemp(prefix="ansible-policy-engine-")
+        wrapper_path = os.path.join(self.work_dir, f"{batch_pkg_name}.rego")
+        with open(wrapper_path, "w") as file:
+            file.write(rego_str)
+        self.batch_wrappers[batch_pkg_name] = wrapper_path
+        return batch_pkg_name, wrapper_path
+
+    def close(self):
+        if self.work_dir and os.path.exists(self.work_dir):
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.work_dir = ""
+        self.batch_wrappers = {}
+        return
+
+
+# ServerEngine keeps a single `opa run --server` process per evaluator.
+# Policies and external data are loaded once at startup and each decision is
+# requested through a pooled keep-alive HTTP session.
+@dataclass
+class ServerEngine(object):
+    executable_name: str = "opa"
+    host: str = "127.0.0.1"
+    port: int = 0
+    pool_size: int = 10
+    startup_timeout: float = 10.0
+    # seconds to wait for the print outputs of a decision in the server log
+    print_timeout: float = 5.0
+
+    proc: subprocess.Popen = None
+    session: requests.Session = None
+    loaded_files: list = field(default_factory=list)
+    external_data_path: str = ""
+    bundle: any = None
+    uploaded_policies: list = field(default_factory=list)
+
+    _stderr_buffer: bytes = b""
+    # the URL path of the decision waiting for its print outputs, and the log entries read for it
+    _waiting_path: str = None
+    _log_entries: list = field(default_factory=list)
+    # decisions which may print are evaluated one at a time, so that the print outputs in the log are attributed to them
+    _print_lock: threading.Lock = field(default_factory=threading.Lock)
+    _log_lock: threading.Lock = field(default_factory=threading.Lock)
+    # stops the server when the engine is garbage collected or at exit, without keeping the engine alive
+    _finalizer: weakref.finalize = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def load(self, policy_files: list, external_data_path: str = "", bundle: any = None):
+        files = [util_rego_path] + sorted(policy_files)
+        if bundle:
+            # policies and external data are all included in the bundle
+            files = []
+            external_data_path = ""
+        bundle_path = bundle.path if bundle else ""
+        loaded_bundle_path = self.bundle.path if self.bundle else ""
+        if self.is_running() and files == self.loaded_files and external_data_path == self.external_data_path and bundle_path == loaded_bundle_path:
+            return
+
+        self.close()
+        self.start(files=files, external_data_path=external_data_path, bundle=bundle)
+        return
+
+    def start(self, files: list, external_data_path: str = "", bundle: any = None):
+        if not self.port:
+            self.port = find_free_port(host=self.host)
+
+        # `print()` outputs in policies are written to the server log at info level,
+        # so the log is read back to get the message for each decision
+        cmd = [
+            self.executable_name,
+            "run",
+            "--server",
+            "--addr",
+            f"{self.host}:{self.port}",
+            "--log-format",
+            "json",
+            "--log-level",
+            "info",
+        ]
+        cmd.extend(files)
+        if external_data_path:
+            cmd.append(external_data_path)
+        if bundle:
+            cmd.extend(["--bundle", bundle.path])
+        logger.debug(f"starting OPA server: {cmd}")
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        os.set_blocking(self.proc.stderr.fileno(), False)
+        self._stderr_buffer = b""
+        self._finalizer = weakref.finalize(self, stop_opa_process, self.proc)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if not self.is_running():
+                stderr = self._read_stderr().decode(errors="replace")
+                raise ValueError(f"failed to start OPA server; error details:\nSTDERR: {stderr}")
+            try:
+                resp = self.session.get(f"{self.base_url}/health", timeout=1)
+                if resp.status_code == 200:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            time.sleep(0.05)
+        else:
+            self.close()
+            raise ValueError(f"OPA server did not become ready within {self.startup_timeout} seconds")
+
+        self.loaded_files = files
+        self.external_data_path = external_data_path
+        self.bundle = bundle
+        with self._log_lock:
+            self._read_log()
+        return
+
+    def eval(self, rego_path: str, input_data: str, external_data_path: str = ""):
+        rego_pkg_name = get_rego_main_package_name(rego_path=rego_path)
+        if not rego_pkg_name:
+            raise ValueError("`package` must be defined in the rego policy file")
+
+        # `input_data` is already a JSON string, so it is embedded as is to avoid parsing it again
+        may_print = get_policy_metadata(rego_path).uses_print
+        result_value, messages = self.query(pkg_name=rego_pkg_name, input_data=input_data, may_print=may_print)
+        eval_result = {
+            "value": result_value,
+            "message": "".join([f"{m}\n" for m in messages]),
+        }
+        return eval_result
+
+    def eval_batch(self, batch_items: list, external_data_path: str = ""):
+        if not batch_items:
+            return []
+
+        rego_pkg_names, pkg_batch_items = resolve_batch_items(batch_items=batch_items)
+        if self.bundle:
+            batch_pkg_name = self.bundle.batch_package
+        else:
+            batch_pkg_name = self.prepare_batch_wrapper(rego_pkg_names=list(rego_pkg_names.values()))
+        result_value, lines = self.query(pkg_name=f"{batch_pkg_name}.results", input_data=make_batch_input(pkg_batch_items))
+        eval_results = make_batch_eval_results(result_value=result_value, batch_items=pkg_batch_items, lines=lines)
+        return to_path_keyed_results(eval_results=eval_results, rego_pkg_names=rego_pkg_names, batch_items=batch_items)
+
+    def prepare_batch_wrapper(self, rego_pkg_names: list):
+        batch_pkg_name, rego_str = make_batch_wrapper(rego_pkg_names=rego_pkg_names)
+        if batch_pkg_name in self.uploaded_policies:
+            return batch_pkg_name
+
+        url = f"{self.base_url}/v1/policies/{batch_pkg_name}"
+        resp = self.session.put(url, data=rego_str.encode(), headers={"Content-Type": "text/plain"})
+        if resp.status_code != 200:
+            raise ValueError(f"failed to upload a batch wrapper policy to OPA server; status: {resp.status_code}, body: {resp.text}")
+        self.uploaded_policies.append(batch_pkg_name)
+        return batch_pkg_name
+
+    def query(self, pkg_name: str, input_data: str, may_print: bool = True):
+        if not self.is_running():
+            raise ValueError("OPA server is not running; `load()` must be called before evaluation")
+
+        path = f"/v1/data/{pkg_name.replace('.', '/')}"
+        url = f"{self.base_url}{path}"
+        body = '{"input":' + input_data + "}"
+        if may_print:
+            with self._print_lock:
+                with self._log_lock:
+                    self._waiting_path = path
+                try:
+                    resp = self.session.post(url, data=body.encode(), headers={"Content-Type": "application/json"})
+                    messages = self._read_print_messages(path=path, wait=resp.status_code == 200)
+                finally:
+                    with self._log_lock:
+                        self._waiting_path = None
+                        self._log_entries = []
+        else:
+            resp = self.session.post(url, data=body.encode(), headers={"Content-Type": "application/json"})
+            messages = []
+            # the log is read anyway, otherwise the server is blocked when the pipe is full
+            with self._log_lock:
+                self._read_log()
+        logger.debug(f"url: {url}")
+        logger.debug(f"resp.status_code: {resp.status_code}")
+        logger.debug(f"resp.text: {resp.text}")
+
+        if resp.status_code != 200:
+            raise ValueError(f"failed to evaluate a policy with OPA server; status: {resp.status_code}, body: {resp.text}")
+
+        result = resp.json()
+        if "result" not in result:
+            raise ValueError(f"`result` field does not exist in the response from OPA server; raw output: {resp.text}")
+        return result["result"], messages
+
+    def _read_stderr(self):
+        if not self.proc or not self.proc.stderr:
+            return b""
+        try:
+            chunk = self.proc.stderr.read()
+        except (BlockingIOError, ValueError):
+            chunk = None
+        return chunk or b""
+
+    def _read_print_messages(self, path: str, wait: bool = False):
+        # the server logs "Sent response." with the request path after the print outputs of the request.
+        # only one decision which may print is in flight, so the print outputs until its response are its own
+        messages = []
+        deadline = time.time() + self.print_timeout
+        while True:
+            with self._log_lock:
+                self._read_log()
+                entries = self._log_entries
+                self._log_entries = []
+            for entry in entries:
+                if "resp_status" in entry:
+                    if entry.get("req_path") == path:
+                        return messages
+                    continue
+                messages.append(entry.get("msg", ""))
+            if not wait:
+                return messages
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self.is_running():
+                logger.warning(f"the print outputs of the decision were not found in the OPA server log within {self.print_timeout} seconds")
+                return messages
+            select.select([self.proc.stderr], [], [], remaining)
+
+    def _read_log(self):
+        # called with `_log_lock`; the entries are kept only while a decision is waiting for its print outputs
+        entries, self._stderr_buffer = parse_server_log(self._stderr_buffer + self._read_stderr())
+        if self._waiting_path is not None:
+            self._log_entries.extend(entries)
+        return
+
+    def close(self):
+        if self.session:
+            self.session.close()
+            self.session = None
+        if self._finalizer:
+            self._finalizer.detach()
+            self._finalizer = None
+        if self.proc:
+            stop_opa_process(self.proc)
+            self.proc = None
+        self.loaded_files = []
+        self.bundle = None
+        self.uploaded_policies = []
+        return
+
+
+# the verbs which are commonly used in `sprintf()` of policies
+_sprintf_verb_pattern = re.compile(r"%([-+# 0]*)(\d*)(?:\.(\d+))?([vsdqfTx%])")
+
+
+def _format_value(value: any):
+    if isinstance(value, str):
+        return value
+    # same as the string representation of Rego values, e.g. `["a", "b"]` and `{"a": 1, "b": 2}` with the object keys sorted
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(", ", ": "),
+        default=lambda o: vars(o) if hasattr(o, "__dict__") else f"{o}",
+    )
+
+
+def go_sprintf(fmt: str, values: list):
+    # `sprintf()` is not built into WASM modules, so a subset of Go's fmt.Sprintf is implemented here
+    values = list(values or [])
+    index = 0
+    result = ""
+    last = 0
+    for m in _sprintf_verb_pattern.finditer(fmt):
+        result += fmt[last : m.start()]
+        last = m.end()
+        flags, width, precision, verb = m.groups()
+        if verb == "%":
+            result += "%"
+            continue
+        if index >= len(values):
+            result += f"%!{verb}(MISSING)"
+            continue
+        value = values[index]
+        index += 1
+        if verb == "d" and isinstance(value, (int, float)):
+            text = str(int(value))
+        elif verb == "f" and isinstance(value, (int, float)):
+            text = f"{value:.{int(precision) if precision else 6}f}"
+        elif verb == "q":
+            text = json.dumps(value if isinstance(value, str) else _format_value(value))
+        elif verb == "x" and isinstance(value, int):
+            text = f"{value:x}"
+        elif verb == "T":
+            text = type(value).__name__
+        else:
+            text = _format_value(value)
+        if width:
+            text = text.ljust(int(width)) if "-" in flags else text.rjust(int(width))
+        result += text
+    result += fmt[last:]
+    return result
+
+
+# WasmEngine compiles the enabled policies into a WASM module by `opa build -t wasm`
+# and evaluates them inside the Python process, so no child process is involved in decisions.
+# The external data is written into the module memory only once when it is loaded.
+@dataclass
+class WasmEngine(object):
+    executable_name: str = "opa"
+    cache_dir: str = default_bundle_cache_dir
+    optimize_level: int = default_optimize_level
+
+    module: any = None
+    policy: any = None
+    external_data_path: str = ""
+
+    _messages: list = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def load(self, policy_files: list, external_data_path: str = "", bundle: any = None):
+        try:
+            from opa_wasm import OPAPolicy
+        except ImportError:
+            raise ValueError("`opa-wasm` package is required for the `wasm` engine; install it by `pip install opa-wasm`")
+
+        # a rego bundle cannot be loaded into the WASM runtime, so a WASM module is built separately
+        module = get_or_build_wasm_module(
+            policy_files=policy_files,
+            cache_dir=self.cache_dir,
+            optimize_level=self.optimize_level,
+            executable_name=self.executable_name,
+        )
+        if self.policy and self.module and self.module.key == module.key and self.external_data_path == external_data_path:
+            return
+
+        builtins = {
+            "internal.print": self._print,
+            "sprintf": go_sprintf,
+        }
+        policy = OPAPolicy(module.path, builtins=builtins)
+        if external_data_path:
+            with open(external_data_path, "r") as file:
+                policy.set_data(json.load(file))
+
+        self.module = module
+        self.policy = policy
+        self.external_data_path = external_data_path
+        return
+
+    def _print(self, operands: list):
+        # `print(a, b)` is compiled into `internal.print([{a}, {b}])`; an empty set means the operand is undefined
+        texts = []
+        for operand in operands or []:
+            values = list(operand) if isinstance(operand, (list, set)) else [operand]
+            if not values:
+                texts.append("<undefined>")
+                continue
+            texts.append(_format_value(values[0]))
+        self._messages.append(" ".join(texts))
+        return None
+
+    def eval(self, rego_path: str, input_data: str, external_data_path: str = ""):
+        if not self.policy:
+            raise ValueError("WASM module is not loaded; `load()` must be called before evaluation")
+
+        rego_pkg_name = get_rego_main_package_name(rego_path=rego_path)
+        if not rego_pkg_name:
+            raise ValueError("`package` must be defined in the rego policy file")
+        if rego_pkg_name not in self.module.entrypoints:
+            raise ValueError(f"the package `{rego_pkg_name}` is not compiled into the WASM module")
+
+        entrypoint = self.module.entrypoints[rego_pkg_name]
+        with self._lock:
+            self._messages = []
+            result = self.policy.evaluate(json.loads(input_data), entrypoint=entrypoint)
+            messages = self._messages
+            self._messages = []
+        logger.debug(f"entrypoint: {entrypoint}")
+        logger.debug(f"result: {result}")
+
+        if not result:
+            raise ValueError(f"WASM module returned no result for the entrypoint `{entrypoint}`")
+        first_result = result[0]
+        if not isinstance(first_result, dict) or "result" not in first_result:
+            raise ValueError(f"`result` field does not exist in the output from WASM module; raw output: {result}")
+
+        eval_result = {
+            "value": first_result["result"],
+            "message": "".join([f"{m}\n" for m in messages]),
+        }
+        return eval_result
+
+    def eval_batch(self, batch_items: list, external_data_path: str = ""):
+        # in-process evaluation has no per-call overhead to amortize, so the batch is evaluated one by one
+        eval_results = []
+        for input_data, rego_paths in batch_items:
+            eval_results.append({rego_path: self.eval(rego_path=rego_path, input_data=input_data) for rego_path in rego_paths})
+        return eval_results
+
+    def close(self):
+        self.policy = None
+        self.module = None
+        self.external_data_path = ""
+        return
+
+
+# NativeEngine evaluates policybook policies with Python predicates compiled from their AST,
+# which is saved by the transpiler next to each rego file. Rego policies without the AST are
+# evaluated by the fallback engine. If `verify` is True, every native decision is also evaluated
+# by the fallback engine and a mismatch raises an error.
+@dataclass
+class NativeEngine(object):
+    executable_name: str = "opa"
+    verify: bool = False
+
+    policies: dict = field(default_factory=dict)
+    fallback: SubprocessEngine = None
+
+    # this engine reads `PolicyInput` objects directly instead of their JSON strings
+    accepts_policy_input = True
+
+    def load(self, policy_files: list, external_data_path: str = "", bundle: any = None):
+        from ansible_policy.policybook.python_compiler import PolicyPythonCompiler, get_policy_ast_path
+
+        compiler = PolicyPythonCompiler()
+        self.policies = {}
+        for rego_path in policy_files:
+            ast_path = get_policy_ast_path(rego_path)
+            if not os.path.exists(ast_path):
+                logger.debug(f"policy AST is not found for `{rego_path}`; it is evaluated by OPA")
+                continue
+            try:
+                self.policies[rego_path] = compiler.load_policy(ast_path=ast_path)
+            except Exception as exc:
+                logger.debug(f"failed to compile `{ast_path}` to Python; it is evaluated by OPA. details: {exc}")
+
+        if not self.fallback:
+            self.fallback = SubprocessEngine(executable_name=self.executable_name)
+        self.fallback.load(policy_files=policy_files, external_data_path=external_data_path, bundle=bundle)
+        return
+
+    def eval(self, rego_path: str, input_data: any, external_data_path: str = ""):
+        policy = self.policies.get(rego_path)
+        if not policy:
+            return self.fallback.eval(rego_path=rego_path, input_data=self._to_json(input_data), external_data_path=external_data_path)
+
+        if isinstance(input_data, str):
+            input_doc = json.loads(input_data)
+        else:
+            input_doc = input_data.to_dict()
+        eval_result = policy.evaluate(input_doc)
+
+        if self.verify:
+            expected = self.fallback.eval(rego_path=rego_path, input_data=self._to_json(input_data), external_data_path=external_data_path)
+            self.verify_result(rego_path=rego_path, action_type=policy.action_type, actual=eval_result, expected=expected)
+        return eval_result
+
+    def verify_result(self, rego_path: str, action_type: str, actual: dict, expected: dict):
+        actual_decision = actual.get("value", {}).get(action_type)
+        expected_decision = expected.get("value", {}).get(action_type)
+        if actual_decision != expected_decision or actual.get("message", "") != expected.get("message", ""):
+            raise ValueError(
+                f"native evaluation of `{rego_path}` does not match the Rego evaluation; "
+                f"native: ({action_type}={actual_decision}, message={actual.get('message', '')!r}), "
+                f"rego: ({action_type}={expected_decision}, message={expected.get('message', '')!r})"
+            )
+        return
+
+    def eval_batch(self, batch_items: list, external_data_path: str = ""):
+        eval_results = []
+        for input_data, rego_paths in batch_items:
+            eval_results.append(
+                {rego_path: self.eval(rego_path=rego_path, input_data=input_data, external_data_path=external_data_path) for rego_path in rego_paths}
+            )
+        return eval_results
+
+    def _to_json(self, input_data: any):
+        if isinstance(input_data, str):
+            return input_data
+        return input_data.to_json()
+
+    def close(self):
+        if self.fallback:
+            self.fallback.close()
+        self.policies = {}
+        return
+
+
+_engine_mapping = {
+    EngineTypeSubprocess: SubprocessEngine,
+    EngineTypeServer: ServerEngine,
+    EngineTypeWasm: WasmEngine,
+    EngineTypeNative: NativeEngine,
+}
+
+
+def create_engine(engine_type: str = EngineTypeSubprocess, **kwargs):
+    if engine_type not in _engine_mapping:
+        raise ValueError(f"`engine_type` must be one of {supported_engine_types}, but received `{engine_type}`")
+    _cls = _engine_mapping[engine_type]
+    return _cls(**kwargs)
+
+
+# engines created in a worker process of a process pool; each of them is reused for all work units
+_worker_engines = {}
+
+
+def eval_in_worker(engine_type: str, engine_kwargs: dict, load_kwargs: dict, batch_items: list, use_batch: bool = False):
+    """
+    Evaluate a work unit in a worker process.
+    `batch_items` is a list of (input_data, rego_paths) and the result is
+    a list of {rego_path: eval_result} in the same order.
+    """
+    engine_key = json.dumps([engine_type, engine_kwargs], sort_keys=True)
+    if engine_key not in _worker_engines:
+        engine = create_engine(engine_type=engine_type, **engine_kwargs)
+        # atexit handlers do not run in pool workers, but multiprocessing finalizers do
+        Finalize(None, engine.close, exitpriority=10)
+        _worker_engines[engine_key] = (engine, None)
+    engine, loaded_kwargs = _worker_engines[engine_key]
+    if loaded_kwargs != load_kwargs:
+        engine.load(**load_kwargs)
+        _worker_engines[engine_key] = (engine, load_kwargs)
+
+    external_data_path = load_kwargs.get("external_data_path", "")
+    if use_batch:
+        return engine.eval_batch(batch_items=batch_items, external_data_path=external_data_path)
+
+    eval_results = []
+    for input_data, rego_paths in batch_items:
+        eval_results_per_input = {}
+        for rego_path in rego_paths:
+            eval_results_per_input[rego_path] = engine.eval(rego_path=rego_path, input_data=input_data, external_data_path=external_data_path)
+        eval_results.append(eval_results_per_input)
+    return eval_results
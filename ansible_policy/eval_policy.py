@@ -5,7 +5,12 @@ from ansible_policy.models import (
     PolicyEvaluator,
     ResultFormatter,
     supported_formats,
+    supported_result_retentions,
+    RESULT_RETENTION_ALL,
 )
+from ansible_policy.engine import EngineTypeSubprocess, supported_engine_types
+from ansible_policy.bundle import default_bundle_cache_dir
+from ansible_policy.cache import default_decision_cache_size
 
 
 def eval_policy(
@@ -16,14 +21,32 @@ def eval_policy(
     config_path: str = None,
     policy_dir: str = None,
     external_data_path: str = None,
+    engine_type: str = EngineTypeSubprocess,
+    batch_mode: bool = False,
+    multi_package: bool = False,
+    use_bundle: bool = False,
+    bundle_cache_dir: str = None,
+    verify_native: bool = False,
+    workers: int = 1,
+    cache_dir: str = None,
+    result_retention: str = RESULT_RETENTION_ALL,
+    decision_cache_size: int = 0,
 ):
-
-    if not external_data_path:
-        _external_data_path = os.path.join(os.path.dirname(__file__), "galaxy_data.json")
-        if os.path.exists(_external_data_path):
-            external_data_path = _external_data_path
-
-    evaluator = PolicyEvaluator(config_path=config_path, policy_dir=policy_dir)
+    external_data_path = get_external_data_path(external_data_path)
+    evaluator = create_evaluator(
+        config_path=config_path,
+        policy_dir=policy_dir,
+        engine_type=engine_type,
+        batch_mode=batch_mode,
+        multi_package=multi_package,
+        use_bundle=use_bundle,
+        bundle_cache_dir=bundle_cache_dir,
+        verify_native=verify_native,
+        workers=workers,
+        cache_dir=cache_dir,
+        result_retention=result_retention,
+        decision_cache_size=decision_cache_size,
+    )
     result = evaluator.run(
         eval_type=eval_type,
         project_dir=project_dir,
@@ -34,6 +57,52 @@ def eval_policy(
     return result
 
 
+def get_external_data_path(external_data_path: str = None):
+    if not external_data_path:
+        _external_data_path = os.path.join(os.path.dirname(__file__), "galaxy_data.json")
+        if os.path.exists(_external_data_path):
+            external_data_path = _external_data_path
+    return external_data_path
+
+
+def create_evaluator(
+    config_path: str = None,
+    policy_dir: str = None,
+    engine_type: str = EngineTypeSubprocess,
+    batch_mode: bool = False,
+    multi_package: bool = False,
+    use_bundle: bool = False,
+    bundle_cache_dir: str = None,
+    verify_native: bool = False,
+    workers: int = 1,
+    cache_dir: str = None,
+    result_retention: str = RESULT_RETENTION_ALL,
+    decision_cache_size: int = 0,
+):
+    evaluator = PolicyEvaluator(
+        config_path=config_path,
+        policy_dir=policy_dir,
+        engine_type=engine_type,
+        batch_mode=batch_mode,
+        multi_package=multi_package,
+        use_bundle=use_bundle,
+        bundle_cache_dir=bundle_cache_dir or default_bundle_cache_dir,
+        verify_native=verify_native,
+        workers=workers,
+        persistent_cache_dir=cache_dir or "",
+        result_retention=result_retention,
+        decision_cache_size=decision_cache_size,
+    )
+    return evaluator
+
+
+def positive_int(value: str):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be 1 or more, but `{value}` is given")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description="TODO")
     parser.add_argument("-t", "--type", default="project", help="policy evaluation type (`jobdata`, `project`, `rest` or `event`)")
@@ -46,11 +115,77 @@ def main():
     parser.add_argument("--policy-dir", help="path to a directory containing policies to be evaluated")
     parser.add_argument("--external-data", default="", help="filepath to external data like knowledge base data")
     parser.add_argument("-f", "--format", default="plain", help="output format (`plain` or `json`, default to `plain`)")
+    parser.add_argument(
+        "--engine", default=EngineTypeSubprocess, help="OPA engine type (`subprocess`, `server`, `wasm` or `native`, default to `subprocess`)"
+    )
+    parser.add_argument("--batch", action="store_true", help="evaluate all inputs of the same type together for each policy")
+    parser.add_argument("--multi-package", action="store_true", help="evaluate all applicable policies together for each input")
+    parser.add_argument("--bundle", action="store_true", help="compile the enabled policies into a cached bundle with `opa build`")
+    parser.add_argument("--bundle-cache-dir", default="", help="path to a directory to cache compiled policy bundles")
+    parser.add_argument("--verify-native", action="store_true", help="check every decision of the `native` engine against the Rego evaluation")
+    parser.add_argument("--jobs", type=positive_int, default=1, help="number of worker processes to evaluate policies in parallel (default to 1)")
+    parser.add_argument(
+        "--cache-dir",
+        default="",
+        help="path to a directory to cache evaluation results across runs; cached scans are loaded only if signed with your key in ~/.ansible-policy",
+    )
+    parser.add_argument(
+        "--decision-cache-size",
+        type=int,
+        default=0,
+        help=f"number of decisions cached in memory (default to 0, which disables it, or {default_decision_cache_size} with `--watch`)",
+    )
+    parser.add_argument(
+        "--result-retention",
+        default=RESULT_RETENTION_ALL,
+        help="evaluated targets to keep in the result (`all` or `violations`, default to `all`); `violations` only counts the passed ones",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and evaluate the project again on changes of the project or the policies, showing the new and resolved findings",
+    )
     args = parser.parse_args()
 
     if args.format not in supported_formats:
         raise ValueError(f"The format type `{args.format}` is not supported; it must be one of {supported_formats}")
 
+    if args.engine not in supported_engine_types:
+        raise ValueError(f"The engine type `{args.engine}` is not supported; it must be one of {supported_engine_types}")
+
+    if args.result_retention not in supported_result_retentions:
+        raise ValueError(f"The result retention `{args.result_retention}` is not supported; it must be one of {supported_result_retentions}")
+
+    if args.watch and args.type != "project":
+        raise ValueError(f"`--watch` is supported only for the `project` type, but the type is `{args.type}`")
+
+    if args.watch:
+        from ansible_policy.watch import watch_project
+
+        evaluator = create_evaluator(
+            config_path=args.config,
+            policy_dir=args.policy_dir,
+            engine_type=args.engine,
+            batch_mode=args.batch,
+            multi_package=args.multi_package,
+            use_bundle=args.bundle,
+            bundle_cache_dir=args.bundle_cache_dir,
+            verify_native=args.verify_native,
+            workers=args.jobs,
+            cache_dir=args.cache_dir,
+            result_retention=args.result_retention,
+            decision_cache_size=args.decision_cache_size,
+        )
+        watch_project(
+            evaluator=evaluator,
+            project_dir=args.project_dir,
+            formatter=ResultFormatter(format_type=args.format, base_dir=os.getcwd()),
+            external_data_path=get_external_data_path(args.external_data),
+            variables_path=args.variables,
+            decision_cache_size=args.decision_cache_size or default_decision_cache_size,
+        )
+        return
+
     target_data = None
     if args.json_file:
         with open(args.json_file, "r") as f:
@@ -64,6 +199,16 @@ def main():
         config_path=args.config,
         policy_dir=args.policy_dir,
         external_data_path=args.external_data,
+        engine_type=args.engine,
+        batch_mode=args.batch,
+        multi_package=args.multi_package,
+        use_bundle=args.bundle,
+        bundle_cache_dir=args.bundle_cache_dir,
+        verify_native=args.verify_native,
+        workers=args.jobs,
+        cache_dir=args.cache_dir,
+        result_retention=args.result_retention,
+        decision_cache_size=args.decision_cache_size,
     )
     ResultFormatter(format_type=args.format, base_dir=os.getcwd()).print(result=result)
 
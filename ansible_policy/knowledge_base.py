@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import sqlite3
+import argparse
+import threading
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import init_logger, load_galaxy_data
+from ansible_policy.bundle import get_file_hash
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+# a galaxy knowledge base converted into SQLite has this suffix
+kb_file_suffix = ".kb.sqlite"
+kb_format_version = "1"
+
+# sections of the galaxy data which are looked up by name
+KBSectionModules = "modules"
+KBSectionModuleNameMappings = "module_name_mappings"
+
+
+def is_knowledge_base_file(fpath: str):
+    return bool(fpath) and fpath.endswith(kb_file_suffix)
+
+
+def convert_galaxy_data(input_path: str, output_path: str):
+    # each entry of the dict sections (e.g. `modules`) is stored as a row keyed by its name, so it can be read without parsing the others
+    galaxy = load_galaxy_data(fpath=input_path)
+    if not output_path.endswith(kb_file_suffix):
+        raise ValueError(f"the knowledge base file name must end with `{kb_file_suffix}`")
+
+    tmp_path = output_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE entries (section TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (section, name)) WITHOUT ROWID"
+        )
+        # values other than dicts are kept as they are in the meta table
+        others = {}
+        for section, section_data in galaxy.items():
+            if not isinstance(section_data, dict):
+                others[section] = section_data
+                continue
+            rows = ((section, name, json.dumps(value, separators=(",", ":"))) for name, value in section_data.items())
+            conn.executemany("INSERT INTO entries (section, name, value) VALUES (?, ?, ?)", rows)
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", ("format_version", kb_format_version))
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", ("sections", json.dumps(sorted(k for k in galaxy if k not in others))))
+        conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", ("others", json.dumps(others)))
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, output_path)
+    return
+
+
+# SQLiteGalaxyKnowledgeBase looks up the galaxy data in a converted knowledge base file lazily.
+# the file is opened read-only, so it can be shared by many processes through the page cache
+@dataclass
+class SQLiteGalaxyKnowledgeBase(object):
+    path: str = ""
+    mtime_ns: int = 0
+    size: int = 0
+
+    _conn: sqlite3.Connection = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+    _fqcn_index: dict = field(default_factory=dict)
+
+    @staticmethod
+    def load(fpath: str):
+        stat = os.stat(fpath)
+        kb = SQLiteGalaxyKnowledgeBase(path=fpath, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        kb._conn = sqlite3.connect(f"file:{fpath}?mode=ro", uri=True, check_same_thread=False)
+        version = kb.get_meta("format_version")
+        if version != kb_format_version:
+            kb.close()
+            raise ValueError(f"the knowledge base format version `{version}` is not supported; convert `{fpath}` again")
+        return kb
+
+    def get_meta(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, section: str, name: str, default: any = None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE section = ? AND name = ?", (section, name)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def find_module_fqcn(self, module_name: str):
+        # the first FQCN in `module_name_mappings` like `rego/utils.rego`
+        if module_name not in self._fqcn_index:
+            found = self.get(KBSectionModuleNameMappings, module_name, [])
+            self._fqcn_index[module_name] = found[0] if found and found[0] and "." in found[0] else ""
+        return self._fqcn_index[module_name]
+
+    def to_dict(self):
+        # the whole galaxy data in the same structure as the original JSON file
+        galaxy = json.loads(self.get_meta("others") or "{}")
+        for section in json.loads(self.get_meta("sections") or "[]"):
+            galaxy[section] = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT section, name, value FROM entries").fetchall()
+        for section, name, value in rows:
+            galaxy[section][name] = json.loads(value)
+        return galaxy
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+        return
+
+
+def export_opa_data(kb_path: str, cache_dir: str):
+    # OPA reads only JSON or YAML data files, so a knowledge base is exported into a JSON file once per its content
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path = os.path.join(cache_dir, f"{get_file_hash(kb_path)}.galaxy.json")
+    if os.path.exists(data_path):
+        return data_path
+
+    kb = SQLiteGalaxyKnowledgeBase.load(fpath=kb_path)
+    try:
+        data = {"galaxy": kb.to_dict()}
+    finally:
+        kb.close()
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, data_path)
+    return data_path
+
+
+def make_reduced_opa_data(kb: any, module_names: list, cache_dir: str):
+    # only the entries which `get_module_fqcn()` in utils.rego can read for the given module names
+    galaxy = {KBSectionModules: {}, KBSectionModuleNameMappings: {}}
+    for module_name in sorted(set(module_names)):
+        for section in galaxy:
+            value = kb.get(section, module_name)
+            if value is not None:
+                galaxy[section][module_name] = value
+    data_str = json.dumps({"galaxy": galaxy}, sort_keys=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path = os.path.join(cache_dir, f"{hashlib.sha256(data_str.encode()).hexdigest()}.galaxy.json")
+    if not os.path.exists(data_path):
+        tmp_path = f"{data_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(data_str)
+        os.replace(tmp_path, data_path)
+    return data_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert a galaxy data JSON file into a compact knowledge base file")
+    parser.add_argument("input", help="filepath to the galaxy data JSON file")
+    parser.add_argument("output", help=f"filepath to the knowledge base file to be created (`*{kb_file_suffix}`)")
+    args = parser.parse_args()
+
+    convert_galaxy_data(input_path=args.input, output_path=args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
 import sys
 import re
+import math
+import asyncio
 import glob
 import tempfile
-import jsonpickle
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import List, Union
 from ansible.executor.task_result import TaskResult
@@ -16,29 +18,55 @@ from ansible_policy.rego_data import (
     Event,
     APIRequest,
     PolicyInput,
+    PolicyInputEncoder,
     load_input_from_jobdata,
     load_input_from_project_dir,
     load_input_from_task_result,
     load_input_from_event,
     load_input_from_rest_data,
     process_input_data_with_external_data,
+    collect_task_modules,
 )
 from ansible_policy.policybook.transpiler import PolicyTranspiler
 from ansible_policy.utils import (
     init_logger,
     transpile_yml_policy,
     match_str_expression,
+    compile_str_expression,
     get_tags_from_rego_policy_file,
-    detect_target_module_pattern,
-    detect_target_type_pattern,
-    get_rego_main_package_name,
+    get_policy_metadata,
+    get_knowledge_base,
     validate_opa_installation,
-    eval_opa_policy,
-    match_target_module,
-    match_target_type,
     find_task_line_number,
     find_play_line_number,
 )
+from ansible_policy.engine import (
+    EngineTypeSubprocess,
+    EngineTypeWasm,
+    EngineTypeNative,
+    default_batch_size,
+    create_engine,
+    eval_in_worker,
+)
+from ansible_policy.bundle import (
+    default_bundle_cache_dir,
+    default_optimize_level,
+    get_file_hash,
+    get_or_build_bundle,
+)
+from ansible_policy.routing import PolicyRoutingTable
+from ansible_policy.position_index import YamlPositionIndex
+from ansible_policy.scan_cache import ScanCache
+from ansible_policy.serializer import dumps, register_encoder, public_fields
+from ansible_policy.knowledge_base import is_knowledge_base_file, export_opa_data, make_reduced_opa_data
+from ansible_policy.cache import (
+    DecisionCache,
+    PersistentDecisionCache,
+    canonical_json_hash,
+    compute_project_hash,
+    make_decision_key,
+    make_input_hash,
+)
 
 
 logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
@@ -61,6 +89,11 @@ FORMAT_REST = "rest"
 FORMAT_JSON = "json"
 supported_formats = [FORMAT_PLAIN, FORMAT_EVENT_STREAM, FORMAT_REST, FORMAT_JSON]
 
+# `all` keeps every evaluated target, `violations` keeps only the targets not validated and counts the others
+RESULT_RETENTION_ALL = "all"
+RESULT_RETENTION_VIOLATIONS = "violations"
+supported_result_retentions = [RESULT_RETENTION_ALL, RESULT_RETENTION_VIOLATIONS]
+
 
 @dataclass
 class PolicyPattern(object):
@@ -119,6 +152,95 @@ class PolicyPattern(object):
         return self.enabled
 
 
+# PolicySelector lists the enabled policies under the install root by the `[policy]` patterns.
+# the selection is memoized and it is done again only when any directory under the root or any tagged policy is modified
+@dataclass
+class PolicySelector(object):
+    root_dir: str = ""
+    patterns: List[PolicyPattern] = field(default_factory=list)
+
+    # mtime of each directory under the root, which changes when a file is added or removed
+    _dir_mtimes: dict = None
+    # metadata of the policies whose tags are used for the selection
+    _tag_metadata: dict = field(default_factory=dict)
+    _enabled_policies: list = None
+    _name_matchers: list = None
+
+    def __post_init__(self):
+        # a longer pattern is prioritized than a shorter one, so patterns are checked from the longest
+        patterns = list(reversed(sorted(self.patterns, key=lambda x: len(x.name))))
+        self._name_matchers = [(compile_str_expression(pattern.name), pattern) for pattern in patterns]
+
+    def select(self):
+        if self._enabled_policies is None or not self.is_valid():
+            self._enabled_policies = self._select()
+        return list(self._enabled_policies)
+
+    def is_valid(self):
+        try:
+            for dir_path, mtime_ns in self._dir_mtimes.items():
+                if os.stat(dir_path).st_mtime_ns != mtime_ns:
+                    return False
+            for policy_path, metadata in self._tag_metadata.items():
+                if get_policy_metadata(policy_path) is not metadata:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def _select(self):
+        found_files_1, found_files_2 = self.find_policy_files()
+        patterns_per_source = {}
+        self._tag_metadata = {}
+        enabled_policies = []
+        for policy_filepath in found_files_1 + found_files_2:
+            if policy_filepath in enabled_policies:
+                continue
+            relative = os.path.relpath(policy_filepath, self.root_dir)
+            policy_source_name = relative.split("/")[0]
+            if policy_source_name not in patterns_per_source:
+                patterns_per_source[policy_source_name] = [pattern for match_name, pattern in self._name_matchers if match_name(policy_source_name)]
+            enabled = None
+            for pattern in patterns_per_source[policy_source_name]:
+                enabled = self.check_enabled(pattern=pattern, filepath=policy_filepath)
+                # if enabled is None, it means this pattern is not related to the policy
+                if enabled is not None:
+                    break
+            if enabled:
+                enabled_policies.append(policy_filepath)
+        return enabled_policies
+
+    def check_enabled(self, pattern: PolicyPattern, filepath: str):
+        # same as `PolicyPattern.check_enabled()` for a pattern whose name matches the policy source name
+        if pattern.tags:
+            pattern_tags = set([pattern.tags] if isinstance(pattern.tags, str) else pattern.tags)
+            metadata = get_policy_metadata(filepath)
+            self._tag_metadata[filepath] = metadata
+            if not metadata.tags or not pattern_tags.intersection(metadata.tags):
+                return None
+        return pattern.enabled
+
+    def find_policy_files(self):
+        # a single walk which finds the same files as the glob patterns `**/policies/*.rego` and `**/extensions/policy/*/*.rego`
+        found_files_1 = []
+        found_files_2 = []
+        self._dir_mtimes = {}
+        for dir_path, dir_names, file_names in os.walk(self.root_dir, followlinks=True):
+            self._dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+            # glob does not match hidden files and directories
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+            rego_files = [os.path.join(dir_path, f) for f in file_names if f.endswith(".rego") and not f.startswith(".")]
+            if not rego_files:
+                continue
+            relative = os.path.relpath(dir_path, self.root_dir)
+            parts = [] if relative == "." else relative.split(os.sep)
+            if parts[-1:] == ["policies"]:
+                found_files_1.extend(rego_files)
+            if len(parts) >= 3 and parts[-3:-1] == ["extensions", "policy"]:
+                found_files_2.extend(rego_files)
+        return found_files_1, found_files_2
+
+
 @dataclass
 class Source(object):
     name: str = ""
@@ -173,6 +295,23 @@ class Source(object):
 
         return policybook_dir
 
+    def update(self, changed_paths: List[str], install_root_dir: str = ""):
+        # installs the policies again if any of the paths is in this source, and returns True in that case.
+        # a source is small, and installing all of it places the rego files into the same `pre_run`/`post_run`
+        # directories as `install()` and removes the ones of renamed or deleted policybooks
+        if self.type != "path":
+            return False
+        source_dir = os.path.abspath(self.source)
+        paths = [path for path in changed_paths if path == source_dir or path.startswith(source_dir + "/")]
+        if not paths:
+            return False
+
+        target_dir = os.path.join(install_root_dir, self.name)
+        logger.debug(f"Installing the policies `{self.name}` again for the changed files {paths}")
+        shutil.rmtree(target_dir, ignore_errors=True)
+        self.install(install_root_dir=install_root_dir, force=True)
+        return True
+
 
 @dataclass
 class PolicyConfig(object):
@@ -299,34 +438,52 @@ class CodeBlock(object):
 
 @dataclass
 class LineIdentifier(object):
-    def find_block(self, body: str, obj: Union[Task, Play]) -> CodeBlock:
+    def find_block(self, body: str, obj: Union[Task, Play], index: YamlPositionIndex = None) -> CodeBlock:
         if not body:
             return None
 
         if not isinstance(obj, (Task, Play)):
             raise TypeError(f"find a code block for {type(obj)} object is not supported")
 
+        lines = None
         if isinstance(obj, Task):
             task = obj
-            _, lines = find_task_line_number(
-                yaml_body=body,
-                task_name=task.name,
-                module_name=task.module,
-                module_options=task.module_options,
-                task_options=task.options,
-            )
-            if lines and len(lines) == 2:
-                return CodeBlock(begin=lines[0], end=lines[1])
+            # the position given by the scanner is used if any
+            if task.line_num_in_file and len(task.line_num_in_file) == 2:
+                lines = task.line_num_in_file
+            if not lines and index:
+                lines = index.find_task(
+                    task_name=task.name,
+                    module_name=task.module,
+                    module_options=task.module_options,
+                    task_options=task.options,
+                )
+            if not lines:
+                _, lines = find_task_line_number(
+                    yaml_body=body,
+                    task_name=task.name,
+                    module_name=task.module,
+                    module_options=task.module_options,
+                    task_options=task.options,
+                )
 
         elif isinstance(obj, Play):
             play = obj
-            _, lines = find_play_line_number(
-                yaml_body=body,
-                play_name=play.name,
-                play_options=play.options,
-            )
-            if lines and len(lines) == 2:
-                return CodeBlock(begin=lines[0], end=lines[1])
+            if index:
+                lines = index.find_play(
+                    play_name=play.name,
+                    play_options=play.options,
+                    play_index=play.index,
+                )
+            if not lines:
+                _, lines = find_play_line_number(
+                    yaml_body=body,
+                    play_name=play.name,
+                    play_options=play.options,
+                )
+
+        if lines and len(lines) == 2:
+            return CodeBlock(begin=lines[0], end=lines[1])
 
         return None
 
@@ -427,13 +584,23 @@ class PolicyResult(object):
     target_type: str = None
     violation: bool = False
     targets: List[TargetResult] = field(default_factory=list)
+    # the number of targets which passed, which were not evaluated, and which are not the target type of the policy
+    passed: int = 0
+    skipped: int = 0
+    not_applicable: int = 0
 
-    def add_target_result(self, obj: any, lines: dict, validated: bool, message: str, action_type: str):
-        target_name = getattr(obj, "name", None)
-        target = TargetResult(name=target_name, lines=lines, validated=validated, message=message, action_type=action_type)
+    def add_target_result(self, obj: any, lines: dict, validated: bool, message: str, action_type: str, retention: str = RESULT_RETENTION_ALL):
         if isinstance(validated, bool) and not validated:
             if action_type == "deny" or action_type == "allow":
                 self.violation = True
+        elif action_type is None:
+            self.skipped += 1
+        else:
+            self.passed += 1
+        if retention == RESULT_RETENTION_VIOLATIONS and validated is not False:
+            return
+        target_name = getattr(obj, "name", None)
+        target = TargetResult(name=target_name, lines=lines, validated=validated, message=message, action_type=action_type)
         self.targets.append(target)
 
 
@@ -444,6 +611,10 @@ class FileResult(object):
     policies: List[PolicyResult] = field(default_factory=list)
     metadata: dict = field(default_factory=dict)
 
+    def __post_init__(self):
+        # the index is not a field, so it is not serialized or compared
+        self._policy_index = {}
+
     def add_policy_result(
         self,
         eval_result: dict,
@@ -452,9 +623,9 @@ class FileResult(object):
         target_type: str,
         obj: any,
         lines: dict,
+        retention: str = RESULT_RETENTION_ALL,
     ):
         policy_result = self.get_policy_result(policy_name=policy_name)
-        need_append = False
         validated = ValidationType.from_eval_result(eval_result=eval_result, is_target_type=is_target_type)
         action_type = ActionType.from_eval_result(eval_result=eval_result, is_target_type=is_target_type)
         message = eval_result.get("message")
@@ -463,21 +634,25 @@ class FileResult(object):
                 policy_name=policy_name,
                 target_type=target_type,
             )
-            need_append = True
-        if is_target_type:
-            policy_result.add_target_result(obj=obj, lines=lines, validated=validated, message=message, action_type=action_type)
-        if need_append:
             self.policies.append(policy_result)
+            self._policy_index[policy_name] = policy_result
+        if is_target_type:
+            policy_result.add_target_result(obj=obj, lines=lines, validated=validated, message=message, action_type=action_type, retention=retention)
+        else:
+            policy_result.not_applicable += 1
 
-        if any([p.violation for p in self.policies]):
+        # only this policy result can be changed by the addition
+        if policy_result.violation:
             self.violation = True
         return
 
     def get_policy_result(self, policy_name: str):
-        for p in self.policies:
-            if p.policy_name == policy_name:
-                return p
-        return None
+        if len(self._policy_index) != len(self.policies):
+            # the policies were set without add_policy_result()
+            self._policy_index = {}
+            for p in self.policies:
+                self._policy_index.setdefault(p.policy_name, p)
+        return self._policy_index.get(policy_name)
 
 
 @dataclass
@@ -488,32 +663,31 @@ class EvaluationSummary(object):
     @staticmethod
     def from_files(files: List[FileResult]):
         total_files = len(files)
-        file_names = []
+        # dicts are used as ordered sets
+        file_names = {}
         violation_files = 0
-        policy_names = []
-        violation_policy_names = []
+        policy_names = {}
+        violation_policy_names = set()
         for f in files:
             for p in f.policies:
-                if p.policy_name not in policy_names:
-                    policy_names.append(p.policy_name)
-                if p.violation and p.policy_name not in violation_policy_names:
-                    violation_policy_names.append(p.policy_name)
+                policy_names[p.policy_name] = True
+                if p.violation:
+                    violation_policy_names.add(p.policy_name)
             if f.violation:
                 violation_files += 1
-            if f.path not in file_names:
-                file_names.append(f.path)
+            file_names[f.path] = True
         total_policies = len(policy_names)
         violation_policies = len(violation_policy_names)
         policies_data = {
             "total": total_policies,
             "violation_detected": violation_policies,
-            "list": policy_names,
+            "list": list(policy_names),
         }
         files_data = {
             "total": total_files,
             "validated": total_files - violation_files,
             "not_validated": violation_files,
-            "list": file_names,
+            "list": list(file_names),
         }
         return EvaluationSummary(
             policies=policies_data,
@@ -523,8 +697,19 @@ class EvaluationSummary(object):
 
 @dataclass
 class EvaluationResult(object):
+    # `summary` is cleared when a result is added, and computed again by `get_summary()`
     summary: EvaluationSummary = None
     files: List[FileResult] = field(default_factory=list)
+    retention: str = RESULT_RETENTION_ALL
+
+    def __post_init__(self):
+        # the index is not a field, so it is not serialized or compared
+        self._file_index = {}
+
+    def get_summary(self):
+        if self.summary is None and self.files:
+            self.summary = EvaluationSummary.from_files(self.files)
+        return self.summary
 
     def add_single_result(
         self,
@@ -538,13 +723,13 @@ class EvaluationResult(object):
         metadata: dict = {},
     ):
         file_result = self.get_file_result(filepath=filepath)
-        need_append = False
         if not file_result:
             file_result = FileResult(
                 path=filepath,
                 metadata=metadata,
             )
-            need_append = True
+            self.files.append(file_result)
+            self._file_index[filepath] = file_result
 
         file_result.add_policy_result(
             eval_result=eval_result,
@@ -553,18 +738,217 @@ class EvaluationResult(object):
             target_type=target_type,
             obj=obj,
             lines=lines,
+            retention=self.retention,
         )
-        if need_append:
-            self.files.append(file_result)
-
-        self.summary = EvaluationSummary.from_files(self.files)
+        self.summary = None
         return
 
     def get_file_result(self, filepath: str):
-        for f in self.files:
-            if f.path == filepath:
-                return f
-        return None
+        if len(self._file_index) != len(self.files):
+            # the files were set without add_single_result()
+            self._file_index = {}
+            for f in self.files:
+                self._file_index.setdefault(f.path, f)
+        return self._file_index.get(filepath)
+
+
+# the counters of the targets not kept in the result; they are serialized only with the `violations` retention
+_retention_fields = ["passed", "skipped", "not_applicable"]
+
+
+def encode_evaluation_result(result: EvaluationResult):
+    data = public_fields(result)
+    data["summary"] = result.get_summary()
+    if result.retention == RESULT_RETENTION_ALL:
+        # the same document as before the retention was introduced
+        data.pop("retention")
+        files = []
+        for file_result in result.files:
+            file_data = public_fields(file_result)
+            file_data["policies"] = [
+                {k: v for k, v in vars(policy_result).items() if k not in _retention_fields} for policy_result in file_result.policies
+            ]
+            files.append(file_data)
+        data["files"] = files
+    return data
+
+
+for _cls in [TargetResult, PolicyResult, EvaluationSummary]:
+    register_encoder(_cls)
+# the private indexes are not serialized
+register_encoder(FileResult, public_fields)
+register_encoder(EvaluationResult, encode_evaluation_result)
+
+
+@dataclass
+class Finding(object):
+    filepath: str = None
+    policy_name: str = None
+    target_type: str = None
+    name: str = None
+    lines: dict = None
+    action_type: str = ""
+    message: str = None
+
+    @staticmethod
+    def from_result(result: EvaluationResult):
+        findings = []
+        for f in result.files:
+            for p in f.policies:
+                for t in p.targets:
+                    if isinstance(t.validated, bool) and not t.validated:
+                        findings.append(
+                            Finding(
+                                filepath=f.path,
+                                policy_name=p.policy_name,
+                                target_type=p.target_type,
+                                name=t.name,
+                                lines=t.lines,
+                                action_type=t.action_type,
+                                message=t.message,
+                            )
+                        )
+        return findings
+
+    @property
+    def key(self):
+        # line numbers are not a part of the key because they change when some lines are added above the target
+        return (self.filepath, self.policy_name, self.target_type, self.name, self.action_type, self.message)
+
+
+# ResultDelta is the difference of the findings between 2 evaluations of the same project
+@dataclass
+class ResultDelta(object):
+    added: List[Finding] = field(default_factory=list)
+    resolved: List[Finding] = field(default_factory=list)
+    summary: EvaluationSummary = None
+    # the number of decisions evaluated and reused from the decision cache, and the seconds taken
+    evaluated: int = 0
+    reused: int = 0
+    elapsed: float = 0.0
+
+    @staticmethod
+    def from_results(previous: EvaluationResult, current: EvaluationResult):
+        previous_findings = {}
+        for finding in Finding.from_result(previous) if previous else []:
+            previous_findings.setdefault(finding.key, []).append(finding)
+        delta = ResultDelta(summary=current.get_summary())
+        for finding in Finding.from_result(current):
+            # targets with the same key are matched one by one
+            same_findings = previous_findings.get(finding.key)
+            if same_findings:
+                same_findings.pop(0)
+            else:
+                delta.added.append(finding)
+        for same_findings in previous_findings.values():
+            delta.resolved.extend(same_findings)
+        return delta
+
+    @property
+    def changed(self):
+        return bool(self.added or self.resolved)
+
+
+for _cls in [Finding, ResultDelta]:
+    register_encoder(_cls)
+
+
+# IncrementalState keeps the decisions of the previous run for each input, so that the next run of the same project
+# evaluates only the inputs in the changed files and the changed policies, and reuses the others as they are.
+# the inputs are identified by their type, their file and their order in the file
+@dataclass
+class IncrementalState(object):
+    # (input type, filepath, index in the file) -> {policy path: (is target type, decision)}
+    decisions: dict = field(default_factory=dict)
+    policy_hashes: dict = field(default_factory=dict)
+    external_data_hash: str = ""
+    input_files: set = field(default_factory=set)
+    # position indexes of the files read in the previous run
+    position_indexes: dict = field(default_factory=dict)
+    # absolute paths changed since the previous run; None means that anything may be changed
+    changed_files: set = None
+    # files under these directories (e.g. policybooks in the project) do not affect the inputs unless they have inputs
+    policy_dirs: List[str] = field(default_factory=list)
+    # the number of decisions evaluated and reused in the last run
+    evaluated: int = 0
+    reused: int = 0
+
+    _reusable: bool = False
+    _changed_project_files: set = field(default_factory=set)
+    _reusable_policies: set = field(default_factory=set)
+    # the state of the current run, which replaces the previous one only when the run succeeds
+    _decisions: dict = field(default_factory=dict)
+    _input_files: set = field(default_factory=set)
+    _policy_hashes: dict = field(default_factory=dict)
+    _external_data_hash: str = ""
+
+    def add_changes(self, paths: List[str]):
+        # changes are accumulated until a run succeeds
+        if self.changed_files is not None:
+            self.changed_files.update(paths)
+        return
+
+    def invalidate(self):
+        self.changed_files = None
+        return
+
+    def begin(self, policy_metadata: dict, external_data_hash: str, project_dir: str, input_files: set):
+        project_dir = os.path.abspath(project_dir) if project_dir else ""
+        changed_files = self.changed_files or set()
+        changed_project_files = {path for path in changed_files if project_dir and (path == project_dir or path.startswith(project_dir + "/"))}
+        reusable = self.changed_files is not None and external_data_hash == self.external_data_hash
+        # a file without inputs (e.g. vars files or templates) may affect the inputs of any file
+        files_without_inputs = changed_project_files - input_files - self.input_files
+        if any(not any(path == d or path.startswith(d + "/") for d in self.policy_dirs) for path in files_without_inputs):
+            reusable = False
+        self._reusable = reusable
+        self._changed_project_files = changed_project_files
+        self._reusable_policies = set()
+        if reusable:
+            for policy_path, metadata in policy_metadata.items():
+                if self.policy_hashes.get(policy_path) != metadata.content_hash:
+                    continue
+                # a policy which reads `_agk` depends on the whole project
+                if metadata.uses_project_data and changed_project_files:
+                    continue
+                self._reusable_policies.add(policy_path)
+        self._policy_hashes = {policy_path: metadata.content_hash for policy_path, metadata in policy_metadata.items()}
+        self._external_data_hash = external_data_hash
+        self._input_files = input_files
+        self._decisions = {}
+        self.evaluated = 0
+        self.reused = 0
+        return
+
+    def get_position_indexes(self):
+        if not self._reusable:
+            return {}
+        return {filepath: index for filepath, index in self.position_indexes.items() if filepath not in self._changed_project_files}
+
+    def lookup(self, key: tuple):
+        # returns the decisions of the previous run which are still valid for the input
+        if not self._reusable or key[1] in self._changed_project_files:
+            return {}
+        previous = self.decisions.get(key)
+        if not previous:
+            return {}
+        reused = {policy_path: decision for policy_path, decision in previous.items() if policy_path in self._reusable_policies}
+        self.reused += len(reused)
+        return reused
+
+    def store(self, key: tuple, decisions: dict):
+        self._decisions[key] = decisions
+        return
+
+    def end(self, position_indexes: dict):
+        self.decisions = self._decisions
+        self.input_files = self._input_files
+        self.policy_hashes = self._policy_hashes
+        self.external_data_hash = self._external_data_hash
+        self.position_indexes = position_indexes
+        self.changed_files = set()
+        self._decisions = {}
+        return
 
 
 @dataclass
@@ -573,11 +957,63 @@ class PolicyEvaluator(object):
     policy_dir: str = ""
     root_dir: str = ""
     need_cleanup: bool = False
+    # `subprocess` runs `opa eval` for each evaluation, `server` keeps a running OPA server,
+    # `wasm` evaluates a compiled WASM module in-process, `native` evaluates policybooks in Python
+    engine_type: str = EngineTypeSubprocess
+    # if enabled, all inputs of the same type are evaluated together for each policy
+    batch_mode: bool = False
+    batch_size: int = default_batch_size
+    # if enabled, all applicable policies are evaluated together for each input
+    multi_package: bool = False
+    # if enabled, the enabled policies are compiled into a bundle by `opa build` and cached on disk
+    use_bundle: bool = False
+    bundle_cache_dir: str = default_bundle_cache_dir
+    bundle_optimize_level: int = default_optimize_level
+    # if enabled with the `native` engine, every native decision is checked against the Rego evaluation
+    verify_native: bool = False
+    # if more than 1, the evaluations are distributed over a pool of this number of processes
+    workers: int = 1
+    # the maximum number of evaluations in flight at once in `run_async()`
+    concurrency: int = 1
+    # if more than 0, decisions are memoized in an LRU cache of this size; `ttl` is in seconds and 0 means no expiration
+    decision_cache_size: int = 0
+    decision_cache_ttl: float = 0
+    decision_cache: DecisionCache = None
+    # if set, decisions are also stored in a SQLite file under this directory and reused across runs
+    persistent_cache_dir: str = ""
+    persistent_cache: PersistentDecisionCache = None
+    # the inputs made by scanning a project are also cached under `persistent_cache_dir`
+    scan_cache: ScanCache = None
+
+    engine: any = None
+    engine_kwargs: dict = field(default_factory=dict)
+    executor: ProcessPoolExecutor = None
+    # metadata of the enabled policies, which is taken at the beginning of each run
+    policy_metadata: dict = field(default_factory=dict)
+    routing_table: PolicyRoutingTable = None
+    policy_selector: PolicySelector = None
+    # if True, each input has only the part of `_agk` which the policies to be evaluated refer to
+    input_projection: bool = True
+    # attributes of `_agk` used by each policy; None means the policy needs the full input
+    input_refs: dict = field(default_factory=dict)
+    # encoder of the inputs in the current run, which encodes the shared project data only once
+    input_encoder: PolicyInputEncoder = None
+    # line positions of the plays and the tasks in each file read in the current run
+    position_indexes: dict = field(default_factory=dict)
+    # `violations` bounds the result size by the number of findings on large projects
+    result_retention: str = RESULT_RETENTION_ALL
+    # if set, the decisions of the previous run of the same project are reused for the unchanged inputs and policies
+    incremental_state: IncrementalState = None
 
     patterns: List[PolicyPattern] = field(default_factory=list)
     sources: List[Source] = field(default_factory=list)
 
     def __post_init__(self):
+        if self.result_retention not in supported_result_retentions:
+            raise ValueError(f"The result retention `{self.result_retention}` is not supported; it must be one of {supported_result_retentions}")
+        if self.workers < 1 or self.concurrency < 1:
+            raise ValueError(f"`workers` and `concurrency` must be 1 or more, but they are {self.workers} and {self.concurrency}")
+
         validate_opa_installation()
 
         if self.config_path:
@@ -605,9 +1041,42 @@ class PolicyEvaluator(object):
                 )
                 if installed_path:
                     installed_path_list.append(installed_path)
+
+        if self.engine_type == EngineTypeWasm:
+            # WASM modules are cached in the same directory as bundles
+            self.engine_kwargs = {"cache_dir": self.bundle_cache_dir, "optimize_level": self.bundle_optimize_level}
+        elif self.engine_type == EngineTypeNative:
+            self.engine_kwargs = {"verify": self.verify_native}
+        self.engine = create_engine(engine_type=self.engine_type, **self.engine_kwargs)
+        if self.decision_cache_size > 0 and not self.decision_cache:
+            self.decision_cache = DecisionCache(maxsize=self.decision_cache_size, ttl=self.decision_cache_ttl)
+        if self.persistent_cache_dir and not self.persistent_cache:
+            self.persistent_cache = PersistentDecisionCache(cache_dir=self.persistent_cache_dir)
+        if self.persistent_cache_dir and not self.scan_cache:
+            self.scan_cache = ScanCache(cache_dir=self.persistent_cache_dir)
         return
 
     def __del__(self):
+        if self.engine:
+            try:
+                self.engine.close()
+            except Exception:
+                pass
+        if self.executor:
+            try:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                pass
+        if self.persistent_cache:
+            try:
+                self.persistent_cache.close()
+            except Exception:
+                pass
+        if self.scan_cache:
+            try:
+                self.scan_cache.close()
+            except Exception:
+                pass
         if self.need_cleanup and self.root_dir and os.path.exists(self.root_dir):
             try:
                 os.remove(self.root_dir)
@@ -615,32 +1084,12 @@ class PolicyEvaluator(object):
                 pass
 
     def list_enabled_policies(self):
-        policy_dir = self.root_dir
-        rego_policy_pattern_1 = os.path.join(policy_dir, "**", "policies/*.rego")
-        found_files_1 = glob.glob(pathname=rego_policy_pattern_1, recursive=True)
-        rego_policy_pattern_2 = os.path.join(policy_dir, "**", "extensions/policy/*/*.rego")
-        found_files_2 = glob.glob(pathname=rego_policy_pattern_2, recursive=True)
-        found_files = []
-        if found_files_1:
-            found_files.extend(found_files_1)
-        if found_files_2:
-            found_files.extend(found_files_2)
-        # sort patterns by their name because a longer pattern is prioritized than a shorter one
-        patterns = sorted(self.patterns, key=lambda x: len(x.name))
-
-        policies_and_enabled = {}
-        for policy_filepath in found_files:
-            for pattern in patterns:
-                enabled = pattern.check_enabled(filepath=policy_filepath, policy_root_dir=self.root_dir)
-                # if enabled is None, it means this pattern is not related to the policy
-                if enabled is None:
-                    continue
-                policies_and_enabled[policy_filepath] = enabled
-        enabled_policies = []
-        for path, enabled in policies_and_enabled.items():
-            if enabled:
-                enabled_policies.append(path)
-        return enabled_policies
+        # the selection is reused across runs until the install root or the patterns are changed
+        selector = self.policy_selector
+        if selector is None or selector.root_dir != self.root_dir or selector.patterns != self.patterns:
+            selector = PolicySelector(root_dir=self.root_dir, patterns=list(self.patterns))
+            self.policy_selector = selector
+        return selector.select()
 
     def run(
         self,
@@ -652,12 +1101,185 @@ class PolicyEvaluator(object):
         rest_request: APIRequest = None,
         external_data_path: str = "",
         variables_path: str = "",
+    ):
+        coro = self.run_async(
+            eval_type=eval_type,
+            project_dir=project_dir,
+            target_data=target_data,
+            task_result=task_result,
+            event=event,
+            rest_request=rest_request,
+            external_data_path=external_data_path,
+            variables_path=variables_path,
+        )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # `asyncio.run()` cannot be called from a running event loop, so run it on another thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+    async def run_async(
+        self,
+        eval_type: str = "project",
+        project_dir: str = "",
+        target_data: dict = None,
+        task_result: TaskResult = None,
+        event: Event = None,
+        rest_request: APIRequest = None,
+        external_data_path: str = "",
+        variables_path: str = "",
     ):
         policy_files = self.list_enabled_policies()
         logger.debug(f"policy_files: {policy_files}")
         if not policy_files:
             logger.warning("No policies are loaded!")
+        self.policy_metadata = {policy_path: get_policy_metadata(policy_path) for policy_path in policy_files}
+        metadata_list = list(self.policy_metadata.values())
+        if self.routing_table is None or self.routing_table.metadata_list != metadata_list:
+            self.routing_table = PolicyRoutingTable.build(metadata_list)
+        self.input_refs = self.make_input_refs(metadata_list)
+
+        # inputs are prepared with the original external data, and OPA reads it as a JSON data file
+        opa_data_path = external_data_path
+        if is_knowledge_base_file(external_data_path):
+            opa_data_path = await asyncio.to_thread(export_opa_data, kb_path=external_data_path, cache_dir=self.bundle_cache_dir)
+
+        bundle = None
+        if self.use_bundle and policy_files:
+            bundle = await asyncio.to_thread(
+                get_or_build_bundle,
+                policy_files=policy_files,
+                external_data_path=opa_data_path,
+                cache_dir=self.bundle_cache_dir,
+                optimize_level=self.bundle_optimize_level,
+            )
+
+        # loading inputs may scan a whole project, so it is done outside of the event loop
+        input_data_dict = await asyncio.to_thread(
+            self.load_input_data,
+            eval_type=eval_type,
+            project_dir=project_dir,
+            target_data=target_data,
+            task_result=task_result,
+            event=event,
+            rest_request=rest_request,
+            external_data_path=external_data_path,
+            variables_path=variables_path,
+        )
+
+        if not bundle:
+            opa_data_path = await asyncio.to_thread(
+                self.reduce_opa_data,
+                policy_files=policy_files,
+                opa_data_path=opa_data_path,
+                external_data_path=external_data_path,
+                input_data_dict=input_data_dict,
+            )
+        load_kwargs = {"policy_files": policy_files, "external_data_path": opa_data_path, "bundle": bundle}
+        if self.workers <= 1:
+            # with workers, each worker process loads the policies to its own engine instead
+            await asyncio.to_thread(self.engine.load, **load_kwargs)
+
+        self.input_encoder = PolicyInputEncoder()
+        project_hash = ""
+        if self.persistent_cache and eval_type == EvalTypeProject and project_dir:
+            project_hash = await asyncio.to_thread(compute_project_hash, project_dir=project_dir, extra_files=[variables_path])
+
+        self.position_indexes = {}
+        state = self.incremental_state if eval_type == EvalTypeProject else None
+        if state:
+            input_files = set()
+            for input_data_per_type in input_data_dict.values():
+                for single_input_data in input_data_per_type:
+                    input_files.add(os.path.abspath(self.get_target_filepath(input_data=single_input_data, project_dir=project_dir)))
+            state.begin(
+                policy_metadata=self.policy_metadata,
+                external_data_hash=get_file_hash(external_data_path) if external_data_path else "",
+                project_dir=project_dir,
+                input_files=input_files,
+            )
+            # the unchanged files are not read again
+            self.position_indexes = state.get_position_indexes()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        result = EvaluationResult(retention=self.result_retention)
+        for input_type in input_data_dict:
+            input_data_per_type = input_data_dict[input_type]
+            data_num = len(input_data_per_type)
+            logger.debug(f"len(input_data_per_type): {data_num}")
+            locations = []
+            for single_input_data in input_data_per_type:
+                location = self.get_target_location(
+                    eval_type=eval_type,
+                    input_type=input_type,
+                    input_data=single_input_data,
+                    project_dir=project_dir,
+                )
+                locations.append(location)
+
+            reused = None
+            state_keys = []
+            if state:
+                counts = {}
+                for _, filepath, _, _ in locations:
+                    filepath = os.path.abspath(filepath)
+                    counts[filepath] = counts.get(filepath, 0) + 1
+                    state_keys.append((input_type, filepath, counts[filepath]))
+                reused = [state.lookup(key) for key in state_keys]
+
+            results_per_type = await self.eval_input_type_async(
+                rego_paths=policy_files,
+                input_type=input_type,
+                input_data_list=input_data_per_type,
+                load_kwargs=load_kwargs,
+                semaphore=semaphore,
+                project_hash=project_hash,
+                cache_data_path=external_data_path,
+                reused=reused,
+            )
+
+            for i, single_input_data in enumerate(input_data_per_type):
+                if state:
+                    state.store(state_keys[i], results_per_type[i])
+                obj, filepath, lines, metadata = locations[i]
+                for policy_path in policy_files:
+                    policy_metadata = self.get_policy_metadata(policy_path)
+                    policy_name = policy_metadata.package
+                    target_type = policy_metadata.target
+                    is_target_type, eval_result = results_per_type[i][policy_path]
+                    result.add_single_result(
+                        eval_result=eval_result,
+                        is_target_type=is_target_type,
+                        policy_name=policy_name,
+                        target_type=target_type,
+                        obj=obj,
+                        filepath=filepath,
+                        lines=lines,
+                        metadata=metadata,
+                    )
+
+        if self.persistent_cache:
+            self.persistent_cache.flush()
+        if state:
+            state.end(position_indexes=self.position_indexes)
+        result.get_summary()
+        # the cached fragments refer to the inputs of this run
+        self.input_encoder = None
+        self.position_indexes = {}
+        return result
 
+    def load_input_data(
+        self,
+        eval_type: str = "project",
+        project_dir: str = "",
+        target_data: dict = None,
+        task_result: TaskResult = None,
+        event: Event = None,
+        rest_request: APIRequest = None,
+        external_data_path: str = "",
+        variables_path: str = "",
+    ):
         variables = None
         if variables_path:
             variables = self.load_variables(variables_path=variables_path)
@@ -665,7 +1287,7 @@ class PolicyEvaluator(object):
         if eval_type == EvalTypeJobdata:
             input_data_dict, _ = load_input_from_jobdata(jobdata=target_data)
         elif eval_type == EvalTypeProject:
-            input_data_dict = load_input_from_project_dir(project_dir=project_dir, variables=variables)
+            input_data_dict = load_input_from_project_dir(project_dir=project_dir, variables=variables, scan_cache=self.scan_cache)
         elif eval_type == EvalTypeTaskResult:
             input_data_dict = load_input_from_task_result(task_result=task_result)
         elif eval_type == EvalTypeEvent:
@@ -681,11 +1303,6 @@ class PolicyEvaluator(object):
         else:
             raise ValueError(f"eval_type `{eval_type}` is not supported")
 
-        target_modules = []
-        for policy_path in policy_files:
-            target_module = detect_target_module_pattern(policy_path=policy_path)
-            target_modules.append(target_module)
-
         if "task" in input_data_dict:
             # embed `task.module_fqcn` to input_data by using external_data
             input_data_all_tasks = []
@@ -694,85 +1311,393 @@ class PolicyEvaluator(object):
                 input_data_all_tasks.append(input_data_for_task)
             if input_data_all_tasks:
                 input_data_dict["task"] = input_data_all_tasks
+        return input_data_dict
+
+    def reduce_opa_data(self, policy_files: List[str], opa_data_path: str, external_data_path: str, input_data_dict: dict):
+        # `opa eval` parses the external data at every call, so it is given only the part used by the enabled policies.
+        # the `server` and `wasm` engines load the whole data only once, so they are not affected
+        if not opa_data_path or self.engine_type not in [EngineTypeSubprocess, EngineTypeNative]:
+            return opa_data_path
+
+        data_refs = set()
+        # `data.<package>` refers to a policy, not to the external data
+        policy_refs = {"ansible_policy"}
+        uses_module_fqcn = False
+        for policy_path in policy_files:
+            policy_metadata = self.get_policy_metadata(policy_path)
+            if policy_metadata.data_refs is None:
+                # the references of the policy are unknown, so it may read any part of the data
+                return opa_data_path
+            data_refs.update(policy_metadata.data_refs)
+            policy_refs.add(policy_metadata.package.split(".")[0])
+            uses_module_fqcn = uses_module_fqcn or policy_metadata.uses_module_fqcn
+        data_refs -= policy_refs
+        if data_refs:
+            return opa_data_path
+        if not uses_module_fqcn:
+            logger.debug("the external data is not passed to OPA because no enabled policy refers to it")
+            return ""
 
-        result = EvaluationResult()
-        for input_type in input_data_dict:
-            input_data_per_type = input_data_dict[input_type]
-            data_num = len(input_data_per_type)
-            logger.debug(f"len(input_data_per_type): {data_num}")
-            for single_input_data in input_data_per_type:
-                obj = single_input_data.object
-                filepath = "__no_filepath__"
-                if hasattr(obj, "filepath"):
-                    filepath = getattr(obj, "filepath")
-                    if filepath == "__in_memory__":
-                        filepath = project_dir
-                    elif project_dir:
-                        filepath = os.path.join(project_dir, filepath)
-
-                lines = None
-                body = ""
-                metadata = {}
-                if eval_type == EvalTypeEvent:
-                    lines = {
-                        "begin": obj.line,
-                        "end": None,
-                    }
-                    filepath = obj.uuid
-                    metadata = obj.__dict__
-                elif eval_type == EvalTypeRest:
-                    pass
-                else:
-                    with open(filepath, "r") as f:
-                        body = f.read()
-                    if input_type in ["task", "play"]:
-                        _identifier = LineIdentifier()
-                        block = _identifier.find_block(body=body, obj=obj)
-                        lines = block.to_dict()
-
-                for policy_path in policy_files:
-                    policy_name = get_rego_main_package_name(rego_path=policy_path)
-                    target_type = detect_target_type_pattern(policy_path=policy_path)
-                    is_target_type, eval_result = self.eval_single_policy(
-                        rego_path=policy_path,
-                        input_type=input_type,
-                        input_data=single_input_data,
-                        external_data_path=external_data_path,
-                    )
-                    result.add_single_result(
-                        eval_result=eval_result,
-                        is_target_type=is_target_type,
-                        policy_name=policy_name,
-                        target_type=target_type,
-                        obj=obj,
-                        filepath=filepath,
-                        lines=lines,
-                        metadata=metadata,
-                    )
-
-        return result
+        input_data_list = [input_data for input_data_per_type in input_data_dict.values() for input_data in input_data_per_type]
+        module_names = collect_task_modules(input_data_list)
+        kb = get_knowledge_base(ftype="galaxy", fpath=external_data_path)
+        return make_reduced_opa_data(kb=kb, module_names=module_names, cache_dir=self.bundle_cache_dir)
+
+    def get_target_filepath(self, input_data: PolicyInput, project_dir: str = ""):
+        obj = input_data.object
+        filepath = "__no_filepath__"
+        if hasattr(obj, "filepath"):
+            filepath = getattr(obj, "filepath")
+            if filepath == "__in_memory__":
+                filepath = project_dir
+            elif project_dir:
+                filepath = os.path.join(project_dir, filepath)
+        return filepath
 
-    def eval_single_policy(self, rego_path: str, input_type: str, input_data: PolicyInput, external_data_path: str) -> tuple[bool, str]:
+    def get_target_location(self, eval_type: str, input_type: str, input_data: PolicyInput, project_dir: str = ""):
+        obj = input_data.object
+        filepath = self.get_target_filepath(input_data=input_data, project_dir=project_dir)
+
+        lines = None
+        metadata = {}
+        if eval_type == EvalTypeEvent:
+            lines = {
+                "begin": obj.line,
+                "end": None,
+            }
+            filepath = obj.uuid
+            metadata = obj.__dict__
+        elif eval_type == EvalTypeRest:
+            pass
+        elif input_type in ["task", "play"]:
+            # each file is read and indexed only once in a run
+            index = self.get_position_index(filepath)
+            _identifier = LineIdentifier()
+            block = _identifier.find_block(body=index.body, obj=obj, index=index)
+            lines = block.to_dict()
+        return obj, filepath, lines, metadata
+
+    def get_position_index(self, filepath: str):
+        if filepath not in self.position_indexes:
+            self.position_indexes[filepath] = YamlPositionIndex.load(filepath)
+        return self.position_indexes[filepath]
+
+    def check_target(self, rego_path: str, input_type: str, input_data: PolicyInput) -> tuple[bool, bool]:
+        # returns whether the input is a target type of the policy, and whether it needs to be evaluated
         target_type = input_type
         if input_type == "task_result":
             target_type = "task"
-        if not match_target_type(target_type=target_type, rego_path=rego_path):
-            return False, {}
+        policy_metadata = self.get_policy_metadata(rego_path)
+        if not match_str_expression(policy_metadata.target, target_type):
+            return False, False
         if input_type == "task":
             task = input_data.task
-            if not match_target_module(task.module_fqcn, rego_path):
-                return True, {}
-        input_data_str = input_data.to_json()
-        result = eval_opa_policy(
+            if not match_str_expression(policy_metadata.target_module, task.module_fqcn):
+                return True, False
+        return True, True
+
+    def get_policy_metadata(self, rego_path: str):
+        if rego_path in self.policy_metadata:
+            return self.policy_metadata[rego_path]
+        return get_policy_metadata(rego_path)
+
+    def eval_single_policy(self, rego_path: str, input_type: str, input_data: PolicyInput, external_data_path: str) -> tuple[bool, str]:
+        is_target_type, need_eval = self.check_target(rego_path=rego_path, input_type=input_type, input_data=input_data)
+        if not need_eval:
+            return is_target_type, {}
+        results = [{rego_path: (True, {})}]
+        pairs, cache_keys = self.lookup_decision_cache(
+            pairs=[(0, self.engine_input(input_data, agk_refs=self.get_input_refs([rego_path])), [rego_path])],
+            input_data_list=[input_data],
+            results=results,
+            external_data_path=external_data_path,
+        )
+        if not pairs:
+            return results[0][rego_path]
+        result = self.engine.eval(
             rego_path=rego_path,
-            input_data=input_data_str,
+            input_data=pairs[0][1],
             external_data_path=external_data_path,
         )
+        if cache_keys:
+            self.store_decision_cache(cache_keys[(0, rego_path)], result)
         return True, result
 
+    async def eval_input_type_async(
+        self,
+        rego_paths: List[str],
+        input_type: str,
+        input_data_list: List[PolicyInput],
+        load_kwargs: dict,
+        semaphore: asyncio.Semaphore,
+        project_hash: str = "",
+        cache_data_path: str = "",
+        reused: List[dict] = None,
+    ) -> List[dict[str, tuple[bool, dict]]]:
+        # each input is serialized only once and only the applicable policies are evaluated for it
+        results, batch_items, batch_indices = self.make_batch_items(rego_paths=rego_paths, input_type=input_type, input_data_list=input_data_list)
+        if reused:
+            # the decisions of the previous run are used as they are, and their inputs are not serialized
+            for results_per_input, reused_per_input in zip(results, reused):
+                results_per_input.update(reused_per_input)
+            remaining_indices = []
+            remaining_items = []
+            for i, (input_data, _rego_paths) in zip(batch_indices, batch_items):
+                _rego_paths = [rego_path for rego_path in _rego_paths if rego_path not in reused[i]]
+                if _rego_paths:
+                    remaining_indices.append(i)
+                    remaining_items.append((input_data, _rego_paths))
+            batch_indices = remaining_indices
+            batch_items = remaining_items
+        pairs = []
+        for i, (input_data, _rego_paths) in zip(batch_indices, batch_items):
+            # inputs are sent to worker processes as JSON strings because all engines accept them
+            agk_refs = self.get_input_refs(_rego_paths)
+            x = self.encode_input(input_data, agk_refs=agk_refs) if self.workers > 1 else self.engine_input(input_data, agk_refs=agk_refs)
+            pairs.append((i, x, _rego_paths))
+
+        external_data_path = load_kwargs.get("external_data_path", "")
+        # decisions are keyed by the original external data even if OPA reads a reduced one
+        pairs, cache_keys = self.lookup_decision_cache(
+            pairs=pairs,
+            input_data_list=input_data_list,
+            results=results,
+            external_data_path=cache_data_path or external_data_path,
+            project_hash=project_hash,
+        )
+
+        if self.workers > 1:
+            evaluated = await asyncio.to_thread(self.eval_parallel, pairs=pairs, load_kwargs=load_kwargs)
+        else:
+            evaluated = await self.eval_pairs_async(pairs=pairs, rego_paths=rego_paths, external_data_path=external_data_path, semaphore=semaphore)
+
+        if self.incremental_state:
+            self.incremental_state.evaluated += sum(len(eval_results_per_input) for _, eval_results_per_input in evaluated)
+        for i, eval_results_per_input in evaluated:
+            for rego_path, eval_result in eval_results_per_input.items():
+                results[i][rego_path] = (True, eval_result)
+                if (i, rego_path) in cache_keys:
+                    self.store_decision_cache(cache_keys[(i, rego_path)], eval_result)
+        return results
+
+    async def eval_pairs_async(self, pairs: list, rego_paths: List[str], external_data_path: str, semaphore: asyncio.Semaphore):
+        # a work unit is a list of (input index, input, policies) and whether it is evaluated by a single batch query
+        units = []
+        if self.batch_mode:
+            batch_size = self.batch_size
+            if batch_size <= 0:
+                batch_size = max(len(pairs), 1)
+            # with multi-package mode, all policies are evaluated together; otherwise one policy per query
+            groups = [pairs]
+            if not self.multi_package:
+                groups = [[(i, x, [rego_path]) for i, x, _rego_paths in pairs if rego_path in _rego_paths] for rego_path in rego_paths]
+            for group_pairs in groups:
+                for begin in range(0, len(group_pairs), batch_size):
+                    units.append((group_pairs[begin : begin + batch_size], True))
+        elif self.multi_package:
+            units = [([pair], True) for pair in pairs]
+        else:
+            units = [([(i, x, [rego_path])], False) for i, x, _rego_paths in pairs for rego_path in _rego_paths]
+
+        unit_results = await asyncio.gather(
+            *[
+                self.eval_unit_async(unit_pairs=unit_pairs, use_batch=use_batch, external_data_path=external_data_path, semaphore=semaphore)
+                for unit_pairs, use_batch in units
+            ]
+        )
+        evaluated = []
+        for (unit_pairs, _), eval_results in zip(units, unit_results):
+            for (i, _, _), eval_results_per_input in zip(unit_pairs, eval_results):
+                evaluated.append((i, eval_results_per_input))
+        return evaluated
+
+    def lookup_decision_cache(self, pairs: list, input_data_list: List[PolicyInput], results: list, external_data_path: str, project_hash: str = ""):
+        # fills cached decisions into `results`, and returns the pairs still to be evaluated with the keys to cache them
+        caches = self.decision_caches()
+        if not caches:
+            return pairs, {}
+
+        external_data_hash = get_file_hash(external_data_path) if external_data_path else ""
+        remaining_pairs = []
+        cache_keys = {}
+        for i, x, _rego_paths in pairs:
+            input_hash = make_input_hash(input_data_list[i])
+            full_input_hash = ""
+            rego_paths_to_eval = []
+            for rego_path in _rego_paths:
+                # a policy which reads `_agk` depends on the whole project as well as the input
+                policy_metadata = self.get_policy_metadata(rego_path)
+                scope_hash = ""
+                if policy_metadata.uses_project_data:
+                    scope_hash = project_hash
+                    if not scope_hash:
+                        if not full_input_hash:
+                            full_input_hash = canonical_json_hash(x if isinstance(x, str) else input_data_list[i].to_json())
+                        scope_hash = full_input_hash
+                key = make_decision_key(
+                    policy_hash=policy_metadata.content_hash,
+                    input_hash=input_hash,
+                    external_data_hash=external_data_hash,
+                    scope_hash=scope_hash,
+                )
+                eval_result = None
+                for j, cache in enumerate(caches):
+                    eval_result = cache.get(key)
+                    if eval_result is not None:
+                        # a decision found in a slower cache is put into the faster ones
+                        for faster_cache in caches[:j]:
+                            faster_cache.put(key, eval_result)
+                        break
+                if eval_result is None:
+                    rego_paths_to_eval.append(rego_path)
+                    cache_keys[(i, rego_path)] = key
+                else:
+                    results[i][rego_path] = (True, eval_result)
+            if rego_paths_to_eval:
+                remaining_pairs.append((i, x, rego_paths_to_eval))
+        return remaining_pairs, cache_keys
+
+    def store_decision_cache(self, key: str, eval_result: dict):
+        for cache in self.decision_caches():
+            cache.put(key, eval_result)
+        return
+
+    def decision_caches(self):
+        # the in-memory cache is looked up first
+        return [cache for cache in [self.decision_cache, self.persistent_cache] if cache]
+
+    async def eval_unit_async(self, unit_pairs: list, use_batch: bool, external_data_path: str, semaphore: asyncio.Semaphore):
+        batch_items = [(input_data, _rego_paths) for _, input_data, _rego_paths in unit_pairs]
+        async with semaphore:
+            if use_batch:
+                if hasattr(self.engine, "eval_batch_async"):
+                    return await self.engine.eval_batch_async(batch_items=batch_items, external_data_path=external_data_path)
+                return await asyncio.to_thread(self.engine.eval_batch, batch_items=batch_items, external_data_path=external_data_path)
+
+            eval_results = []
+            for input_data, _rego_paths in batch_items:
+                eval_results_per_input = {}
+                for rego_path in _rego_paths:
+                    if hasattr(self.engine, "eval_async"):
+                        eval_result = await self.engine.eval_async(rego_path=rego_path, input_data=input_data, external_data_path=external_data_path)
+                    else:
+                        eval_result = await asyncio.to_thread(
+                            self.engine.eval, rego_path=rego_path, input_data=input_data, external_data_path=external_data_path
+                        )
+                    eval_results_per_input[rego_path] = eval_result
+                eval_results.append(eval_results_per_input)
+            return eval_results
+
+    def make_batch_items(self, rego_paths: List[str], input_type: str, input_data_list: List[PolicyInput]):
+        # returns the results with empty evaluations, and the pairs of an input and its policies to be evaluated
+        results = []
+        batch_items = []
+        batch_indices = []
+        routing_table = self.routing_table
+        if routing_table is None or [m.path for m in routing_table.metadata_list] != rego_paths:
+            routing_table = PolicyRoutingTable.build([self.get_policy_metadata(rego_path) for rego_path in rego_paths])
+        for i, input_data in enumerate(input_data_list):
+            # only the policies routed by the target type and the module are checked for each input
+            module_fqcn = input_data.task.module_fqcn if input_type == "task" else None
+            target_paths, rego_paths_to_eval = routing_table.route(input_type=input_type, module_fqcn=module_fqcn)
+            results_per_input = dict.fromkeys(rego_paths, (False, {}))
+            for rego_path in target_paths:
+                results_per_input[rego_path] = (True, {})
+            results.append(results_per_input)
+            if rego_paths_to_eval:
+                batch_items.append((input_data, rego_paths_to_eval))
+                batch_indices.append(i)
+        return results, batch_items, batch_indices
+
+    def eval_parallel(self, pairs: list, load_kwargs: dict):
+        # each work unit is a chunk of inputs with their applicable policies; the results are returned
+        # in the order of the inputs regardless of which worker finishes first
+        if not pairs:
+            return []
+
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        # a few chunks per worker to balance the load
+        chunk_size = max(1, math.ceil(len(pairs) / (self.workers * 4)))
+        if self.batch_mode and self.batch_size > 0:
+            chunk_size = min(chunk_size, self.batch_size)
+        futures = []
+        for begin in range(0, len(pairs), chunk_size):
+            chunk = pairs[begin : begin + chunk_size]
+            future = self.executor.submit(
+                eval_in_worker,
+                engine_type=self.engine_type,
+                engine_kwargs=self.engine_kwargs,
+                load_kwargs=load_kwargs,
+                batch_items=[(x, _rego_paths) for _, x, _rego_paths in chunk],
+                use_batch=self.batch_mode,
+            )
+            futures.append((chunk, future))
+
+        evaluated = []
+        for chunk, future in futures:
+            for (i, _, _), eval_results_per_input in zip(chunk, future.result()):
+                evaluated.append((i, eval_results_per_input))
+        return evaluated
+
+    def engine_input(self, input_data: PolicyInput, agk_refs: list = None):
+        if getattr(self.engine, "accepts_policy_input", False):
+            return input_data
+        return self.encode_input(input_data, agk_refs=agk_refs)
+
+    def encode_input(self, input_data: PolicyInput, agk_refs: list = None):
+        if self.input_encoder:
+            return self.input_encoder.encode(input_data, agk_refs=agk_refs)
+        return input_data.to_json(agk_refs=agk_refs)
+
+    def make_input_refs(self, metadata_list: list):
+        if not self.input_projection:
+            return {}
+        # a policy which refers to another policy (`data.<package>`) may read any part of the input through it
+        policy_refs = {metadata.package.split(".")[0] for metadata in metadata_list} - {"ansible_policy"}
+        input_refs = {}
+        for metadata in metadata_list:
+            # unknown data references may refer to another policy too
+            if metadata.data_refs is None or set(metadata.data_refs) & policy_refs:
+                input_refs[metadata.path] = None
+            else:
+                input_refs[metadata.path] = metadata.input_refs
+        return input_refs
+
+    def get_input_refs(self, rego_paths: List[str]):
+        # attributes of `_agk` used by any of the policies; None means the full input
+        if not self.input_projection:
+            return None
+        refs = set()
+        for rego_path in rego_paths:
+            if rego_path not in self.input_refs:
+                return None
+            _refs = self.input_refs[rego_path]
+            if _refs is None:
+                return None
+            refs.update(_refs)
+        return sorted(refs)
+
     def load_variables(self, variables_path: str):
         return Variables.from_variables_file(path=variables_path)
 
+    def update_policies(self, changed_paths: List[str]):
+        # updates the installed policies for the changed files, and returns True if the policies may be changed.
+        # the enabled policies and their metadata are reloaded by the next run because they are checked by mtime
+        updated = False
+        if self.config_path and os.path.abspath(self.config_path) in changed_paths:
+            cfg = Config.load(filepath=self.config_path)
+            self.patterns = cfg.policy.patterns
+            self.sources = cfg.source.sources
+            for source in self.sources:
+                source.install(install_root_dir=self.root_dir, force=False)
+            updated = True
+        for source in self.sources:
+            if source.update(changed_paths=changed_paths, install_root_dir=self.root_dir):
+                updated = True
+        return updated
+
 
 @dataclass
 class ResultFormatter(object):
@@ -808,13 +1733,14 @@ class ResultFormatter(object):
             return
 
         policy_result = file_result.policies[0]
-        if not policy_result.targets:
+        # with the `violations` retention, a passed target is only counted
+        if not policy_result.targets and not policy_result.passed and not policy_result.skipped:
             return
-        target_result = policy_result.targets[0]
+        target_result = policy_result.targets[0] if policy_result.targets else None
 
         task_path = file_result.metadata.get("task_path", "")
 
-        event_type = target_result.name
+        event_type = target_result.name if target_result else file_result.metadata.get("name")
         _uuid = file_result.path
         short_uuid = _uuid[:4] + "..." + _uuid[-4:]
         file_info = task_path
@@ -845,10 +1771,11 @@ class ResultFormatter(object):
         policy_result = None
         target_result = None
         for p_res in file_result.policies:
-            if p_res.targets:
+            # with the `violations` retention, a passed target is only counted
+            if p_res.targets or p_res.passed or p_res.skipped:
                 policy_result = p_res
-                target_result = p_res.targets[0]
-        if not policy_result or not target_result:
+                target_result = p_res.targets[0] if p_res.targets else None
+        if not policy_result:
             return
 
         policy_name = policy_result.policy_name
@@ -866,14 +1793,34 @@ class ResultFormatter(object):
         print(_line)
 
     def print_json(self, result: EvaluationResult):
-        json_str = jsonpickle.encode(
-            result,
-            unpicklable=False,
-            make_refs=False,
-            separators=(",", ":"),
-        )
+        json_str = dumps(result)
         print(json_str)
 
+    def print_delta(self, delta: ResultDelta):
+        if self.format_type == FORMAT_JSON:
+            print(dumps(delta))
+            return
+
+        for mark, findings, color in [("+", delta.added, "\033[91m"), ("-", delta.resolved, "\033[96m")]:
+            for finding in findings:
+                filepath = finding.filepath
+                if self.base_dir:
+                    filepath = self.shorten_filepath(filepath)
+                lines = CodeBlock.dict2str(finding.lines) if finding.lines else ""
+                _type_up = (finding.target_type or "").upper()
+                line = f"{mark} {_type_up} [{finding.name}] {filepath} {lines} ... {finding.policy_name} {finding.action_type}"
+                if self.isatty:
+                    line = f"{color}{line}\033[00m"
+                print(line)
+                message = (finding.message or "").strip()
+                if mark == "+" and message:
+                    print(f"    {message}")
+        not_valid_files = delta.summary.files.get("not_validated", 0) if delta.summary else 0
+        status = f"{len(delta.added)} new, {len(delta.resolved)} resolved"
+        if not delta.changed:
+            status = "No changes in the findings"
+        print(f"{status} (not validated files: {not_valid_files}, evaluated: {delta.evaluated}, reused: {delta.reused}, {delta.elapsed:.2f}s)")
+
     def print_plain(self, result: EvaluationResult):
         not_validated_targets = []
         for f in result.files:
@@ -950,9 +1897,10 @@ class ResultFormatter(object):
             print("")
         print("-" * self.term_width)
         print("SUMMARY")
-        total_files = result.summary.files.get("total", 0)
-        valid_files = result.summary.files.get("validated", 0)
-        not_valid_files = result.summary.files.get("not_validated", 0)
+        summary = result.get_summary()
+        total_files = summary.files.get("total", 0)
+        valid_files = summary.files.get("validated", 0)
+        not_valid_files = summary.files.get("not_validated", 0)
         total_label = "Total files"
         valid_label = "Validated"
         not_valid_label = "Not Validated"
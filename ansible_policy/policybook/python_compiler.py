@@ -0,0 +1,354 @@
+import os
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from ansible_policy.policybook.policy_parser import VALID_ACTIONS
+from ansible_policy.engine import go_sprintf
+from ansible_policy.utils import init_logger
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+
+# the policybook AST of each transpiled policy is saved next to its rego file with this suffix
+policy_ast_suffix = ".ast.json"
+
+
+def get_policy_ast_path(rego_path: str):
+    return os.path.splitext(rego_path)[0] + policy_ast_suffix
+
+
+class _Undefined(object):
+    def __repr__(self):
+        return "<undefined>"
+
+
+# a value which does not exist in the input; any expression that refers to it is not satisfied like Rego
+UNDEFINED = _Undefined()
+
+_path_token_pattern = re.compile(r"""\.?([A-Za-z_][A-Za-z0-9_]*)|\[\s*"([^"]*)"\s*\]|\[\s*'([^']*)'\s*\]|\[\s*(\d+)\s*\]""")
+_message_var_pattern = r"{{\s*([^}]+)\s*}}"
+
+
+def parse_path(path: str):
+    tokens = []
+    pos = 0
+    path = path.strip()
+    while pos < len(path):
+        m = _path_token_pattern.match(path, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"failed to parse the reference `{path}`")
+        name, dq_key, sq_key, index = m.groups()
+        if name is not None:
+            tokens.append(name)
+        elif dq_key is not None:
+            tokens.append(dq_key)
+        elif sq_key is not None:
+            tokens.append(sq_key)
+        else:
+            tokens.append(int(index))
+        pos = m.end()
+    if not tokens:
+        raise ValueError(f"empty reference `{path}`")
+    return tokens
+
+
+def get_child(value: any, key: any):
+    if value is UNDEFINED:
+        return UNDEFINED
+    if isinstance(value, dict):
+        return value.get(key, UNDEFINED)
+    if isinstance(value, (list, tuple)):
+        if isinstance(key, int) and 0 <= key < len(value):
+            return value[key]
+        return UNDEFINED
+    # objects in the input (e.g. `input._agk`) are serialized with their attributes in the Rego path
+    if hasattr(value, "__dict__"):
+        return vars(value).get(key, UNDEFINED)
+    return UNDEFINED
+
+
+def is_satisfied(value: any):
+    # a Rego expression statement is satisfied if it is defined and not false
+    return value is not UNDEFINED and value is not False
+
+
+def rego_equals(a: any, b: any):
+    if a is UNDEFINED or b is UNDEFINED:
+        return False
+    # booleans are not numbers in Rego
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def rego_member(item: any, collection: any):
+    if isinstance(collection, (list, tuple, set)):
+        return any(rego_equals(item, c) for c in collection)
+    if isinstance(collection, dict):
+        return any(rego_equals(item, c) for c in collection.values())
+    return False
+
+
+def to_list(value: any):
+    if value is UNDEFINED:
+        return UNDEFINED
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def iter_truthy_keys(value: any):
+    # the keys of `x[key]` statements in Rego; an element whose value is false does not satisfy it
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    elif hasattr(value, "__dict__"):
+        items = vars(value).items()
+    else:
+        return []
+    return [k for k, v in items if v is not False]
+
+
+@dataclass
+class PythonPolicy(object):
+    package: str = ""
+    target: str = ""
+    tags: list = field(default_factory=list)
+    vars_declaration: dict = field(default_factory=dict)
+    action_type: str = ""
+    # name and predicate of condition rules; rules with the same name are OR-ed like Rego
+    conditions: List[tuple] = field(default_factory=list)
+    message_func: Callable = None
+
+    def evaluate(self, input_data: any):
+        value = {"__target__": f"{self.target}"}
+        if self.tags:
+            value["__tags__"] = self.tags
+        value.update(self.vars_declaration)
+
+        cond_names = []
+        for name, predicate in self.conditions:
+            if name not in cond_names:
+                cond_names.append(name)
+            if value.get(name):
+                continue
+            if predicate(input_data):
+                value[name] = True
+
+        matched = all(value.get(name) for name in cond_names)
+        message = ""
+        if matched:
+            message = self.message_func(input_data) + "\n"
+        value[self.action_type] = matched
+        return {"value": value, "message": message}
+
+
+class PolicyPythonCompiler:
+    """
+    PolicyPythonCompiler transforms a policybook AST to Python predicates.
+    It accepts the same AST as PolicyTranspiler and the compiled policy returns the same decision as the transpiled Rego policy.
+    Any expression which PolicyTranspiler does not support raises ValueError, so that the policy can be evaluated by OPA instead.
+    """
+
+    def load_policy(self, ast_path: str):
+        with open(ast_path, "r") as file:
+            ast_data = json.load(file)
+        policies = self.policyset_to_python(ast_data)
+        if len(policies) != 1:
+            raise ValueError(f"a policy AST file must contain only 1 policy, but found {len(policies)} in `{ast_path}`")
+        return policies[0]
+
+    def policyset_to_python(self, ast_data: dict):
+        if "PolicySet" not in ast_data:
+            raise ValueError("no policy found")
+
+        ps = ast_data["PolicySet"]
+        if "name" not in ps:
+            raise ValueError("name field is empty")
+
+        vars_declaration = ps.get("vars", {}) or {}
+        policies = []
+        for p in ps.get("policies", []):
+            pol = p.get("Policy", {})
+            name = pol.get("name", "")
+
+            py_policy = PythonPolicy()
+            py_policy.package = self.clean_error_token(name)
+            py_policy.target = pol.get("target")
+            py_policy.tags = pol.get("tags", []) or []
+            py_policy.vars_declaration = vars_declaration
+            py_policy.conditions = self.condition_to_predicates(pol.get("condition", {}), name, vars_declaration)
+
+            action = pol.get("actions", [])[0]["Action"]
+            action_type = action.get("action", "")
+            if action_type not in VALID_ACTIONS:
+                raise ValueError(f"{action_type} is not supported. supported actions are {VALID_ACTIONS}")
+            py_policy.action_type = action_type
+            action_args = action.get("action_args", "") or {}
+            py_policy.message_func = self.make_message_func(action_args.get("msg", ""), vars_declaration)
+            policies.append(py_policy)
+        return policies
+
+    def condition_to_predicates(self, condition: dict, policy_name: str, vars_declaration: dict):
+        if "AllCondition" in condition:
+            conditions = condition["AllCondition"]
+            names = [self.clean_error_token(f"{policy_name}_{i}") for i in range(len(conditions))]
+        elif "AnyCondition" in condition:
+            conditions = condition["AnyCondition"]
+            names = [self.clean_error_token(f"{policy_name}_0") for _ in conditions]
+        else:
+            raise ValueError(f"the condition type is not supported: {list(condition.keys())}")
+
+        predicates = []
+        for name, cond in zip(names, conditions):
+            predicates.append((name, self.condition_to_predicate(cond, vars_declaration)))
+        return predicates
+
+    def condition_to_predicate(self, condition: dict, vars_declaration: dict):
+        if "AndExpression" in condition:
+            checks = []
+            for side in ["lhs", "rhs"]:
+                ast_exp = condition["AndExpression"][side]
+                if "AndExpression" in ast_exp or "OrExpression" in ast_exp:
+                    raise ValueError("nested boolean expressions are not supported")
+                checks.append(self.expression_to_predicate(ast_exp, vars_declaration))
+        else:
+            checks = [self.expression_to_predicate(condition, vars_declaration)]
+
+        def predicate(input_data):
+            return all(check(input_data) for check in checks)
+
+        return predicate
+
+    def expression_to_predicate(self, ast_exp: dict, vars_declaration: dict):
+        if "EqualsExpression" in ast_exp or "NotEqualsExpression" in ast_exp:
+            negate = "NotEqualsExpression" in ast_exp
+            exp = ast_exp["NotEqualsExpression"] if negate else ast_exp["EqualsExpression"]
+            lhs = self.make_getter(exp["lhs"], vars_declaration)
+            rhs_type, rhs_val = self.get_operand(exp["rhs"])
+            if rhs_type == "Boolean":
+                # same as the transpiled rule, which checks only whether the lhs is satisfied
+                if negate:
+                    return lambda x: not is_satisfied(lhs(x))
+                return lambda x: is_satisfied(lhs(x))
+            rhs = self.make_getter(exp["rhs"], vars_declaration)
+            if negate:
+                return lambda x: self._not_equals(lhs(x), rhs(x))
+            return lambda x: rego_equals(lhs(x), rhs(x))
+        elif "ItemInListExpression" in ast_exp or "ItemNotInListExpression" in ast_exp:
+            negate = "ItemNotInListExpression" in ast_exp
+            exp = ast_exp["ItemNotInListExpression"] if negate else ast_exp["ItemInListExpression"]
+            item = self.make_getter(exp["lhs"], vars_declaration)
+            items = self.make_getter(exp["rhs"], vars_declaration)
+            return lambda x: self._check_item_in_list(item(x), items(x), negate)
+        elif "ListContainsItemExpression" in ast_exp or "ListNotContainsItemExpression" in ast_exp:
+            negate = "ListNotContainsItemExpression" in ast_exp
+            exp = ast_exp["ListNotContainsItemExpression"] if negate else ast_exp["ListContainsItemExpression"]
+            items = self.make_getter(exp["lhs"], vars_declaration)
+            item = self.make_getter(exp["rhs"], vars_declaration)
+            return lambda x: self._check_item_in_list(item(x), items(x), negate)
+        elif "KeyInDictExpression" in ast_exp or "KeyNotInDictExpression" in ast_exp:
+            negate = "KeyNotInDictExpression" in ast_exp
+            exp = ast_exp["KeyNotInDictExpression"] if negate else ast_exp["KeyInDictExpression"]
+            obj = self.make_getter(exp["lhs"], vars_declaration)
+            # the key is used as a literal string in the transpiled rule
+            _, key = self.get_operand(exp["rhs"])
+            key = f"{key}".replace('"', "")
+            return lambda x: self._check_key_in_dict(obj(x), key, negate)
+        elif "IsDefinedExpression" in ast_exp or "IsNotDefinedExpression" in ast_exp:
+            negate = "IsNotDefinedExpression" in ast_exp
+            exp = ast_exp["IsNotDefinedExpression"] if negate else ast_exp["IsDefinedExpression"]
+            _, ref = self.get_operand(exp)
+            tokens = parse_path(ref)
+            val = self.make_getter(exp, vars_declaration)
+            parent = None
+            if len(tokens) > 1:
+                parent = self.make_path_getter(tokens[:-1], vars_declaration)
+            return lambda x: self._check_defined(parent(x) if parent else True, val(x), negate)
+        raise ValueError(f"the expression is not supported: {list(ast_exp.keys())}")
+
+    def make_message_func(self, msg: str, vars_declaration: dict):
+        refs = [v.strip() for v in re.findall(_message_var_pattern, msg)]
+        if not refs:
+            return lambda x: msg
+
+        fmt = re.sub(_message_var_pattern, "%v", msg).replace('"', "'")
+        getters = [self.make_path_getter(parse_path(ref), vars_declaration) for ref in refs]
+
+        def message_func(input_data):
+            values = [getter(input_data) for getter in getters]
+            if any(v is UNDEFINED for v in values):
+                return "<undefined>"
+            return go_sprintf(fmt, values)
+
+        return message_func
+
+    def get_operand(self, operand: dict):
+        for operand_type in ["String", "Input", "Variable", "Boolean", "Integer"]:
+            if isinstance(operand, dict) and operand_type in operand:
+                return operand_type, operand[operand_type]
+        raise ValueError(f"the operand is not supported: {operand}")
+
+    def make_getter(self, operand: dict, vars_declaration: dict):
+        operand_type, val = self.get_operand(operand)
+        if operand_type in ["Input", "Variable"]:
+            return self.make_path_getter(parse_path(val), vars_declaration)
+        return lambda x: val
+
+    def make_path_getter(self, tokens: list, vars_declaration: dict):
+        root = tokens[0]
+        rest = tokens[1:]
+        if root == "input":
+
+            def getter(input_data):
+                value = input_data
+                for key in rest:
+                    value = get_child(value, key)
+                return value
+
+            return getter
+
+        if root not in vars_declaration:
+            return lambda x: UNDEFINED
+        root_value = vars_declaration[root]
+
+        def var_getter(input_data):
+            value = root_value
+            for key in rest:
+                value = get_child(value, key)
+            return value
+
+        return var_getter
+
+    def _not_equals(self, lhs: any, rhs: any):
+        if lhs is UNDEFINED or rhs is UNDEFINED:
+            return False
+        return not rego_equals(lhs, rhs)
+
+    def _check_item_in_list(self, item: any, items: any, negate: bool):
+        lhs_list = to_list(item)
+        if lhs_list is UNDEFINED or items is UNDEFINED:
+            return False
+        if negate:
+            return any(not rego_member(i, items) for i in lhs_list)
+        return any(rego_member(i, items) for i in lhs_list)
+
+    def _check_key_in_dict(self, obj: any, key: str, negate: bool):
+        if not is_satisfied(obj):
+            return False
+        found = key in iter_truthy_keys(obj)
+        return not found if negate else found
+
+    def _check_defined(self, parent: any, val: any, negate: bool):
+        if not is_satisfied(parent):
+            return False
+        if negate:
+            return not is_satisfied(val)
+        return is_satisfied(val)
+
+    def clean_error_token(self, in_str):
+        return in_str.replace(" ", "_").replace("-", "_").replace("?", "").replace("(", "_").replace(")", "_")
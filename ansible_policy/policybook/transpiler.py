@@ -26,6 +26,7 @@ from ansible_policy.policybook.json_generator import OPERATOR_MNEMONIC
 from ansible_policy.policybook.json_generator import generate_dict_policysets
 from ansible_policy.policybook.policy_parser import parse_policy_sets, VALID_ACTIONS
 from ansible_policy.policybook.rego_model import RegoPolicy, RegoFunc
+from ansible_policy.policybook.python_compiler import policy_ast_suffix
 from ansible_policy.utils import init_logger
 
 
@@ -104,6 +105,7 @@ class PolicyTranspiler:
             raise ValueError("name field is empty")
 
         policies = []
+        policy_asts = []
         for p in ps.get("policies", []):
             pol = p.get("Policy", {})
 
@@ -137,11 +139,17 @@ class PolicyTranspiler:
             rego_policy.action_func = action_func
 
             policies.append(rego_policy)
+            # the AST of this policy alone is saved too, so that it can be compiled to Python predicates later
+            policy_ast = {"PolicySet": {key: val for key, val in ps.items() if key != "policies"}}
+            policy_ast["PolicySet"]["policies"] = [p]
+            policy_asts.append(policy_ast)
 
-        for rpol in policies:
+        for rpol, policy_ast in zip(policies, policy_asts):
             rego_output = rpol.to_rego()
             with open(os.path.join(rego_dir, f"{rpol.package}.rego"), "w") as f:
                 f.write(rego_output)
+            with open(os.path.join(rego_dir, f"{rpol.package}{policy_ast_suffix}"), "w") as f:
+                json.dump(policy_ast, f)
         return
 
     def action_to_rule(self, input: dict, conditions: list):
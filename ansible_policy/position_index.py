@@ -0,0 +1,163 @@
+import os
+import yaml
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import (
+    init_logger,
+    find_best_block,
+    reconstruct_task_data,
+    reconstruct_play_data,
+)
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+# a root item with one of these keys is a play, otherwise a task of a taskfile
+play_keys = ["hosts", "import_playbook", "ansible.builtin.import_playbook", "pre_tasks", "tasks", "post_tasks", "roles", "handlers"]
+play_task_list_keys = ["pre_tasks", "tasks", "post_tasks", "handlers"]
+block_task_list_keys = ["block", "rescue", "always"]
+
+
+@dataclass
+class YamlBlock(object):
+    # line numbers start from 1 like `line_num_in_file` of tasks
+    begin: int = -1
+    end: int = -1
+    name: str = None
+    keys: list = field(default_factory=list)
+
+    @property
+    def line_num_in_file(self):
+        return [self.begin, self.end]
+
+
+# YamlPositionIndex maps the plays and the tasks in a YAML file to their line ranges.
+# it is built by a single compose pass, so the file does not need to be scanned line by line for each object
+@dataclass
+class YamlPositionIndex(object):
+    path: str = ""
+    body: str = ""
+    lines: list = field(default_factory=list)
+    # root items of a playbook by their index; None for items which are not plays
+    plays: list = field(default_factory=list)
+    # tasks in the order of their positions, including those in blocks
+    tasks: list = field(default_factory=list)
+    # False if the file could not be composed; the line-based search is used instead
+    valid: bool = False
+
+    _tasks_by_name: dict = field(default_factory=dict)
+    _tasks_by_key: dict = field(default_factory=dict)
+
+    @staticmethod
+    def load(fpath: str):
+        with open(fpath, "r") as file:
+            body = file.read()
+        return YamlPositionIndex.from_body(body=body, path=fpath)
+
+    @staticmethod
+    def from_body(body: str, path: str = ""):
+        index = YamlPositionIndex(path=path, body=body, lines=body.splitlines())
+        try:
+            root = yaml.compose(body, Loader=yaml.SafeLoader)
+        except Exception as exc:
+            logger.debug(f"failed to compose `{path}`; the line-based search is used instead: {exc}")
+            return index
+
+        if isinstance(root, yaml.SequenceNode):
+            for node in root.value:
+                if not isinstance(node, yaml.MappingNode):
+                    index.plays.append(None)
+                    continue
+                block = index._make_block(node)
+                if any(key in play_keys for key in block.keys):
+                    index.plays.append(block)
+                    for key_node, value_node in node.value:
+                        if key_node.value in play_task_list_keys:
+                            index._add_tasks(value_node)
+                else:
+                    index.plays.append(None)
+                    index._add_tasks_from_node(node, block)
+        index.tasks.sort(key=lambda b: b.begin)
+        for block in index.tasks:
+            if block.name is not None:
+                index._tasks_by_name.setdefault(block.name, []).append(block)
+            for key in block.keys:
+                index._tasks_by_key.setdefault(key, []).append(block)
+        index.valid = True
+        return index
+
+    def _make_block(self, node: yaml.Node):
+        begin = node.start_mark.line + 1
+        end = node.end_mark.line
+        # the end mark is the beginning of the next token, so the block ends on the previous line
+        # unless the next token follows the block on the same line like a flow mapping
+        end_line = self.lines[end] if end < len(self.lines) else ""
+        if end_line[: node.end_mark.column].strip():
+            end += 1
+        end = max(end, begin)
+        name = None
+        keys = []
+        if isinstance(node, yaml.MappingNode):
+            for key_node, value_node in node.value:
+                if not isinstance(key_node, yaml.ScalarNode):
+                    continue
+                keys.append(key_node.value)
+                if key_node.value == "name" and isinstance(value_node, yaml.ScalarNode):
+                    name = value_node.value
+        return YamlBlock(begin=begin, end=end, name=name, keys=keys)
+
+    def _add_tasks(self, node: yaml.Node):
+        if not isinstance(node, yaml.SequenceNode):
+            return
+        for task_node in node.value:
+            if isinstance(task_node, yaml.MappingNode):
+                self._add_tasks_from_node(task_node, self._make_block(task_node))
+        return
+
+    def _add_tasks_from_node(self, node: yaml.MappingNode, block: YamlBlock):
+        self.tasks.append(block)
+        for key_node, value_node in node.value:
+            if key_node.value in block_task_list_keys:
+                self._add_tasks(value_node)
+        return
+
+    def get_yaml_lines(self, block: YamlBlock):
+        return "\n".join(self.lines[block.begin - 1 : block.end])
+
+    def find_task(self, task_name: str = "", module_name: str = "", module_options: dict = None, task_options: dict = None):
+        # returns `[begin, end]` of the task, or None if it is not found in the index
+        if not self.valid:
+            return None
+        candidates = []
+        if task_name:
+            candidates = self._tasks_by_name.get(task_name, [])
+        elif module_name:
+            candidates = self._tasks_by_key.get(module_name, [])
+        if not candidates:
+            return None
+        reconstructed_data = reconstruct_task_data(
+            task_name=task_name, module_name=module_name, module_options=module_options, task_options=task_options
+        )
+        return self._find_best(candidates, reconstructed_data)
+
+    def find_play(self, play_name: str = "", play_options: dict = None, play_index: int = -1):
+        # returns `[begin, end]` of the play, or None if it is not found in the index
+        if not self.valid:
+            return None
+        if play_index >= 0 and play_index < len(self.plays):
+            block = self.plays[play_index]
+            if block and (not play_name or block.name == play_name):
+                return block.line_num_in_file
+        candidates = [block for block in self.plays if block]
+        if play_name:
+            candidates = [block for block in candidates if block.name == play_name]
+        if not candidates:
+            return None
+        reconstructed_data = reconstruct_play_data(play_name=play_name, play_options=play_options)
+        return self._find_best(candidates, reconstructed_data)
+
+    def _find_best(self, candidates: list, reconstructed_data: list):
+        # the fuzzy matching is done only among the candidates which have the same name or module
+        candidate_blocks = [(self.get_yaml_lines(block), block.line_num_in_file) for block in candidates]
+        _, line_num_in_file = find_best_block(candidate_blocks=candidate_blocks, reconstructed_data=reconstructed_data)
+        return line_num_in_file
@@ -5,15 +5,17 @@ import tempfile
 import jsonpickle
 import json
 import yaml
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import List, Dict, Union
 from ansible.executor.task_result import TaskResult as AnsibleTaskResult
 from ansible.playbook.task import Task as AnsibleTask
 from ansible.parsing.yaml.objects import AnsibleUnicode
 
+from ansible_policy.serializer import dumps, register_encoder
+from ansible_policy.scan_cache import ScanCache
 from ansible_policy.utils import (
     get_module_name_from_task,
-    load_external_data,
+    get_knowledge_base,
     prepare_project_dir_from_runner_jobdata,
     embed_module_info_with_galaxy,
 )
@@ -584,9 +586,7 @@ class PolicyInput(object):
                     tasks.extend(taskfile.tasks)
             p_input_list = []
             for task in tasks:
-                p_input = copy.deepcopy(base_input)
-                p_input.type = InputTypeTask
-                p_input.task = task
+                p_input = base_input.make_target_input(input_type=InputTypeTask, task=task)
                 p_input_list.append(p_input)
             return p_input_list
         elif input_type == InputTypePlay:
@@ -598,9 +598,7 @@ class PolicyInput(object):
                 plays.extend(playbook.plays)
             p_input_list = []
             for play in plays:
-                p_input = copy.deepcopy(base_input)
-                p_input.type = InputTypePlay
-                p_input.play = play
+                p_input = base_input.make_target_input(input_type=InputTypePlay, play=play)
                 p_input_list.append(p_input)
             return p_input_list
         elif input_type == InputTypeRole:
@@ -612,9 +610,7 @@ class PolicyInput(object):
                 roles.extend(role)
             p_input_list = []
             for role in roles:
-                p_input = copy.deepcopy(base_input)
-                p_input.type = InputTypeRole
-                p_input.role = role
+                p_input = base_input.make_target_input(input_type=InputTypeRole, role=role)
                 p_input_list.append(p_input)
             return p_input_list
         else:
@@ -656,6 +652,13 @@ class PolicyInput(object):
 
             return [p_input]
 
+    def make_target_input(self, input_type: str, **target):
+        # the project data is shared with this input instead of being copied for each target, so it must not be modified.
+        # module info is set to the target task later, so the task is copied to keep it out of the project data
+        if "task" in target:
+            target["task"] = copy.copy(target["task"])
+        return replace(self, type=input_type, **target)
+
     @staticmethod
     def from_task_result(task_result: TaskResult):
         if not isinstance(task_result, TaskResult):
@@ -707,7 +710,9 @@ class PolicyInput(object):
         kwargs["separators"] = (",", ":")
         return jsonpickle.encode(**kwargs)
 
-    def to_json(self, **kwargs):
+    def to_dict(self, agk_refs: list = None):
+        # the input document which policies see as `input`; `to_json()` serializes this.
+        # if `agk_refs` is given, `_agk` has only those attributes instead of the whole project data
         data = {}
         try:
             if self.type == InputTypeTask:
@@ -728,8 +733,18 @@ class PolicyInput(object):
                 data = self.rest.__dict__
         except Exception:
             pass
-        data["_agk"] = self
-        kwargs["value"] = data
+        # `data` may be a dict of the target object (e.g. `play.options`), so `_agk` is added to a copy of it
+        data = dict(data)
+        if agk_refs is None:
+            data["_agk"] = self
+        else:
+            data["_agk"] = {name: getattr(self, name) for name in agk_refs if hasattr(self, name)}
+        return data
+
+    def to_json(self, agk_refs: list = None, **kwargs):
+        if not kwargs:
+            return dumps(self.to_dict(agk_refs=agk_refs))
+        kwargs["value"] = self.to_dict(agk_refs=agk_refs)
         kwargs["unpicklable"] = False
         kwargs["make_refs"] = False
         kwargs["separators"] = (",", ":")
@@ -752,6 +767,52 @@ class PolicyInput(object):
         return obj
 
 
+# attributes of PolicyInput which are shared by all the inputs made from the same project
+shared_input_attrs = ["source", "project", "playbooks", "taskfiles", "roles", "vars_files", "extra_vars", "variables"]
+
+
+# PolicyInputEncoder makes the same JSON as `PolicyInput.to_json()`, but the shared project data in `_agk` is encoded only once.
+# the cached fragments are reused while the encoder lives, so the inputs must not be modified after they are encoded
+@dataclass
+class PolicyInputEncoder(object):
+    # JSON fragment for each shared object by its id, with the object itself to keep the id valid
+    _fragments: dict = field(default_factory=dict)
+
+    def encode(self, input_data: PolicyInput, agk_refs: list = None):
+        data = input_data.to_dict(agk_refs=agk_refs)
+        # `_agk` is usually the last key; otherwise the whole input is encoded as usual
+        if list(data)[-1] != "_agk":
+            return input_data.to_json(agk_refs=agk_refs)
+        agk = data.pop("_agk")
+        agk_items = vars(agk).items() if isinstance(agk, PolicyInput) else agk.items()
+
+        agk_parts = []
+        for name, value in agk_items:
+            if name in shared_input_attrs:
+                fragment = self._get_fragment(value)
+            else:
+                fragment = self._encode(value)
+            agk_parts.append(f"{json.dumps(name)}:{fragment}")
+        agk_json = "{" + ",".join(agk_parts) + "}"
+
+        target_json = self._encode(data)
+        sep = "," if data else ""
+        return f'{target_json[:-1]}{sep}"_agk":{agk_json}}}'
+
+    def _get_fragment(self, value: any):
+        key = id(value)
+        if key not in self._fragments:
+            self._fragments[key] = (value, self._encode(value))
+        return self._fragments[key][1]
+
+    def _encode(self, value: any):
+        return dumps(value)
+
+
+for _cls in [File, Task, Play, Playbook, TaskFile, Role, Project, Event, APIRequest, PolicyInput]:
+    register_encoder(_cls)
+
+
 def task_fields2module_options(task_fields: dict):
     task_action = task_fields.get("action", None)
     if not task_action:
@@ -860,7 +921,7 @@ def task_result_vars2dict(task_result_vars: dict):
 
 
 def process_input_data_with_external_data(input_type: str, input_data: PolicyInput, external_data_path: str):
-    galaxy = load_external_data(ftype="galaxy", fpath=external_data_path)
+    galaxy = get_knowledge_base(ftype="galaxy", fpath=external_data_path)
 
     if input_type == InputTypeTask:
         task = input_data.task
@@ -883,6 +944,42 @@ def process_input_data_with_external_data(input_type: str, input_data: PolicyInp
     return input_data
 
 
+def collect_task_modules(input_data_list: List[PolicyInput]):
+    # module names of all the tasks in the inputs, including the ones in the project data.
+    # the inputs of a project share the same project data, so each container is walked only once
+    module_names = set()
+    seen = set()
+
+    def first_seen(obj: any):
+        if id(obj) in seen:
+            return False
+        seen.add(id(obj))
+        return True
+
+    for input_data in input_data_list:
+        tasks = []
+        if input_data.task:
+            tasks.append(input_data.task)
+        if first_seen(input_data.playbooks):
+            for playbook in input_data.playbooks.values():
+                if first_seen(playbook):
+                    tasks.extend(playbook.tasks)
+        if first_seen(input_data.taskfiles):
+            for taskfile in input_data.taskfiles.values():
+                if first_seen(taskfile):
+                    tasks.extend(taskfile.tasks)
+        if first_seen(input_data.roles):
+            for role in input_data.roles.values():
+                if first_seen(role):
+                    for taskfile in role.taskfiles.values():
+                        if first_seen(taskfile):
+                            tasks.extend(taskfile.tasks)
+        for task in tasks:
+            if task.module:
+                module_names.add(task.module)
+    return sorted(module_names)
+
+
 # make policy input data by scanning target project
 def make_policy_input_with_scan(target_path: str, metadata: dict = {}, variables: Variables = None) -> Dict[str, List[PolicyInput]]:
     fpath = ""
@@ -960,8 +1057,13 @@ def load_input_from_jobdata(jobdata: dict = {}):
     return policy_input, runner_jobdata_str
 
 
-def load_input_from_project_dir(project_dir: str = "", variables: Variables = None):
-    policy_input = make_policy_input_with_scan(target_path=project_dir, variables=variables)
+def load_input_from_project_dir(project_dir: str = "", variables: Variables = None, scan_cache: ScanCache = None):
+    def _scan():
+        return make_policy_input_with_scan(target_path=project_dir, variables=variables)
+
+    if scan_cache and os.path.isdir(project_dir):
+        return scan_cache.load(project_dir=project_dir, scan_func=_scan, variables=variables)
+    policy_input = _scan()
     return policy_input
 
 
@@ -0,0 +1,78 @@
+import os
+import re
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import init_logger
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+
+# StrPatternIndex finds the values whose patterns match a text with the same rule as `match_str_expression()`.
+# literal patterns are looked up in a dict and wildcard patterns are compiled only once
+@dataclass
+class StrPatternIndex(object):
+    # values whose pattern is empty or `*`, which match any text
+    any_values: list = field(default_factory=list)
+    literal_values: dict = field(default_factory=dict)
+    wildcard_values: list = field(default_factory=list)
+
+    def add(self, pattern: str, value: any):
+        if not pattern or pattern == "*":
+            self.any_values.append(value)
+        elif "*" in pattern:
+            self.wildcard_values.append((re.compile(pattern.replace("*", ".*")), value))
+        else:
+            self.literal_values.setdefault(pattern, []).append(value)
+        return
+
+    def find(self, text: str):
+        values = list(self.any_values)
+        values.extend(self.literal_values.get(text, []))
+        for compiled, value in self.wildcard_values:
+            if compiled.match(text):
+                values.append(value)
+        return values
+
+
+# PolicyRoutingTable maps an input to the policies which can apply to it by their `__target__` and `__target_module__`
+@dataclass
+class PolicyRoutingTable(object):
+    metadata_list: list = field(default_factory=list)
+
+    _type_index: StrPatternIndex = None
+    _module_index: StrPatternIndex = None
+    _routes: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._type_index = StrPatternIndex()
+        self._module_index = StrPatternIndex()
+        for i, metadata in enumerate(self.metadata_list):
+            self._type_index.add(metadata.target, i)
+            self._module_index.add(metadata.target_module, i)
+
+    @staticmethod
+    def build(metadata_list: list):
+        return PolicyRoutingTable(metadata_list=list(metadata_list))
+
+    def route(self, input_type: str, module_fqcn: str = None):
+        # returns the paths of the policies whose target type matches the input, and the paths of those to be evaluated
+        key = (input_type, module_fqcn if input_type == "task" else None)
+        if key in self._routes:
+            return self._routes[key]
+
+        target_type = input_type
+        if input_type == "task_result":
+            target_type = "task"
+        type_matched = set(self._type_index.find(target_type))
+        to_eval = type_matched
+        if input_type == "task":
+            to_eval = type_matched & set(self._module_index.find(module_fqcn or ""))
+        target_paths = self._to_paths(type_matched)
+        eval_paths = self._to_paths(to_eval)
+        self._routes[key] = (target_paths, eval_paths)
+        return target_paths, eval_paths
+
+    def _to_paths(self, indices: set):
+        # keep the order of the policies
+        return [self.metadata_list[i].path for i in sorted(indices)]
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import zlib
+import hmac
+import pickle
+import sqlite3
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+from ansible_policy.utils import init_logger
+from ansible_policy.bundle import get_file_hash
+from ansible_policy.__version__ import __version__
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+scan_cache_filename = "scans.sqlite"
+scan_cache_format_version = "2"
+
+# the cached scan results are pickled, so they are signed with a key of the user and only the signed ones are loaded.
+# the key is kept outside of the cache directory, which may be shared or writable by others
+default_scan_cache_key_path = os.getenv("ANSIBLE_GK_SCAN_CACHE_KEY", os.path.join(os.path.expanduser("~"), ".ansible-policy", "scan_cache.key"))
+scan_cache_key_size = 32
+# each stored entry is the HMAC-SHA256 signature followed by the compressed pickle
+signature_size = hashlib.sha256().digest_size
+
+# directories which the scanner does not read; any other file (e.g. templates or files copied by tasks) is a part of the key
+ignored_dir_names = [".git"]
+
+
+def get_scanner_version():
+    try:
+        from importlib.metadata import version
+
+        return version("ansible-content-capture")
+    except Exception:
+        return "unknown"
+
+
+def load_or_create_key(key_path: str):
+    # the key file is readable only by the user who created it
+    try:
+        with open(key_path, "rb") as file:
+            key = file.read()
+        if len(key) >= scan_cache_key_size:
+            return key
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(key_path), mode=0o700, exist_ok=True)
+    key = os.urandom(scan_cache_key_size)
+    tmp_path = f"{key_path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as file:
+        file.write(key)
+    os.replace(tmp_path, key_path)
+    return key
+
+
+def sign(key: bytes, data: bytes):
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+
+def compute_tree_hash(file_hashes: dict):
+    # Merkle-style hash; each directory is hashed from the hashes of its entries, so a change is propagated up to the root
+    children = {}
+    for relpath, file_hash in file_hashes.items():
+        parts = relpath.split("/")
+        node = children
+        for part in parts[:-1]:
+            node = node.setdefault(part + "/", {})
+        node[parts[-1]] = file_hash
+
+    def _hash(node: dict):
+        sha256 = hashlib.sha256()
+        for name in sorted(node):
+            child = node[name]
+            child_hash = _hash(child) if isinstance(child, dict) else child
+            sha256.update(f"{name}:{child_hash}\n".encode())
+        return sha256.hexdigest()
+
+    return _hash(children)
+
+
+def find_changed_files(old_hashes: dict, new_hashes: dict):
+    changed = [relpath for relpath, file_hash in new_hashes.items() if old_hashes.get(relpath) != file_hash]
+    changed.extend(relpath for relpath in old_hashes if relpath not in new_hashes)
+    return sorted(changed)
+
+
+# ScanCache keeps the inputs made by scanning a project in a SQLite file, keyed by the content of the project files.
+# an unchanged project is loaded from the cache without running the scanner
+@dataclass
+class ScanCache(object):
+    cache_dir: str = ""
+    key_path: str = default_scan_cache_key_path
+
+    hits: int = 0
+    misses: int = 0
+    # files changed since the last scan of the project in the latest lookup
+    changed_files: list = field(default_factory=list)
+
+    _conn: sqlite3.Connection = None
+    _key: bytes = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def __post_init__(self):
+        if not self.cache_dir:
+            raise ValueError("`cache_dir` must be specified for the scan cache")
+        self._key = load_or_create_key(self.key_path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        db_path = os.path.join(self.cache_dir, scan_cache_filename)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS scans (key TEXT PRIMARY KEY, data BLOB NOT NULL, created_at REAL NOT NULL)")
+        # the last scanned files of each project with their stats, so unchanged files are not hashed again
+        self._conn.execute("CREATE TABLE IF NOT EXISTS manifests (project_dir TEXT PRIMARY KEY, key TEXT NOT NULL, files TEXT NOT NULL)")
+        self._conn.commit()
+
+    def load(self, project_dir: str, scan_func: callable, variables: any = None):
+        # returns the inputs of the project from the cache, or the ones made by `scan_func()` after storing them
+        project_dir = os.path.abspath(project_dir)
+        last_key, last_files = self._get_manifest(project_dir)
+        files = self.collect_files(project_dir=project_dir, last_files=last_files)
+        file_hashes = {relpath: entry[2] for relpath, entry in files.items()}
+        key = self.make_key(project_dir=project_dir, file_hashes=file_hashes, variables=variables)
+
+        self.changed_files = find_changed_files({relpath: entry[2] for relpath, entry in last_files.items()}, file_hashes)
+        input_data_dict = self.get(key)
+        if input_data_dict is not None:
+            if key != last_key or files != last_files:
+                self._put_manifest(project_dir=project_dir, key=key, files=files)
+            return input_data_dict
+
+        if last_files:
+            # the scanner can only scan a whole project, so the project is scanned again even if only a few files changed
+            logger.debug(f"{len(self.changed_files)} files changed since the last scan of `{project_dir}`: {self.changed_files}")
+        input_data_dict = scan_func()
+        self.put(key=key, input_data_dict=input_data_dict, project_dir=project_dir, files=files, last_key=last_key)
+        return input_data_dict
+
+    def collect_files(self, project_dir: str, last_files: dict = None):
+        # relative path -> [mtime_ns, size, hash]; a file is hashed only if its stat is changed since the last scan
+        last_files = last_files or {}
+        files = {}
+        for root, dirs, fnames in os.walk(project_dir):
+            dirs[:] = sorted([d for d in dirs if d not in ignored_dir_names])
+            for fname in sorted(fnames):
+                fpath = os.path.join(root, fname)
+                relpath = os.path.relpath(fpath, project_dir)
+                if not os.path.isfile(fpath):
+                    continue
+                stat = os.stat(fpath)
+                last = last_files.get(relpath)
+                if last and last[0] == stat.st_mtime_ns and last[1] == stat.st_size:
+                    files[relpath] = last
+                else:
+                    files[relpath] = [stat.st_mtime_ns, stat.st_size, get_file_hash(fpath)]
+        return files
+
+    def make_key(self, project_dir: str, file_hashes: dict, variables: any = None):
+        variables_json = json.dumps(vars(variables) if variables else {}, sort_keys=True, default=str)
+        parts = [
+            scan_cache_format_version,
+            get_scanner_version(),
+            __version__,
+            project_dir,
+            compute_tree_hash(file_hashes),
+            hashlib.sha256(variables_json.encode()).hexdigest(),
+        ]
+        return hashlib.sha256(":".join(parts).encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM scans WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        signature, data = row[0][:signature_size], row[0][signature_size:]
+        if not hmac.compare_digest(signature, sign(self._key, data)):
+            # e.g. written by another user or with another key; it is never unpickled
+            logger.warning(f"ignored a cached scan result in `{self.cache_dir}` which is not signed with the key `{self.key_path}`")
+            self.misses += 1
+            return None
+        try:
+            input_data_dict = pickle.loads(zlib.decompress(data))
+        except Exception as exc:
+            # e.g. the classes of the inputs are changed; the project is scanned again
+            logger.debug(f"failed to load a cached scan result; {exc}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return input_data_dict
+
+    def put(self, key: str, input_data_dict: dict, project_dir: str, files: dict, last_key: str = ""):
+        # the inputs are stored before they are modified by the evaluator; the objects shared by the inputs are stored only once
+        try:
+            data = zlib.compress(pickle.dumps(input_data_dict, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as exc:
+            logger.debug(f"failed to store the scan result of `{project_dir}`; {exc}")
+            return
+        data = sign(self._key, data) + data
+        with self._lock:
+            if last_key and last_key != key:
+                # only the latest scan result is kept for each project
+                self._conn.execute("DELETE FROM scans WHERE key = ?", (last_key,))
+            self._conn.execute("INSERT OR REPLACE INTO scans (key, data, created_at) VALUES (?, ?, ?)", (key, data, time.time()))
+            self._conn.commit()
+        self._put_manifest(project_dir=project_dir, key=key, files=files)
+        return
+
+    def _get_manifest(self, project_dir: str):
+        with self._lock:
+            row = self._conn.execute("SELECT key, files FROM manifests WHERE project_dir = ?", (project_dir,)).fetchone()
+        if row is None:
+            return "", {}
+        return row[0], json.loads(row[1])
+
+    def _put_manifest(self, project_dir: str, key: str, files: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifests (project_dir, key, files) VALUES (?, ?, ?)",
+                (project_dir, key, json.dumps(files, separators=(",", ":"))),
+            )
+            self._conn.commit()
+        return
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+        return
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
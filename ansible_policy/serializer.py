@@ -0,0 +1,128 @@
+import os
+import json
+import jsonpickle
+from dataclasses import fields
+from jsonpickle import handlers as jsonpickle_handlers
+from jsonpickle import tags as jsonpickle_tags
+from jsonpickle import util as jsonpickle_util
+
+from ansible_policy.utils import init_logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+# if true, every output is compared with `jsonpickle.encode()` and ValueError is raised on a mismatch
+verify_encoder = os.getenv("ANSIBLE_GK_VERIFY_JSON_ENCODER", "false").lower() == "true"
+
+_primitive_types = (str, int, float, bool, type(None))
+_sequence_types = (list, tuple, set)
+
+# encoder for each class, which returns a dict of the attributes to be serialized
+_encoders = {}
+
+
+class _EncoderHandler(jsonpickle_handlers.BaseHandler):
+    # lets `jsonpickle.encode()` use a custom encoder too, so both give the same JSON
+    def flatten(self, obj, data):
+        data.update(self.context.flatten(_encoders[type(obj)](obj), reset=False))
+        return data
+
+    def restore(self, obj):
+        # the attributes are decoded as a dict because the encoded JSON has no type tags
+        return obj
+
+
+def register_encoder(cls: type, encoder: callable = None):
+    # by default, an object is serialized with its `__dict__` like jsonpickle
+    _encoders[cls] = encoder or vars
+    if encoder:
+        _EncoderHandler.handles(cls)
+    return
+
+
+def public_fields(obj: any):
+    # the dataclass fields except for the private ones like indexes and caches
+    return {f.name: getattr(obj, f.name) for f in fields(obj) if not f.name.startswith("_")}
+
+
+def to_jsonable(value: any):
+    return _Flattener().flatten(value)
+
+
+class _Flattener(object):
+    def __init__(self):
+        self.ancestors = set()
+        # orjson formats floats differently from json (e.g. `1e16` and `NaN`), so such a document is dumped by json
+        self.has_float = False
+
+    def flatten(self, value: any):
+        value_type = type(value)
+        if value_type in _primitive_types:
+            if value_type is float:
+                self.has_float = True
+            return value
+
+        encoder = _encoders.get(value_type)
+        if value_type is not dict and value_type not in _sequence_types and encoder is None:
+            # any other types are flattened by jsonpickle itself, and the result may contain floats
+            self.has_float = True
+            return jsonpickle.Pickler(unpicklable=False, make_refs=False).flatten(value)
+
+        # jsonpickle replaces a cyclic reference with its repr()
+        if id(value) in self.ancestors:
+            return repr(value)
+        self.ancestors.add(id(value))
+        try:
+            if value_type in _sequence_types:
+                return [self.flatten(v) for v in value]
+            items = value if value_type is dict else encoder(value)
+            return self.flatten_dict(items)
+        finally:
+            self.ancestors.discard(id(value))
+
+    def flatten_dict(self, items: dict):
+        data = {}
+        for k, v in items.items():
+            # same as `jsonpickle.util.is_picklable()`
+            if k in jsonpickle_tags.RESERVED or (jsonpickle_util.is_function(v) and not jsonpickle_util.is_module_function(v)):
+                continue
+            if k is None:
+                k = "null"
+            elif not isinstance(k, str):
+                k = repr(k)
+            data[k] = self.flatten(v)
+        return data
+
+
+def dumps(value: any):
+    # the same JSON as `jsonpickle.encode(value, unpicklable=False, make_refs=False, separators=(",", ":"))` byte for byte.
+    # orjson is used only when its output is the same as json, i.e. the document has no floats and only ASCII characters
+    flattener = _Flattener()
+    data = flattener.flatten(value)
+    json_str = None
+    if orjson and not flattener.has_float:
+        try:
+            json_str = orjson.dumps(data).decode()
+        except TypeError:
+            # e.g. an integer larger than 64 bits
+            json_str = None
+        if json_str is not None and not json_str.isascii():
+            # json escapes non-ASCII characters as `\uXXXX`
+            json_str = None
+    if json_str is None:
+        json_str = json.dumps(data, separators=(",", ":"))
+    if verify_encoder:
+        check_compatibility(value=value, json_str=json_str)
+    return json_str
+
+
+def check_compatibility(value: any, json_str: str):
+    expected = jsonpickle.encode(value, unpicklable=False, make_refs=False, separators=(",", ":"))
+    if json_str != expected:
+        raise ValueError(f"the JSON encoder output is different from jsonpickle for {type(value)};\nexpected: {expected}\nactual: {json_str}")
+    return
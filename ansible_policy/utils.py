@@ -1,7 +1,9 @@
 import os
 import re
+import asyncio
 import base64
 import json
+import hashlib
 import yaml
 from rapidfuzz.distance import Levenshtein
 import tarfile
@@ -9,10 +11,24 @@ import zipfile
 import tempfile
 import logging
 import subprocess
+from dataclasses import dataclass, field
 
 
 default_target_type = "task"
 
+# policy metadata by path; each entry is parsed again only when the file is modified
+_policy_metadata = {}
+# top-level names of `data.xxx` references in a policy
+_data_ref_pattern = re.compile(r"(?<![\w.])data\.([A-Za-z_][A-Za-z0-9_]*)")
+# `input` references with their static path like `input._agk.task` or `input["_agk"]["task"]`
+_input_ref_pattern = re.compile(r"""(?<![\w.])input(?!\w)((?:\s*\.\s*[A-Za-z_][A-Za-z0-9_]*|\s*\[\s*"[^"]*"\s*\])*)""")
+_input_ref_key_pattern = re.compile(r"""\.\s*([A-Za-z_][A-Za-z0-9_]*)|\[\s*"([^"]*)"\s*\]""")
+# rules in utils.rego which read the project data in `input._agk`
+_project_data_rules = ["resolve_var(", "_find_playbook_by_task(", "_find_taskfile_by_task(", "_find_entrypoint_by_task("]
+_project_data_refs = ["playbooks", "taskfiles", "variables"]
+# external data by path; each entry is loaded again only when the file is modified
+_knowledge_bases = {}
+
 
 def init_logger(name: str, level: str):
     log_level_map = {
@@ -62,10 +78,48 @@ def eval_opa_policy(rego_path: str, input_data: str, external_data_path: str, ex
         raise ValueError("`package` must be defined in the rego policy file")
 
     util_rego_path = os.path.join(os.path.dirname(__file__), "rego/utils.rego")
-    external_data_option = ""
-    if external_data_path:
-        external_data_option = f"--data {external_data_path}"
-    cmd_str = f"{executable_name} eval --data {util_rego_path} --data {rego_path} {external_data_option} --stdin-input 'data.{rego_pkg_name}'"
+    result_value, message = run_opa_eval(
+        query=f"data.{rego_pkg_name}",
+        data_paths=[util_rego_path, rego_path, external_data_path],
+        input_data=input_data,
+        executable_name=executable_name,
+    )
+    eval_result = {
+        "value": result_value,
+        "message": message,
+    }
+    return eval_result
+
+
+async def eval_opa_policy_async(rego_path: str, input_data: str, external_data_path: str, executable_name: str = "opa"):
+    rego_pkg_name = get_rego_main_package_name(rego_path=rego_path)
+    if not rego_pkg_name:
+        raise ValueError("`package` must be defined in the rego policy file")
+
+    util_rego_path = os.path.join(os.path.dirname(__file__), "rego/utils.rego")
+    result_value, message = await run_opa_eval_async(
+        query=f"data.{rego_pkg_name}",
+        data_paths=[util_rego_path, rego_path, external_data_path],
+        input_data=input_data,
+        executable_name=executable_name,
+    )
+    eval_result = {
+        "value": result_value,
+        "message": message,
+    }
+    return eval_result
+
+
+def make_opa_eval_command(query: str, data_paths: list, executable_name: str = "opa", bundle_paths: list = None):
+    options = [f"--data {data_path}" for data_path in data_paths if data_path]
+    if bundle_paths:
+        options.extend([f"--bundle {bundle_path}" for bundle_path in bundle_paths if bundle_path])
+    options_str = " ".join(options)
+    return f"{executable_name} eval {options_str} --stdin-input '{query}'"
+
+
+def run_opa_eval(query: str, data_paths: list, input_data: str, executable_name: str = "opa", bundle_paths: list = None):
+    cmd_str = make_opa_eval_command(query=query, data_paths=data_paths, executable_name=executable_name, bundle_paths=bundle_paths)
     proc = subprocess.run(
         cmd_str,
         shell=True,
@@ -77,20 +131,38 @@ def eval_opa_policy(rego_path: str, input_data: str, external_data_path: str, ex
     )
     logger.debug(f"command: {cmd_str}")
     logger.debug(f"proc.input_data: {input_data}")
-    logger.debug(f"proc.stdout: {proc.stdout}")
-    logger.debug(f"proc.stderr: {proc.stderr}")
+    return parse_opa_eval_output(returncode=proc.returncode, stdout=proc.stdout, stderr=proc.stderr)
 
-    if proc.returncode != 0:
-        error = f"failed to run `opa eval` command; error details:\nSTDOUT: {proc.stdout}\nSTDERR: {proc.stderr}"
+
+async def run_opa_eval_async(query: str, data_paths: list, input_data: str, executable_name: str = "opa", bundle_paths: list = None):
+    cmd_str = make_opa_eval_command(query=query, data_paths=data_paths, executable_name=executable_name, bundle_paths=bundle_paths)
+    proc = await asyncio.create_subprocess_shell(
+        cmd_str,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate(input=input_data.encode())
+    logger.debug(f"command: {cmd_str}")
+    logger.debug(f"proc.input_data: {input_data}")
+    return parse_opa_eval_output(returncode=proc.returncode, stdout=stdout.decode(), stderr=stderr.decode())
+
+
+def parse_opa_eval_output(returncode: int, stdout: str, stderr: str):
+    logger.debug(f"proc.stdout: {stdout}")
+    logger.debug(f"proc.stderr: {stderr}")
+
+    if returncode != 0:
+        error = f"failed to run `opa eval` command; error details:\nSTDOUT: {stdout}\nSTDERR: {stderr}"
         raise ValueError(error)
 
-    result = json.loads(proc.stdout)
+    result = json.loads(stdout)
     if "result" not in result:
-        raise ValueError(f"`result` field does not exist in the output from `opa eval` command; raw output: {proc.stdout}")
+        raise ValueError(f"`result` field does not exist in the output from `opa eval` command; raw output: {stdout}")
 
     result_arr = result["result"]
     if not result_arr:
-        raise ValueError(f"`result` field in the output from `opa eval` command has no contents; raw output: {proc.stdout}")
+        raise ValueError(f"`result` field in the output from `opa eval` command has no contents; raw output: {stdout}")
 
     first_result = result_arr[0]
     if not first_result and "expressions" not in first_result:
@@ -102,11 +174,8 @@ def eval_opa_policy(rego_path: str, input_data: str, external_data_path: str, ex
 
     expression = expressions[0]
     result_value = expression.get("value", {})
-    eval_result = {
-        "value": result_value,
-        "message": proc.stderr,
-    }
-    return eval_result
+    # messages from `print()` in policies are written to stderr
+    return result_value, stderr
 
 
 def get_module_name_from_task(task):
@@ -136,15 +205,17 @@ def embed_module_info_with_galaxy(task, galaxy):
     if not galaxy:
         galaxy = {}
 
-    mappings = galaxy.get("module_name_mappings", {})
-
     module_fqcn = ""
     if "." in task.module:
         module_fqcn = task.module
     else:
-        found = mappings.get(task.module, [])
-        if found and found[0] and "." in found[0]:
-            module_fqcn = found[0]
+        if hasattr(galaxy, "find_module_fqcn"):
+            found_fqcn = galaxy.find_module_fqcn(task.module)
+        else:
+            found = galaxy.get("module_name_mappings", {}).get(task.module, [])
+            found_fqcn = found[0] if found and found[0] and "." in found[0] else ""
+        if found_fqcn:
+            module_fqcn = found_fqcn
             task.module_fqcn = module_fqcn
     if not task.module_info and module_fqcn and "." in module_fqcn:
         collection_name = ".".join(module_fqcn.split(".")[:2])
@@ -158,16 +229,110 @@ def embed_module_info_with_galaxy(task, galaxy):
     return
 
 
-def get_rego_main_package_name(rego_path: str):
-    pkg_name = ""
-    with open(rego_path, "r") as file:
-        prefix = "package "
-        for line in file:
+@dataclass
+class PolicyMetadata(object):
+    path: str = ""
+    package: str = ""
+    target: str = default_target_type
+    target_module: str = None
+    tags: list = None
+    content_hash: str = ""
+    # whether the policy reads the project-wide data in `input._agk` directly or via `resolve_var()`
+    uses_project_data: bool = False
+    # top-level names of the data documents referred by the policy (e.g. `galaxy` for `data.galaxy.modules`)
+    data_refs: list = None
+    # whether the policy calls `get_module_fqcn()` in utils.rego, which reads `data.galaxy`
+    uses_module_fqcn: bool = False
+    # attributes of `input._agk` which the policy refers to; None if the policy may read any part of the input
+    input_refs: list = None
+    # whether the policy may write `print()` outputs, directly or by a rule of another package
+    uses_print: bool = True
+    mtime_ns: int = 0
+    size: int = 0
+
+    @staticmethod
+    def load(policy_path: str):
+        stat = os.stat(policy_path)
+        with open(policy_path, "rb") as file:
+            raw = file.read()
+        content = raw.decode()
+
+        metadata = PolicyMetadata(
+            path=policy_path,
+            content_hash=hashlib.sha256(raw).hexdigest(),
+            uses_project_data="_agk" in content or "resolve_var(" in content,
+            data_refs=sorted(set(_data_ref_pattern.findall(content))),
+            uses_module_fqcn="get_module_fqcn" in content,
+            input_refs=detect_input_refs(content),
+            uses_print=_may_print(content),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+        )
+        pkg_prefix = "package "
+        target = None
+        found = set()
+        for line in content.splitlines():
             _line = line.strip()
-            if _line.startswith(prefix):
-                pkg_name = _line[len(prefix) :]
-                break
-    return pkg_name
+            if "package" not in found and _line.startswith(pkg_prefix):
+                metadata.package = _line[len(pkg_prefix) :]
+                found.add("package")
+                continue
+            for var_name in ["__target__", "__target_module__", "__tags__"]:
+                if var_name in found or var_name not in line:
+                    continue
+                parts = [p.strip() for p in line.split("=")]
+                if len(parts) != 2 or parts[0] != var_name:
+                    continue
+                if var_name == "__target__":
+                    target = parts[1].strip('"').strip("'")
+                elif var_name == "__target_module__":
+                    metadata.target_module = parts[1].strip('"').strip("'")
+                else:
+                    metadata.tags = json.loads(parts[1])
+                found.add(var_name)
+        if target:
+            metadata.target = target
+        return metadata
+
+
+def _may_print(content: str):
+    if "print(" in content:
+        return True
+    # `data.ansible_policy` is utils.rego and `data.galaxy` is the external data, which have no `print()`
+    return any(ref not in ["ansible_policy", "galaxy"] for ref in _data_ref_pattern.findall(content))
+
+
+def detect_input_refs(content: str):
+    # find the attributes of `input._agk` used in a policy by its `input.xxx` references.
+    # keys other than `_agk` are the data of the target itself, which is always kept in the input
+    refs = set()
+    for line in content.splitlines():
+        if line.lstrip().startswith("#"):
+            continue
+        for m in _input_ref_pattern.finditer(line):
+            keys = [k1 or k2 for k1, k2 in _input_ref_key_pattern.findall(m.group(1))]
+            # the whole input or `_agk` is referred, or it is accessed with a dynamic key like `input[k]`
+            if not keys or keys == ["_agk"]:
+                return None
+            if keys[0] == "_agk":
+                refs.add(keys[1])
+    if any(rule in content for rule in _project_data_rules):
+        refs.update(_project_data_refs)
+    return sorted(refs)
+
+
+def get_policy_metadata(policy_path: str):
+    stat = os.stat(policy_path)
+    metadata = _policy_metadata.get(policy_path)
+    if metadata and metadata.mtime_ns == stat.st_mtime_ns and metadata.size == stat.st_size:
+        return metadata
+    metadata = PolicyMetadata.load(policy_path)
+    _policy_metadata[policy_path] = metadata
+    return metadata
+
+
+def get_rego_main_package_name(rego_path: str):
+    return get_policy_metadata(rego_path).package
 
 
 def uncompress_file(fpath: str):
@@ -230,6 +395,77 @@ def load_external_data(ftype: str = "", fpath: str = ""):
     return ext_data
 
 
+# GalaxyKnowledgeBase is the galaxy data loaded from an external data file with an index for module name lookups
+@dataclass
+class GalaxyKnowledgeBase(object):
+    path: str = ""
+    mtime_ns: int = 0
+    size: int = 0
+    modules: dict = field(default_factory=dict)
+    module_name_mappings: dict = field(default_factory=dict)
+
+    # FQCN for each module short name, which is built at the first lookup
+    _fqcn_index: dict = None
+
+    def get(self, section: str, name: str, default: any = None):
+        section_data = getattr(self, section, None)
+        if not isinstance(section_data, dict):
+            return default
+        return section_data.get(name, default)
+
+    @staticmethod
+    def load(fpath: str):
+        stat = os.stat(fpath)
+        galaxy = load_galaxy_data(fpath=fpath)
+        kb = GalaxyKnowledgeBase(
+            path=fpath,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            modules=galaxy.get("modules", {}),
+            module_name_mappings=galaxy.get("module_name_mappings", {}),
+        )
+        return kb
+
+    def find_module_fqcn(self, module_name: str):
+        # the first FQCN in `module_name_mappings` like `rego/utils.rego`
+        if self._fqcn_index is None:
+            index = {}
+            for name, found in self.module_name_mappings.items():
+                if found and found[0] and "." in found[0]:
+                    index[name] = found[0]
+            self._fqcn_index = index
+        return self._fqcn_index.get(module_name, "")
+
+
+def get_knowledge_base(ftype: str = "", fpath: str = ""):
+    # the external data is loaded only once per process and it is reloaded when the file is modified
+    if ftype not in supported_external_data_types:
+        raise ValueError(f"`{ftype}` is not supported as external data")
+    if ftype != ExternalDataTypeGalaxy:
+        raise NotImplementedError
+    if not fpath:
+        return None
+
+    # a knowledge base file converted by `ansible_policy.knowledge_base` is looked up lazily without loading it
+    from ansible_policy.knowledge_base import is_knowledge_base_file, SQLiteGalaxyKnowledgeBase
+
+    kb_class = SQLiteGalaxyKnowledgeBase if is_knowledge_base_file(fpath) else GalaxyKnowledgeBase
+
+    if fpath.endswith(".tar.gz"):
+        new_fpath = fpath[:-7]
+        if not os.path.exists(new_fpath):
+            uncompress_file(fpath)
+        fpath = new_fpath
+
+    stat = os.stat(fpath)
+    kb = _knowledge_bases.get(fpath)
+    if kb and kb.mtime_ns == stat.st_mtime_ns and kb.size == stat.st_size:
+        return kb
+    kb = kb_class.load(fpath=fpath)
+    _knowledge_bases[fpath] = kb
+    return kb
+
+
 def match_str_expression(pattern: str, text: str):
     if not pattern:
         return True
@@ -244,36 +480,24 @@ def match_str_expression(pattern: str, text: str):
     return pattern == text
 
 
+def compile_str_expression(pattern: str):
+    # returns a function which matches a text with the same rule as `match_str_expression()`
+    if not pattern or pattern == "*":
+        return lambda text: True
+
+    if "*" in pattern:
+        compiled = re.compile(pattern.replace("*", ".*"))
+        return lambda text: compiled.match(text) is not None
+
+    return lambda text: pattern == text
+
+
 def detect_target_module_pattern(policy_path: str):
-    var_name = "__target_module__"
-    pattern = None
-    with open(policy_path, "r") as file:
-        for line in file:
-            if var_name in line:
-                parts = [p.strip() for p in line.split("=")]
-                if len(parts) != 2:
-                    continue
-                if parts[0] == var_name:
-                    pattern = parts[1].strip('"').strip("'")
-                    break
-    return pattern
+    return get_policy_metadata(policy_path).target_module
 
 
 def detect_target_type_pattern(policy_path: str):
-    var_name = "__target__"
-    pattern = None
-    with open(policy_path, "r") as file:
-        for line in file:
-            if var_name in line:
-                parts = [p.strip() for p in line.split("=")]
-                if len(parts) != 2:
-                    continue
-                if parts[0] == var_name:
-                    pattern = parts[1].strip('"').strip("'")
-                    break
-    if not pattern:
-        pattern = default_target_type
-    return pattern
+    return get_policy_metadata(policy_path).target
 
 
 def install_galaxy_target(target, target_type, output_dir, source_repository="", target_version=""):
@@ -350,18 +574,10 @@ def transpile_yml_policy(src: str, dst: str):
 
 
 def get_tags_from_rego_policy_file(policy_path: str):
-    var_name = "__tags__"
-    tags = None
-    with open(policy_path, "r") as file:
-        for line in file:
-            if var_name in line:
-                parts = [p.strip() for p in line.split("=")]
-                if len(parts) != 2:
-                    continue
-                if parts[0] == var_name:
-                    tags = json.loads(parts[1])
-                    break
-    return tags
+    tags = get_policy_metadata(policy_path).tags
+    if tags is None:
+        return None
+    return list(tags)
 
 
 def match_target_module(module_fqcn: str, rego_path: str):
@@ -429,60 +645,64 @@ def find_task_line_number(
     if not candidate_blocks:
         return None, None
 
-    reconstructed_yaml = ""
-    best_yaml_lines = ""
-    best_line_num_in_file = []
-    sorted_candidates = []
+    reconstructed_data = reconstruct_task_data(task_name=task_name, module_name=module_name, module_options=module_options, task_options=task_options)
+    yaml_lines, line_num_in_file = find_best_block(candidate_blocks=candidate_blocks, reconstructed_data=reconstructed_data)
+    return yaml_lines, line_num_in_file
+
+
+def reconstruct_task_data(task_name: str = "", module_name: str = "", module_options: dict = None, task_options: dict = None):
+    # reconstruct yaml data from the task data to calculate similarity (edit distance) with code blocks
+    reconstructed_data = [{}]
+    if task_name:
+        reconstructed_data[0]["name"] = task_name
+    reconstructed_data[0][module_name] = module_options
+    if isinstance(task_options, dict):
+        for key, val in task_options.items():
+            if key not in reconstructed_data[0]:
+                reconstructed_data[0][key] = val
+    return reconstructed_data
+
+
+def reconstruct_play_data(play_name: str = "", play_options: dict = None):
+    reconstructed_data = [{}]
+    if play_name:
+        reconstructed_data[0]["name"] = play_name
+    if isinstance(play_options, dict):
+        for key, val in play_options.items():
+            if key not in reconstructed_data[0]:
+                reconstructed_data[0][key] = val
+    return reconstructed_data
+
+
+def find_best_block(candidate_blocks: list, reconstructed_data: list):
+    # returns the (yaml_lines, line_num_in_file) of the candidate most similar to the reconstructed yaml
     if len(candidate_blocks) == 1:
-        best_yaml_lines = candidate_blocks[0][0]
-        best_line_num_in_file = candidate_blocks[0][1]
-    else:
-        # reconstruct yaml from the task data to calculate similarity (edit distance) later
-        reconstructed_data = [{}]
-        if task_name:
-            reconstructed_data[0]["name"] = task_name
-        reconstructed_data[0][module_name] = module_options
-        if isinstance(task_options, dict):
-            for key, val in task_options.items():
-                if key not in reconstructed_data[0]:
-                    reconstructed_data[0][key] = val
-
-        try:
-            reconstructed_yaml = yaml.safe_dump(reconstructed_data)
-        except Exception:
-            pass
-
-        # find best match by edit distance
-        if reconstructed_yaml:
-
-            def remove_comment_lines(s):
-                lines = s.splitlines()
-                updated = []
-                for line in lines:
-                    if line.strip().startswith("#"):
-                        continue
-                    updated.append(line)
-                return "\n".join(updated)
-
-            def calc_dist(s1, s2):
-                us1 = remove_comment_lines(s1)
-                us2 = remove_comment_lines(s2)
-                dist = Levenshtein.distance(us1, us2)
-                return dist
-
-            r = reconstructed_yaml
-            sorted_candidates = sorted(candidate_blocks, key=lambda x: calc_dist(r, x[0]))
-            best_yaml_lines = sorted_candidates[0][0]
-            best_line_num_in_file = sorted_candidates[0][1]
-        else:
-            # give up here if yaml reconstruction failed
-            # use the first candidate
-            best_yaml_lines = candidate_blocks[0][0]
-            best_line_num_in_file = candidate_blocks[0][1]
+        return candidate_blocks[0]
 
-    yaml_lines = best_yaml_lines
-    line_num_in_file = best_line_num_in_file
-    return yaml_lines, line_num_in_file
+    reconstructed_yaml = ""
+    try:
+        reconstructed_yaml = yaml.safe_dump(reconstructed_data)
+    except Exception:
+        pass
+
+    # give up here if yaml reconstruction failed
+    # use the first candidate
+    if not reconstructed_yaml:
+        return candidate_blocks[0]
+
+    # find best match by edit distance
+    def remove_comment_lines(s):
+        lines = s.splitlines()
+        updated = []
+        for line in lines:
+            if line.strip().startswith("#"):
+                continue
+            updated.append(line)
+        return "\n".join(updated)
+
+    r = remove_comment_lines(reconstructed_yaml)
+    sorted_candidates = sorted(candidate_blocks, key=lambda x: Levenshtein.distance(r, remove_comment_lines(x[0])))
+    return sorted_candidates[0]
 
 
 def _find_task_block(yaml_lines: list, start_line_num: int):
@@ -585,7 +805,7 @@ def find_play_line_number(
         if play_name:
             if play_name in line:
                 candidate_line_nums.append(i)
-        elif "hosts:":
+        elif "hosts:" in line:
             candidate_line_nums.append(i)
     if not candidate_line_nums:
         return None, None
@@ -600,58 +820,8 @@ def find_play_line_number(
     if not candidate_blocks:
         return None, None
 
-    reconstructed_yaml = ""
-    best_yaml_lines = ""
-    best_line_num_in_file = []
-    sorted_candidates = []
-    if len(candidate_blocks) == 1:
-        best_yaml_lines = candidate_blocks[0][0]
-        best_line_num_in_file = candidate_blocks[0][1]
-    else:
-        # reconstruct yaml from the play data to calculate similarity (edit distance) later
-        reconstructed_data = [{}]
-        if play_name:
-            reconstructed_data[0]["name"] = play_name
-        if isinstance(play_options, dict):
-            for key, val in play_options.items():
-                if key not in reconstructed_data[0]:
-                    reconstructed_data[0][key] = val
-
-        try:
-            reconstructed_yaml = yaml.safe_dump(reconstructed_data)
-        except Exception:
-            pass
-
-        # find best match by edit distance
-        if reconstructed_yaml:
-
-            def remove_comment_lines(s):
-                lines = s.splitlines()
-                updated = []
-                for line in lines:
-                    if line.strip().startswith("#"):
-                        continue
-                    updated.append(line)
-                return "\n".join(updated)
-
-            def calc_dist(s1, s2):
-                us1 = remove_comment_lines(s1)
-                us2 = remove_comment_lines(s2)
-                dist = Levenshtein.distance(us1, us2)
-                return dist
-
-            r = reconstructed_yaml
-            sorted_candidates = sorted(candidate_blocks, key=lambda x: calc_dist(r, x[0]))
-            best_yaml_lines = sorted_candidates[0][0]
-            best_line_num_in_file = sorted_candidates[0][1]
-        else:
-            # give up here if yaml reconstruction failed
-            # use the first candidate
-            best_yaml_lines = candidate_blocks[0][0]
-            best_line_num_in_file = candidate_blocks[0][1]
-
-    yaml_lines = best_yaml_lines
-    line_num_in_file = best_line_num_in_file
+    reconstructed_data = reconstruct_play_data(play_name=play_name, play_options=play_options)
+    yaml_lines, line_num_in_file = find_best_block(candidate_blocks=candidate_blocks, reconstructed_data=reconstructed_data)
     return yaml_lines, line_num_in_file
 
 
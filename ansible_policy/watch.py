@@ -0,0 +1,252 @@
+import os
+import time
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import List
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from ansible_policy.models import (
+    EvalTypeProject,
+    EvaluationResult,
+    IncrementalState,
+    PolicyEvaluator,
+    ResultDelta,
+    ResultFormatter,
+)
+from ansible_policy.cache import DecisionCache, default_decision_cache_size
+from ansible_policy.scan_cache import ScanCache
+from ansible_policy.utils import init_logger
+
+
+logger = init_logger(__name__, os.getenv("ANSIBLE_GK_LOG_LEVEL", "info"))
+
+# seconds to wait for more changes after a change, so that saving several files triggers only one evaluation
+default_watch_debounce = 0.2
+ignored_dir_names = [".git", "__pycache__", ".tox", ".venv"]
+# temporary files of editors
+ignored_file_suffixes = ["~", ".swp", ".swx", ".tmp"]
+ignored_file_prefixes = [".#"]
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        # a modification of a directory is notified together with the files in it
+        if event.is_directory and event.event_type == "modified":
+            return
+        paths = [event.src_path]
+        if getattr(event, "dest_path", ""):
+            paths.append(event.dest_path)
+        self.watcher.notify(paths)
+
+
+# FileWatcher collects the changed files under the watched paths until they become quiet
+@dataclass
+class FileWatcher(object):
+    paths: List[str] = field(default_factory=list)
+    # changes under these paths (e.g. cache directories) are ignored
+    ignored_paths: List[str] = field(default_factory=list)
+    debounce: float = default_watch_debounce
+
+    _observer: Observer = None
+    _changed: set = field(default_factory=set)
+    _last_changed_at: float = 0.0
+    _cond: threading.Condition = field(default_factory=threading.Condition)
+
+    def start(self):
+        handler = _ChangeHandler(self)
+        self._observer = Observer()
+        scheduled = set()
+        for path in self.paths:
+            # a single file is watched through its directory
+            watch_dir = path if os.path.isdir(path) else os.path.dirname(path)
+            if not watch_dir or watch_dir in scheduled or not os.path.isdir(watch_dir):
+                continue
+            self._observer.schedule(handler, watch_dir, recursive=os.path.isdir(path))
+            scheduled.add(watch_dir)
+        self._observer.start()
+        return
+
+    def stop(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        return
+
+    def is_target(self, path: str):
+        if any(path == p or path.startswith(p + "/") for p in self.ignored_paths):
+            return False
+        name = os.path.basename(path)
+        if any(name.endswith(s) for s in ignored_file_suffixes) or any(name.startswith(s) for s in ignored_file_prefixes):
+            return False
+        if any(part in ignored_dir_names for part in path.split("/")):
+            return False
+        for p in self.paths:
+            if path == p or (os.path.isdir(p) and path.startswith(p + "/")):
+                return True
+        return False
+
+    def notify(self, paths: List[str]):
+        paths = [os.path.abspath(path) for path in paths]
+        paths = [path for path in paths if self.is_target(path)]
+        if not paths:
+            return
+        with self._cond:
+            self._changed.update(paths)
+            self._last_changed_at = time.monotonic()
+            self._cond.notify_all()
+        return
+
+    def wait_for_changes(self):
+        # blocks until some files are changed and no more changes come for `debounce` seconds
+        with self._cond:
+            while True:
+                if self._changed:
+                    quiet = time.monotonic() - self._last_changed_at
+                    if quiet >= self.debounce:
+                        changed = sorted(self._changed)
+                        self._changed = set()
+                        return changed
+                    self._cond.wait(timeout=self.debounce - quiet)
+                else:
+                    self._cond.wait()
+
+
+# WatchSession keeps the evaluator and its caches resident, and evaluates the project again on changes.
+# the decisions of the inputs in the unchanged files are reused for the unchanged policies, and only the others are
+# evaluated. the project is still scanned again when a project file is changed, because the scanner cannot scan a part of it
+@dataclass
+class WatchSession(object):
+    evaluator: PolicyEvaluator = None
+    project_dir: str = ""
+    formatter: ResultFormatter = None
+    external_data_path: str = ""
+    variables_path: str = ""
+    # the decisions of the re-evaluated inputs are also cached by their content, e.g. for an edit which is reverted
+    decision_cache_size: int = default_decision_cache_size
+
+    result: EvaluationResult = None
+
+    _tmp_dir: tempfile.TemporaryDirectory = None
+
+    def __post_init__(self):
+        self.project_dir = os.path.abspath(self.project_dir)
+        if not self.evaluator.decision_cache and self.decision_cache_size > 0:
+            self.evaluator.decision_cache = DecisionCache(maxsize=self.decision_cache_size)
+        if not self.evaluator.incremental_state:
+            self.evaluator.incremental_state = IncrementalState()
+        if not self.evaluator.scan_cache:
+            # without `--cache-dir`, the scan results are kept only while watching; a change of policies does not scan the project again
+            self._tmp_dir = tempfile.TemporaryDirectory()
+            self.evaluator.scan_cache = ScanCache(cache_dir=self._tmp_dir.name)
+
+    def watched_paths(self):
+        paths = [self.project_dir]
+        for source in self.evaluator.sources:
+            if source.type == "path":
+                paths.append(os.path.abspath(source.source))
+        for path in [self.evaluator.config_path, self.external_data_path, self.variables_path]:
+            if path:
+                paths.append(os.path.abspath(path))
+        return paths
+
+    def ignored_paths(self):
+        paths = [self.evaluator.root_dir, self.evaluator.bundle_cache_dir, self.evaluator.persistent_cache_dir]
+        if self._tmp_dir:
+            paths.append(self._tmp_dir.name)
+        return [os.path.abspath(path) for path in paths if path]
+
+    def policy_dirs(self):
+        return [os.path.abspath(source.source) for source in self.evaluator.sources if source.type == "path"]
+
+    def run(self):
+        cache = self.evaluator.decision_cache
+        state = self.evaluator.incremental_state
+        state.policy_dirs = self.policy_dirs()
+        stats_before = cache.stats() if cache else {"hits": 0, "misses": 0}
+        persistent_hits_before = self.evaluator.persistent_cache.hits if self.evaluator.persistent_cache else 0
+        start = time.monotonic()
+        result = self.evaluator.run(
+            eval_type=EvalTypeProject,
+            project_dir=self.project_dir,
+            external_data_path=self.external_data_path,
+            variables_path=self.variables_path,
+        )
+        elapsed = time.monotonic() - start
+        stats = cache.stats() if cache else {"hits": 0, "misses": 0}
+        persistent_hits = self.evaluator.persistent_cache.hits if self.evaluator.persistent_cache else 0
+        delta = ResultDelta.from_results(previous=self.result, current=result)
+        # decisions of the previous run and the ones found in the decision caches are reused
+        delta.evaluated = state.evaluated
+        delta.reused = state.reused + stats["hits"] - stats_before["hits"] + (persistent_hits - persistent_hits_before)
+        delta.elapsed = elapsed
+        self.result = result
+        return result, delta
+
+    def on_change(self, changed_paths: List[str]):
+        logger.debug(f"changed files: {changed_paths}")
+        state = self.evaluator.incremental_state
+        state.add_changes(changed_paths)
+        if self.variables_path and os.path.abspath(self.variables_path) in changed_paths:
+            # the variables are used by all the inputs
+            state.invalidate()
+        if self.evaluator.update_policies(changed_paths):
+            logger.debug("policies are updated")
+        _, delta = self.run()
+        return delta
+
+    def close(self):
+        if self._tmp_dir:
+            self.evaluator.scan_cache.close()
+            self.evaluator.scan_cache = None
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
+        return
+
+
+def watch_project(
+    evaluator: PolicyEvaluator,
+    project_dir: str,
+    formatter: ResultFormatter,
+    external_data_path: str = "",
+    variables_path: str = "",
+    debounce: float = default_watch_debounce,
+    decision_cache_size: int = default_decision_cache_size,
+):
+    session = WatchSession(
+        evaluator=evaluator,
+        project_dir=project_dir,
+        formatter=formatter,
+        external_data_path=external_data_path,
+        variables_path=variables_path,
+        decision_cache_size=decision_cache_size,
+    )
+    watcher = FileWatcher(paths=session.watched_paths(), ignored_paths=session.ignored_paths(), debounce=debounce)
+    try:
+        # the first evaluation is reported in full, and the following ones as the changes of the findings
+        result, _ = session.run()
+        formatter.print(result=result)
+        watcher.start()
+        print(f"Watching {', '.join(watcher.paths)} for changes (Ctrl+C to stop)")
+        while True:
+            changed_paths = watcher.wait_for_changes()
+            try:
+                delta = session.on_change(changed_paths)
+            except Exception as exc:
+                # e.g. a file is saved in the middle of editing; the previous result is kept until the next change
+                logger.error(f"failed to evaluate the changes in {changed_paths}: {exc}")
+                continue
+            formatter.print_delta(delta=delta)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        session.close()
+    return session.result
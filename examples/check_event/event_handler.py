@@ -17,9 +17,13 @@ def load_event():
 def main():
     parser = argparse.ArgumentParser(description="TODO")
     parser.add_argument("--policy-dir", help="path to a directory containing policies to be evaluated")
+    parser.add_argument(
+        "--engine", default="subprocess", help="OPA engine type (`subprocess`, `server`, `wasm` or `native`, default to `subprocess`)"
+    )
+    parser.add_argument("--decision-cache-size", type=int, default=0, help="size of the in-memory decision cache (default to 0, disabled)")
     args = parser.parse_args()
 
-    evaluator = PolicyEvaluator(policy_dir=args.policy_dir)
+    evaluator = PolicyEvaluator(policy_dir=args.policy_dir, engine_type=args.engine, decision_cache_size=args.decision_cache_size)
     formatter = ResultFormatter(format_type=FORMAT_EVENT_STREAM, base_dir=os.getcwd())
     for event in load_event():
         result = evaluator.run(
@@ -1,6 +1,5 @@
 import os
 import logging
-import jsonpickle
 import argparse
 from flask import Flask, request
 from ansible_policy.models import (
@@ -10,6 +9,7 @@ from ansible_policy.models import (
     FORMAT_REST,
 )
 from ansible_policy.rego_data import APIRequest
+from ansible_policy.serializer import dumps
 
 
 app = Flask(__name__)
@@ -21,9 +21,11 @@ log.disabled = True
 
 parser = argparse.ArgumentParser(description="TODO")
 parser.add_argument("--policy-dir", help="path to a directory containing policies to be evaluated")
+parser.add_argument("--engine", default="subprocess", help="OPA engine type (`subprocess`, `server`, `wasm` or `native`, default to `subprocess`)")
+parser.add_argument("--decision-cache-size", type=int, default=0, help="size of the in-memory decision cache (default to 0, disabled)")
 args = parser.parse_args()
 
-evaluator = PolicyEvaluator(policy_dir=args.policy_dir)
+evaluator = PolicyEvaluator(policy_dir=args.policy_dir, engine_type=args.engine, decision_cache_size=args.decision_cache_size)
 formatter = ResultFormatter(format_type=FORMAT_REST, base_dir=os.getcwd())
 
 
@@ -54,7 +56,8 @@ def index():
     )
     formatter.print(result=result)
 
-    return jsonpickle.encode(result, make_refs=False)
+    # plain JSON without the `py/object` type tags of `jsonpickle.encode()`
+    return dumps(result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+from ansible_policy.bundle import compute_bundle_key, get_or_build_bundle
+
+
+fake_opa_script = """#!{python}
+import sys
+
+args = sys.argv[1:]
+if args[0] == "version":
+    print("Version: 0.0.0-test")
+elif args[0] == "build":
+    with open(args[args.index("--output") + 1], "w") as file:
+        file.write(" ".join(args))
+    with open({log_path!r}, "a") as file:
+        file.write("build\\n")
+"""
+
+
+@pytest.fixture
+def fake_opa(tmp_path):
+    # records `opa build` calls instead of building a bundle
+    path = tmp_path / "opa"
+    log_path = tmp_path / "build.log"
+    path.write_text(fake_opa_script.format(python=sys.executable, log_path=str(log_path)))
+    path.chmod(0o755)
+    return str(path), log_path
+
+
+def build_count(log_path):
+    return len(log_path.read_text().splitlines()) if log_path.exists() else 0
+
+
+def write_policy(path, package: str, rule: str = "allow = true"):
+    path.write_text(f"package {package}\n\n{rule}\n")
+    return str(path)
+
+
+def test_bundle_key_depends_on_inputs(tmp_path):
+    policy_path = write_policy(tmp_path / "a.rego", "a")
+    data_path = tmp_path / "data.json"
+    data_path.write_text('{"galaxy": {}}')
+    kwargs = dict(files=[policy_path, str(data_path)], opa_version="0.0.0", optimize_level=1, entrypoints=["a"])
+    key = compute_bundle_key(**kwargs)
+    # the order of the files does not matter
+    assert compute_bundle_key(**dict(kwargs, files=[str(data_path), policy_path])) == key
+
+    assert compute_bundle_key(**dict(kwargs, optimize_level=0)) != key
+    assert compute_bundle_key(**dict(kwargs, entrypoints=["a", "b"])) != key
+    assert compute_bundle_key(**dict(kwargs, opa_version="0.0.1")) != key
+    assert compute_bundle_key(**dict(kwargs, target="wasm")) != key
+
+    write_policy(tmp_path / "a.rego", "a", rule="allow = false")
+    assert compute_bundle_key(**kwargs) != key
+    write_policy(tmp_path / "a.rego", "a")
+    assert compute_bundle_key(**kwargs) == key
+
+    data_path.write_text('{"galaxy": {"modules": []}}')
+    assert compute_bundle_key(**kwargs) != key
+
+
+def test_bundle_is_rebuilt_only_when_inputs_change(tmp_path, fake_opa):
+    executable_name, log_path = fake_opa
+    cache_dir = str(tmp_path / "cache")
+    policy_path = write_policy(tmp_path / "a.rego", "a")
+    data_path = tmp_path / "data.json"
+    data_path.write_text('{"galaxy": {}}')
+
+    def get_bundle(policy_files=None, external_data_path=str(data_path), optimize_level=1):
+        return get_or_build_bundle(
+            policy_files=policy_files or [policy_path],
+            external_data_path=external_data_path,
+            cache_dir=cache_dir,
+            optimize_level=optimize_level,
+            executable_name=executable_name,
+        )
+
+    bundle = get_bundle()
+    assert build_count(log_path) == 1
+    assert os.path.exists(bundle.path)
+
+    # an unchanged input reuses the cached bundle
+    assert get_bundle().path == bundle.path
+    assert build_count(log_path) == 1
+
+    keys = {bundle.key}
+    write_policy(tmp_path / "a.rego", "a", rule="allow = false")
+    keys.add(get_bundle().key)
+    data_path.write_text('{"galaxy": {"modules": []}}')
+    keys.add(get_bundle().key)
+    keys.add(get_bundle(external_data_path="").key)
+    keys.add(get_bundle(optimize_level=0).key)
+    # another policy changes the entrypoints and the batch wrapper
+    keys.add(get_bundle(policy_files=[policy_path, write_policy(tmp_path / "b.rego", "b")]).key)
+    assert len(keys) == 6
+    assert build_count(log_path) == 6
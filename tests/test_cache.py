@@ -0,0 +1,75 @@
+from ansible_policy import cache
+from ansible_policy.cache import DecisionCache, PersistentDecisionCache, make_input_hash
+
+
+class Module(object):
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Input(object):
+    def __init__(self, module_name: str):
+        self.module_name = module_name
+
+    def to_dict(self):
+        return {"module": Module(self.module_name), "_agk": Module("project")}
+
+
+def test_input_hash_is_stable_for_objects():
+    # objects with the default repr() are hashed by their attributes, not by their memory address
+    assert make_input_hash(Input("ansible.builtin.copy")) == make_input_hash(Input("ansible.builtin.copy"))
+    assert make_input_hash(Input("ansible.builtin.copy")) != make_input_hash(Input("ansible.builtin.file"))
+
+
+def test_decision_cache_evicts_least_recently_used():
+    decision_cache = DecisionCache(maxsize=2)
+    decision_cache.put("a", {"value": 1})
+    decision_cache.put("b", {"value": 2})
+    # `a` is used after `b`, so `b` is evicted by `c`
+    assert decision_cache.get("a") == {"value": 1}
+    decision_cache.put("c", {"value": 3})
+    assert decision_cache.get("b") is None
+    assert decision_cache.get("a") == {"value": 1}
+    assert decision_cache.get("c") == {"value": 3}
+    assert decision_cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1, "hit_rate": 0.75}
+
+
+def test_decision_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    decision_cache = DecisionCache(maxsize=10, ttl=60)
+    decision_cache.put("a", {"value": 1})
+    now[0] += 30
+    decision_cache.put("b", {"value": 2})
+    now[0] += 40
+    assert decision_cache.get("a") is None
+    assert decision_cache.get("b") == {"value": 2}
+    assert decision_cache.stats()["size"] == 1
+
+    # entries never expire without a TTL
+    decision_cache = DecisionCache(maxsize=10)
+    decision_cache.put("a", {"value": 1})
+    now[0] += 10**6
+    assert decision_cache.get("a") == {"value": 1}
+
+
+def test_persistent_decision_cache_is_kept_across_instances(tmp_path):
+    decision_cache = PersistentDecisionCache(cache_dir=str(tmp_path), buffer_size=2)
+    decision_cache.put("a", {"value": {"deny": True}, "message": "m\n"})
+    decision_cache.put("b", {"value": {"deny": False}, "message": ""})
+    decision_cache.put("c", {"value": {}, "message": ""})
+    decision_cache.close()
+
+    decision_cache = PersistentDecisionCache(cache_dir=str(tmp_path))
+    assert decision_cache.get("a") == {"value": {"deny": True}, "message": "m\n"}
+    assert decision_cache.get("b") == {"value": {"deny": False}, "message": ""}
+    # the buffered entry is written by `close()`
+    assert decision_cache.get("c") == {"value": {}, "message": ""}
+    assert decision_cache.get("d") is None
+    decision_cache.put("a", {"value": {"deny": False}, "message": ""})
+    decision_cache.close()
+
+    decision_cache = PersistentDecisionCache(cache_dir=str(tmp_path))
+    assert decision_cache.get("a") == {"value": {"deny": False}, "message": ""}
+    assert decision_cache.stats() == {"size": 3, "hits": 1, "misses": 0, "hit_rate": 1.0}
+    decision_cache.close()
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from ansible_policy.bundle import batch_marker
+from ansible_policy.engine import ServerEngine, make_batch_eval_results, parse_server_log, split_batch_messages
+from ansible_policy.utils import PolicyMetadata, parse_opa_eval_output
+
+
+def log_line(**entry):
+    return (json.dumps(entry) + "\n").encode()
+
+
+def request_log(path: str, req_id: int):
+    received = log_line(level="info", msg="Received request.", req_id=req_id, req_method="POST", req_path=path)
+    sent = log_line(level="info", msg="Sent response.", req_id=req_id, req_path=path, resp_status=200)
+    return received, sent
+
+
+def print_log(msg: str, req_id: int):
+    return log_line(level="info", msg=msg, line="policy.rego:10", req_id=req_id)
+
+
+def test_parse_server_log_keeps_incomplete_line():
+    received, sent = request_log("/v1/data/p", 1)
+    data = received + print_log("hello", 1) + b"not json\n" + sent + b'{"level":"info","msg":"par'
+    entries, rest = parse_server_log(data)
+    assert [e["msg"] for e in entries] == ["hello", "Sent response."]
+    assert rest == b'{"level":"info","msg":"par'
+
+
+class CannedServerEngine(ServerEngine):
+    def __init__(self, chunks: list):
+        super().__init__()
+        self.chunks = chunks
+
+    def _read_stderr(self):
+        return self.chunks.pop(0) if self.chunks else b""
+
+    def is_running(self):
+        return True
+
+
+def test_print_messages_until_own_response():
+    received, sent = request_log("/v1/data/p", 2)
+    other_received, other_sent = request_log("/v1/data/q", 3)
+    # a decision without print outputs is answered while the decision of `p` is in flight
+    chunks = [received + print_log("first", 2) + other_received, other_sent + print_log("sec", 2)[:20], print_log("sec", 2)[20:] + sent]
+    engine = CannedServerEngine(chunks=chunks)
+    engine._waiting_path = "/v1/data/p"
+    messages = engine._read_print_messages(path="/v1/data/p", wait=False)
+    assert messages == ["first"]
+    messages += engine._read_print_messages(path="/v1/data/p", wait=False)
+    messages += engine._read_print_messages(path="/v1/data/p", wait=False)
+    assert messages == ["first", "sec"]
+
+
+def test_log_is_dropped_without_waiting_decision():
+    engine = CannedServerEngine(chunks=[print_log("stale", 1)])
+    engine._read_log()
+    assert engine._log_entries == []
+
+
+def test_policy_may_print(tmp_path):
+    cases = {
+        "print.rego": 'package p\nallow = true if {\n    print("ok")\n}\n',
+        "fqcn.rego": "package p\nimport data.ansible_policy.get_module_fqcn\nallow = data.galaxy.modules\n",
+        "other.rego": "package p\nallow = data.other_policy.allow\n",
+    }
+    uses_print = {}
+    for name, content in cases.items():
+        path = tmp_path / name
+        path.write_text(content)
+        uses_print[name] = PolicyMetadata.load(str(path)).uses_print
+    assert uses_print == {"print.rego": True, "fqcn.rego": False, "other.rego": True}
+
+
+def batch_output(decisions: dict):
+    return json.dumps({"result": [{"expressions": [{"value": decisions, "text": "data.batch.results"}]}]})
+
+
+def test_split_batch_messages():
+    lines = [
+        "a message before any marker",
+        f"{batch_marker} 0 pkg_a",
+        "a0",
+        f"{batch_marker} 0 pkg_b",
+        f"{batch_marker} 1 pkg_a",
+        "first line",
+        "second line",
+        f"{batch_marker} broken",
+        "a message after a broken marker",
+        f"{batch_marker} 10 pkg_a",
+        "a10",
+    ]
+    assert split_batch_messages(lines) == {
+        (0, "pkg_a"): "a0\n",
+        (1, "pkg_a"): "first line\nsecond line\n",
+        (10, "pkg_a"): "a10\n",
+    }
+    # a multi-line message is a single entry in the OPA server log
+    assert split_batch_messages([f"{batch_marker} 0 pkg_a", "first line\nsecond line"]) == {(0, "pkg_a"): "first line\nsecond line\n"}
+
+
+def test_batch_eval_results_from_opa_output():
+    # `opa eval` prints the markers and the messages of the policies to stderr in the order of evaluation
+    stderr = "\n".join(
+        [
+            f"{batch_marker} 0 pkg_a",
+            "task0 is denied",
+            f"{batch_marker} 0 pkg_b",
+            f"{batch_marker} 1 pkg_a",
+            f"{batch_marker} 2 pkg_a",
+            "task2 is denied",
+            "because of a multi-line message",
+            f"{batch_marker} 2 pkg_b",
+            "task2 is warned",
+        ]
+    )
+    decisions = {
+        "0": {"pkg_a": {"deny": True}, "pkg_b": {"deny": False}},
+        "1": {"pkg_a": {"deny": False}},
+        "2": {"pkg_a": {"deny": True}, "pkg_b": {"warn": True}},
+    }
+    result_value, stderr = parse_opa_eval_output(returncode=0, stdout=batch_output(decisions), stderr=stderr + "\n")
+    batch_items = [("{}", ["pkg_a", "pkg_b"]), ("{}", ["pkg_a"]), ("{}", ["pkg_a", "pkg_b"])]
+
+    eval_results = make_batch_eval_results(result_value=result_value, batch_items=batch_items, lines=stderr.splitlines())
+    assert eval_results == [
+        {
+            "pkg_a": {"value": {"deny": True}, "message": "task0 is denied\n"},
+            "pkg_b": {"value": {"deny": False}, "message": ""},
+        },
+        {
+            "pkg_a": {"value": {"deny": False}, "message": ""},
+        },
+        {
+            "pkg_a": {"value": {"deny": True}, "message": "task2 is denied\nbecause of a multi-line message\n"},
+            "pkg_b": {"value": {"warn": True}, "message": "task2 is warned\n"},
+        },
+    ]
+
+
+def test_batch_eval_results_without_decision():
+    with pytest.raises(ValueError):
+        make_batch_eval_results(result_value={"0": {}}, batch_items=[("{}", ["pkg_a"])], lines=[])
+    with pytest.raises(ValueError):
+        make_batch_eval_results(result_value=[], batch_items=[("{}", ["pkg_a"])], lines=[])
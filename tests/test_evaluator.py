@@ -0,0 +1,76 @@
+import asyncio
+import os
+import shutil
+import sys
+
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+
+from ansible_policy import eval_policy  # noqa: E402
+from ansible_policy.models import PolicyEvaluator  # noqa: E402
+
+
+examples_dir = os.path.join(os.path.dirname(__file__), "..", "examples", "check_project")
+policy_dir = os.path.join(examples_dir, "policies")
+
+requires_opa = pytest.mark.skipif(not shutil.which("opa"), reason="`opa` command is not available")
+
+
+def findings(result):
+    found = []
+    for f in result.files:
+        for p in f.policies:
+            for t in p.targets:
+                found.append((f.path, p.policy_name, t.name, t.validated, t.action_type, t.message))
+    return sorted(found, key=str)
+
+
+def run_kwargs():
+    return dict(eval_type="project", project_dir=examples_dir)
+
+
+@requires_opa
+def test_run_in_running_loop(tmp_path):
+    evaluator = PolicyEvaluator(policy_dir=policy_dir, root_dir=str(tmp_path / "root"))
+    expected = evaluator.run(**run_kwargs())
+
+    async def run_in_loop():
+        # `run()` cannot use `asyncio.run()` here, so it evaluates on another thread
+        return evaluator.run(**run_kwargs())
+
+    result = asyncio.run(run_in_loop())
+    assert findings(result) == findings(expected)
+    assert result.get_summary() == expected.get_summary()
+
+
+@requires_opa
+def test_concurrent_runs_are_same_as_sequential(tmp_path):
+    sequential = PolicyEvaluator(policy_dir=policy_dir, root_dir=str(tmp_path / "sequential"))
+    expected = sequential.run(**run_kwargs())
+
+    evaluator = PolicyEvaluator(policy_dir=policy_dir, root_dir=str(tmp_path / "concurrent"), concurrency=4)
+    result = evaluator.run(**run_kwargs())
+    assert findings(result) == findings(expected)
+
+    async def run_concurrently():
+        return await asyncio.gather(*[evaluator.run_async(**run_kwargs()) for _ in range(3)])
+
+    for result in asyncio.run(run_concurrently()):
+        assert findings(result) == findings(expected)
+        assert result.get_summary() == expected.get_summary()
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "x"])
+def test_jobs_must_be_positive(value, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["ansible-policy", "-p", examples_dir, "--jobs", value])
+    with pytest.raises(SystemExit) as excinfo:
+        eval_policy.main()
+    # argparse exits with 2 on an invalid argument
+    assert excinfo.value.code == 2
+
+
+@pytest.mark.parametrize("kwargs", [{"workers": 0}, {"concurrency": 0}, {"concurrency": -1}])
+def test_evaluator_rejects_non_positive_parallelism(kwargs, tmp_path):
+    with pytest.raises(ValueError):
+        PolicyEvaluator(policy_dir=policy_dir, root_dir=str(tmp_path / "root"), **kwargs)
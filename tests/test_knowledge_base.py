@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from ansible_policy.knowledge_base import SQLiteGalaxyKnowledgeBase, convert_galaxy_data, make_reduced_opa_data
+from ansible_policy.utils import GalaxyKnowledgeBase, PolicyMetadata, run_opa_eval
+
+
+util_rego_path = os.path.join(os.path.dirname(__file__), "..", "ansible_policy", "rego", "utils.rego")
+
+galaxy = {
+    "modules": {
+        "ansible.builtin.copy": {"fqcn": "ansible.builtin.copy", "collection": "ansible.builtin"},
+        "community.general.ufw": {"fqcn": "community.general.ufw", "collection": "community.general"},
+        "ansible.posix.mount": {"fqcn": "ansible.posix.mount", "collection": "ansible.posix"},
+    },
+    "module_name_mappings": {
+        "copy": ["ansible.builtin.copy"],
+        "ufw": ["community.general.ufw"],
+        "mount": ["ansible.posix.mount", "community.general.mount"],
+    },
+    "collections": ["ansible.builtin", "community.general", "ansible.posix"],
+}
+
+# modules of the evaluated tasks, in short names, FQCNs and unknown names
+task_modules = ["copy", "community.general.ufw", "unknown_module"]
+
+fqcn_policy = """package check_module_fqcn
+
+import future.keywords.if
+import data.ansible_policy.get_module_fqcn
+
+fqcn := get_module_fqcn(input._agk.task)
+"""
+
+
+def get_module_fqcn(galaxy_data: dict, module: str):
+    # the same lookups as `get_module_fqcn()` in utils.rego
+    if module in galaxy_data.get("modules", {}):
+        return galaxy_data["modules"][module]["fqcn"]
+    if module in galaxy_data.get("module_name_mappings", {}):
+        return galaxy_data["module_name_mappings"][module][0]
+    return None
+
+
+@pytest.fixture
+def galaxy_path(tmp_path):
+    path = tmp_path / "galaxy.json"
+    path.write_text(json.dumps({"galaxy": galaxy}))
+    return str(path)
+
+
+@pytest.fixture
+def policy_path(tmp_path):
+    path = tmp_path / "check_module_fqcn.rego"
+    path.write_text(fqcn_policy)
+    return str(path)
+
+
+def load_kbs(galaxy_path: str, tmp_path):
+    kb_path = str(tmp_path / "galaxy.kb.sqlite")
+    convert_galaxy_data(input_path=galaxy_path, output_path=kb_path)
+    return [GalaxyKnowledgeBase.load(fpath=galaxy_path), SQLiteGalaxyKnowledgeBase.load(fpath=kb_path)]
+
+
+def test_reduced_data_for_get_module_fqcn(galaxy_path, policy_path, tmp_path):
+    # the policy gets the reduced data because it refers to no data other than `get_module_fqcn()`
+    metadata = PolicyMetadata.load(policy_path)
+    assert metadata.uses_module_fqcn is True
+    assert metadata.data_refs == ["ansible_policy"]
+
+    for kb in load_kbs(galaxy_path, tmp_path):
+        data_path = make_reduced_opa_data(kb=kb, module_names=task_modules, cache_dir=str(tmp_path / "cache"))
+        with open(data_path, "r") as file:
+            reduced = json.load(file)["galaxy"]
+        for module in task_modules:
+            assert get_module_fqcn(reduced, module) == get_module_fqcn(galaxy, module)
+        assert reduced == {
+            "modules": {"community.general.ufw": galaxy["modules"]["community.general.ufw"]},
+            "module_name_mappings": {"copy": ["ansible.builtin.copy"]},
+        }
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="`opa` command is not available")
+def test_reduced_data_gives_same_decisions(galaxy_path, policy_path, tmp_path):
+    kb = GalaxyKnowledgeBase.load(fpath=galaxy_path)
+    reduced_path = make_reduced_opa_data(kb=kb, module_names=task_modules, cache_dir=str(tmp_path / "cache"))
+    for module in task_modules:
+        input_data = json.dumps({"module": module, "_agk": {"task": {"module": module}}})
+        results = []
+        for data_path in [galaxy_path, reduced_path]:
+            result_value, _ = run_opa_eval(query="data.check_module_fqcn", data_paths=[util_rego_path, policy_path, data_path], input_data=input_data)
+            results.append(result_value)
+        assert results[0] == results[1]
+        assert results[0].get("fqcn") == get_module_fqcn(galaxy, module)
+
+
+def test_unknown_data_refs_keep_full_data(galaxy_path, policy_path, tmp_path, monkeypatch):
+    pytest.importorskip("ansible_content_capture")
+    from ansible_policy.models import PolicyEvaluator
+
+    # `PolicyEvaluator` only checks that the `opa` command exists
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "opa").write_text("#!/bin/sh\n")
+    (bin_dir / "opa").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    evaluator = PolicyEvaluator(engine_type="subprocess", root_dir=str(tmp_path / "root"), bundle_cache_dir=str(tmp_path / "cache"))
+    kwargs = dict(policy_files=[policy_path], opa_data_path=galaxy_path, external_data_path=galaxy_path, input_data_dict={})
+    reduced_path = evaluator.reduce_opa_data(**kwargs)
+    assert reduced_path != galaxy_path
+    assert os.path.dirname(reduced_path) == str(tmp_path / "cache")
+
+    # metadata without the references, e.g. made by hand, is not given the reduced data
+    evaluator.policy_metadata[policy_path] = PolicyMetadata(path=policy_path, package="check_module_fqcn", uses_module_fqcn=True)
+    assert evaluator.reduce_opa_data(**kwargs) == galaxy_path
+    assert evaluator.make_input_refs([evaluator.policy_metadata[policy_path]]) == {policy_path: None}
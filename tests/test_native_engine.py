@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import pytest
+
+from ansible_policy.engine import go_sprintf
+
+
+examples_dir = os.path.join(os.path.dirname(__file__), "..", "examples", "check_project")
+
+
+def test_sprintf_values():
+    assert go_sprintf("%v and %s", ["a", "b"]) == "a and b"
+    assert go_sprintf("%v", [["x", 1, True]]) == '["x", 1, true]'
+    assert go_sprintf("%d%%", [42]) == "42%"
+    assert go_sprintf("%v %v", ["a"]) == "a %!v(MISSING)"
+
+
+def test_sprintf_object_keys_are_sorted():
+    # OPA prints objects with their keys sorted
+    assert go_sprintf("%v", [{"b": 1, "a": {"d": None, "c": "x"}}]) == '{"a": {"c": "x", "d": null}, "b": 1}'
+
+
+def findings(result):
+    found = []
+    for f in result.files:
+        for p in f.policies:
+            for t in p.targets:
+                found.append((f.path, p.policy_name, t.name, t.validated, t.action_type, t.message))
+    return sorted(found, key=str)
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="`opa` command is not available")
+def test_native_messages_match_opa(tmp_path):
+    pytest.importorskip("ansible_content_capture")
+    from ansible_policy.models import PolicyEvaluator
+
+    policy_dir = os.path.join(examples_dir, "policies")
+    results = {}
+    for engine_type in ["subprocess", "native"]:
+        evaluator = PolicyEvaluator(policy_dir=policy_dir, engine_type=engine_type, root_dir=str(tmp_path / engine_type))
+        results[engine_type] = evaluator.run(eval_type="project", project_dir=examples_dir)
+    assert findings(results["native"]) == findings(results["subprocess"])
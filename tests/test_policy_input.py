@@ -0,0 +1,141 @@
+import copy
+import json
+
+import jsonpickle
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+
+from ansible_policy.rego_data import (  # noqa: E402
+    InputTypePlay,
+    InputTypeTask,
+    Play,
+    Playbook,
+    PolicyInput,
+    PolicyInputEncoder,
+    Role,
+    Task,
+    TaskFile,
+    process_input_data_with_external_data,
+)
+
+
+def make_task(name: str, module: str, filepath: str):
+    yaml_lines = f"- name: {name}\n  {module}:\n    src: '{{{{ src }}}}'\n"
+    return Task(key=f"task {filepath}#{name}", name=name, module=module, filepath=filepath, yaml_lines=yaml_lines, line_num_in_file=[1, 3])
+
+
+def make_base_input():
+    # a project with tasks in a playbook, a task file and a role, like the result of `PolicyInput.from_scan_result()`
+    play = Play(key="play playbook.yml#play:[0]", name="play", filepath="playbook.yml", options={"hosts": "all"})
+    play.tasks = [make_task("copy", "copy", "playbook.yml")]
+    playbook = Playbook(key="playbook playbook.yml", name="playbook.yml", filepath="playbook.yml", plays=[play])
+    playbook.tasks = [make_task("copy", "copy", "playbook.yml"), make_task("file", "ansible.builtin.file", "playbook.yml")]
+    taskfile = TaskFile(key="taskfile tasks.yml", name="tasks.yml", filepath="tasks.yml", tasks=[make_task("pkg", "package", "tasks.yml")])
+    role_taskfile = TaskFile(key="taskfile roles/r/tasks/main.yml", name="main.yml", filepath="roles/r/tasks/main.yml")
+    role_taskfile.tasks = [make_task("unknown", "unknown_module", "roles/r/tasks/main.yml")]
+    role = Role(key="role r", name="r", filepath="roles/r", taskfiles={"main.yml": role_taskfile})
+    return PolicyInput(
+        type="project",
+        source={"type": "project"},
+        playbooks={playbook.filepath: playbook},
+        taskfiles={taskfile.filepath: taskfile},
+        roles={role.filepath: role},
+        variables={"src": "a.txt"},
+    )
+
+
+def all_tasks(base_input: PolicyInput):
+    tasks = []
+    for playbook in base_input.playbooks.values():
+        tasks.extend(playbook.tasks)
+    for taskfile in base_input.taskfiles.values():
+        tasks.extend(taskfile.tasks)
+    for role in base_input.roles.values():
+        for taskfile in role.taskfiles.values():
+            tasks.extend(taskfile.tasks)
+    return tasks
+
+
+def make_baseline_inputs(base_input: PolicyInput):
+    # each input was a deep copy of the project data before the project data was shared
+    inputs = []
+    for task in all_tasks(base_input):
+        p_input = copy.deepcopy(base_input)
+        p_input.type = InputTypeTask
+        p_input.task = task
+        inputs.append(p_input)
+    for play in base_input.playbooks["playbook.yml"].plays:
+        p_input = copy.deepcopy(base_input)
+        p_input.type = InputTypePlay
+        p_input.play = play
+        inputs.append(p_input)
+    return inputs
+
+
+def make_inputs(base_input: PolicyInput):
+    inputs = PolicyInput.from_scan_result(project=None, input_type=InputTypeTask, base_input=base_input)
+    inputs += PolicyInput.from_scan_result(project=None, input_type=InputTypePlay, base_input=base_input)
+    return inputs
+
+
+@pytest.fixture
+def galaxy_path(tmp_path):
+    path = tmp_path / "galaxy.json"
+    path.write_text(json.dumps({"galaxy": {"module_name_mappings": {"copy": ["ansible.builtin.copy"], "package": ["ansible.builtin.package"]}}}))
+    return str(path)
+
+
+def test_inputs_are_same_as_deep_copied_inputs(galaxy_path):
+    expected_inputs = make_baseline_inputs(make_base_input())
+    inputs = make_inputs(make_base_input())
+    assert len(inputs) == len(expected_inputs)
+
+    # module info is embedded after all the inputs are made, as in `PolicyEvaluator`
+    for input_list in [expected_inputs, inputs]:
+        for input_data in input_list:
+            if input_data.type == InputTypeTask:
+                process_input_data_with_external_data(InputTypeTask, input_data, galaxy_path)
+
+    for input_data, expected in zip(inputs, expected_inputs):
+        assert input_data.to_json() == expected.to_json()
+
+
+def test_module_info_is_not_embedded_into_project_data(galaxy_path):
+    base_input = make_base_input()
+    inputs = make_inputs(base_input)
+    for input_data in inputs:
+        if input_data.type == InputTypeTask:
+            process_input_data_with_external_data(InputTypeTask, input_data, galaxy_path)
+
+    assert inputs[0].task.module_fqcn == "ansible.builtin.copy"
+    assert all(not task.module_fqcn and not task.module_info for task in all_tasks(base_input))
+
+
+@pytest.mark.parametrize("agk_refs", [None, [], ["task"], ["playbooks", "taskfiles", "variables"]])
+def test_input_encoder_is_same_as_to_json(agk_refs):
+    encoder = PolicyInputEncoder()
+    inputs = make_inputs(make_base_input())
+    # non-ASCII characters and floats are written by json, not by orjson
+    inputs[0].variables = {"src": "fichier é", "ratio": 0.5}
+    for _ in range(2):
+        for input_data in inputs:
+            expected = jsonpickle.encode(input_data.to_dict(agk_refs=agk_refs), unpicklable=False, make_refs=False, separators=(",", ":"))
+            assert input_data.to_json(agk_refs=agk_refs) == expected
+            assert encoder.encode(input_data, agk_refs=agk_refs) == expected
+
+
+def test_input_encoder_is_not_stale_for_new_project():
+    encoder = PolicyInputEncoder()
+    inputs = make_inputs(make_base_input())
+    for input_data in inputs:
+        encoder.encode(input_data)
+    del inputs
+
+    # the objects of the previous project are kept by the encoder, so their ids are not reused by the new project
+    for _ in range(3):
+        base_input = make_base_input()
+        base_input.variables = {"src": "b.txt"}
+        base_input.playbooks["playbook.yml"].tasks[0].name = "copy b"
+        for input_data in make_inputs(base_input):
+            assert encoder.encode(input_data) == input_data.to_json()
@@ -0,0 +1,81 @@
+import pytest
+
+from ansible_policy.utils import PolicyMetadata, detect_input_refs
+
+
+policy_header = """package check_task
+
+import future.keywords.if
+import data.ansible_policy.resolve_var
+"""
+
+
+def load_metadata(tmp_path, body: str):
+    path = tmp_path / "policy.rego"
+    path.write_text(policy_header + body)
+    return PolicyMetadata.load(str(path))
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        # the whole input is referred or passed to a function
+        "deny = true if {\n    some key in object.keys(input)\n}\n",
+        "deny = true if {\n    count(input) > 0\n}\n",
+        # the whole project data
+        "deny = true if {\n    x := input._agk\n}\n",
+        'deny = true if {\n    x := input["_agk"]\n}\n',
+        # dynamic keys
+        'deny = true if {\n    key := "_agk"\n    input[key].task\n}\n',
+        "deny = true if {\n    some name\n    input._agk[name]\n}\n",
+    ],
+)
+def test_full_input_refs(body):
+    assert detect_input_refs(policy_header + body) is None
+
+
+def test_static_input_refs(tmp_path):
+    body = """
+deny = true if {
+    input.become
+    input._agk.task.module == "shell"
+    input["_agk"]["playbooks"]
+    # input._agk is not referred in a comment
+}
+"""
+    metadata = load_metadata(tmp_path, body)
+    # `input.become` is the data of the target, which is always kept
+    assert metadata.input_refs == ["playbooks", "task"]
+    assert metadata.uses_project_data is True
+
+
+def test_input_refs_of_target_only(tmp_path):
+    metadata = load_metadata(tmp_path, 'deny = true if {\n    input.module == "shell"\n}\n')
+    assert metadata.input_refs == []
+    assert metadata.uses_project_data is False
+    assert metadata.data_refs == ["ansible_policy"]
+
+
+def test_input_refs_of_resolve_var(tmp_path):
+    # `resolve_var()` reads the variables in the project data
+    metadata = load_metadata(tmp_path, 'deny = true if {\n    x := resolve_var("{{ pkg }}", input._agk.task)\n}\n')
+    assert metadata.input_refs == ["playbooks", "task", "taskfiles", "variables"]
+    assert metadata.uses_project_data is True
+
+
+def test_data_refs(tmp_path):
+    body = """
+import data.ansible_policy.get_module_fqcn
+
+deny = true if {
+    fqcn := get_module_fqcn(input._agk.task)
+    data.galaxy.modules[fqcn]
+    data.other_policy.deny
+    input.metadata.data.name
+}
+"""
+    metadata = load_metadata(tmp_path, body)
+    # `input.metadata.data` is not a data document
+    assert metadata.data_refs == ["ansible_policy", "galaxy", "other_policy"]
+    assert metadata.uses_module_fqcn is True
+    assert metadata.input_refs == ["task"]
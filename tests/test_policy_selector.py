@@ -0,0 +1,90 @@
+import glob
+import os
+
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+
+from ansible_policy.models import PolicyPattern, PolicySelector  # noqa: E402
+
+
+def list_enabled_policies_with_glob(root_dir: str, patterns: list):
+    # the selection before PolicySelector, which globbed the files and checked every pattern for each file
+    found_files = glob.glob(os.path.join(root_dir, "**", "policies/*.rego"), recursive=True)
+    found_files += glob.glob(os.path.join(root_dir, "**", "extensions/policy/*/*.rego"), recursive=True)
+    policies_and_enabled = {}
+    for policy_filepath in found_files:
+        for pattern in sorted(patterns, key=lambda x: len(x.name)):
+            enabled = pattern.check_enabled(filepath=policy_filepath, policy_root_dir=root_dir)
+            if enabled is None:
+                continue
+            policies_and_enabled[policy_filepath] = enabled
+    return [path for path, enabled in policies_and_enabled.items() if enabled]
+
+
+def write_policy(path, tags: list = None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    content = f"package {os.path.basename(path)[:-5]}\n\n"
+    if tags:
+        content += "__tags__ = [" + ", ".join(f'"{tag}"' for tag in tags) + "]\n"
+    with open(path, "w") as file:
+        file.write(content + "deny = false\n")
+    return str(path)
+
+
+@pytest.fixture
+def policy_root(tmp_path):
+    root = tmp_path / "root"
+    write_policy(root / "policies" / "top.rego")
+    write_policy(root / "src_a" / "policies" / "a1.rego", tags=["compliance"])
+    write_policy(root / "src_a" / "policies" / "a2.rego", tags=["security"])
+    write_policy(root / "src_a" / "roles" / "r" / "policies" / "a3.rego")
+    write_policy(root / "src_a" / "policies" / "nested" / "not_selected.rego")
+    write_policy(root / "src_a" / "policies" / ".hidden.rego")
+    write_policy(root / "src_b" / "extensions" / "policy" / "pkg" / "b1.rego")
+    write_policy(root / "src_b" / "extensions" / "policy" / "b_not_selected.rego")
+    write_policy(root / "src_b" / ".git" / "policies" / "hidden.rego")
+    write_policy(root / "src_c" / "policies" / "c1.rego", tags=["compliance", "security"])
+    (root / "src_c" / "policies" / "README.md").write_text("not a policy")
+    return str(root)
+
+
+pattern_sets = [
+    ["default enabled"],
+    ["default enabled", "src_b disabled"],
+    ["default disabled", "src_a tag=compliance enabled"],
+    ["default enabled", "src_* tag=security disabled", "src_c enabled"],
+    ["src_a enabled", "src_b enabled", "src_a tag=security disabled"],
+]
+
+
+@pytest.mark.parametrize("pattern_lines", pattern_sets)
+def test_selector_is_same_as_glob(policy_root, pattern_lines):
+    patterns = [PolicyPattern.load(line) for line in pattern_lines]
+    selector = PolicySelector(root_dir=policy_root, patterns=patterns)
+    assert sorted(selector.select()) == sorted(list_enabled_policies_with_glob(policy_root, patterns))
+
+
+def test_selector_is_invalidated_by_changes(policy_root):
+    patterns = [PolicyPattern.load(line) for line in ["default enabled", "src_a tag=security disabled"]]
+    selector = PolicySelector(root_dir=policy_root, patterns=patterns)
+    selected = selector.select()
+    assert selector.is_valid()
+    assert selector.select() == selected
+
+    # a new policy in an existing directory
+    new_path = write_policy(os.path.join(policy_root, "src_a", "policies", "a4.rego"))
+    assert not selector.is_valid()
+    assert new_path in selector.select()
+    # a new policy in a new directory
+    new_path = write_policy(os.path.join(policy_root, "src_d", "policies", "d1.rego"))
+    assert new_path in selector.select()
+    # a tagged policy whose tags are changed
+    a2_path = os.path.join(policy_root, "src_a", "policies", "a2.rego")
+    assert a2_path not in selector.select()
+    write_policy(a2_path, tags=["compliance", "other"])
+    assert a2_path in selector.select()
+    # a removed policy
+    os.remove(new_path)
+    assert new_path not in selector.select()
+    assert sorted(selector.select()) == sorted(list_enabled_policies_with_glob(policy_root, patterns))
@@ -0,0 +1,84 @@
+from ansible_policy.position_index import YamlPositionIndex
+
+
+playbook_body = """---
+- name: First play
+  hosts: localhost
+  tasks:
+    - name: Install a package
+      ansible.builtin.package:
+        name: mysql-server
+        state: present
+
+    - name: Nested tasks
+      block:
+        - name: Create a user
+          ansible.builtin.user:
+            name: alice
+        - ansible.builtin.debug: {msg: hello}
+      rescue:
+        - name: Report the failure
+          ansible.builtin.debug:
+            msg: failed
+
+- name: Second play
+  hosts: all
+  tasks:
+    - name: Last task
+      ansible.builtin.ping:
+"""
+
+taskfile_body = """---
+- name: Copy a file
+  ansible.builtin.copy:
+    src: a.txt
+    dest: /tmp/a.txt
+- ansible.builtin.command: echo hello
+- {name: Flow task, ansible.builtin.debug: {msg: flow}}
+"""
+
+
+def test_plays():
+    index = YamlPositionIndex.from_body(playbook_body)
+    assert index.valid
+    assert [block.name for block in index.plays] == ["First play", "Second play"]
+    # a play ends before the next play, including the blank lines after it
+    assert index.find_play(play_name="First play", play_index=0) == [2, 20]
+    # the last play ends at the last line of the file
+    assert index.find_play(play_name="Second play", play_index=1) == [21, 25]
+
+
+def test_tasks_in_blocks():
+    index = YamlPositionIndex.from_body(playbook_body)
+    assert index.find_task(task_name="Install a package", module_name="ansible.builtin.package") == [5, 9]
+    # a block task covers its nested tasks, and each nested task ends at its own last line
+    assert index.find_task(task_name="Nested tasks") == [10, 20]
+    assert index.find_task(task_name="Create a user", module_name="ansible.builtin.user") == [12, 14]
+    assert index.find_task(task_name="Report the failure", module_name="ansible.builtin.debug") == [17, 20]
+    # the last task of the file ends at the last line of the file
+    assert index.find_task(task_name="Last task", module_name="ansible.builtin.ping") == [24, 25]
+
+
+def test_task_without_name_and_flow_mapping():
+    index = YamlPositionIndex.from_body(playbook_body)
+    # a task without a name is looked up by its module, and a flow mapping value stays on its line
+    assert index.find_task(module_name="ansible.builtin.debug", module_options={"msg": "hello"}) == [15, 15]
+
+
+def test_taskfile():
+    index = YamlPositionIndex.from_body(taskfile_body)
+    assert index.valid
+    # items of a taskfile are tasks, not plays
+    assert index.plays == [None, None, None]
+    assert index.find_play(play_name="Copy a file") is None
+    assert index.find_task(task_name="Copy a file", module_name="ansible.builtin.copy") == [2, 5]
+    assert index.find_task(module_name="ansible.builtin.command") == [6, 6]
+    # a task written as a flow mapping is on a single line
+    assert index.find_task(task_name="Flow task", module_name="ansible.builtin.debug") == [7, 7]
+
+
+def test_invalid_yaml():
+    index = YamlPositionIndex.from_body("- name: broken\n  hosts: [localhost\n")
+    assert not index.valid
+    assert index.find_task(task_name="broken") is None
+    assert index.find_play(play_name="broken") is None
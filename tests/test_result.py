@@ -0,0 +1,52 @@
+import dataclasses
+import json
+
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+
+from ansible_policy.models import EvaluationResult, EvaluationSummary  # noqa: E402
+from ansible_policy.serializer import dumps  # noqa: E402
+
+
+def add_results(result):
+    for filepath, policy_name, validated in [("a.yml", "p1", False), ("a.yml", "p2", True), ("b.yml", "p1", True)]:
+        result.add_single_result(
+            eval_result={"value": {"deny": not validated}, "message": ""},
+            is_target_type=True,
+            policy_name=policy_name,
+            target_type="task",
+            obj=None,
+            filepath=filepath,
+            lines={"begin": 1, "end": 2},
+        )
+    return result
+
+
+def test_summary_is_a_field():
+    assert [f.name for f in dataclasses.fields(EvaluationResult)][:2] == ["summary", "files"]
+    summary = EvaluationSummary(policies={"total": 0}, files={"total": 0})
+    assert EvaluationResult(summary=summary).summary is summary
+
+
+def test_summary_is_computed_from_files():
+    result = add_results(EvaluationResult())
+    summary = result.get_summary()
+    assert summary.files == {"total": 2, "validated": 1, "not_validated": 1, "list": ["a.yml", "b.yml"]}
+    assert summary.policies == {"total": 2, "violation_detected": 1, "list": ["p1", "p2"]}
+    assert dataclasses.asdict(result)["summary"] == dataclasses.asdict(summary)
+    assert EvaluationSummary.from_files(result.files) == summary
+
+    # adding a result clears the summary
+    add_results(result)
+    assert result.summary is None
+    assert result.get_summary() == summary
+
+
+def test_serialized_result():
+    result = add_results(EvaluationResult())
+    data = json.loads(dumps(result))
+    assert list(data) == ["summary", "files"]
+    assert data["summary"]["files"]["not_validated"] == 1
+    assert "_file_index" not in json.dumps(data)
+    assert "_policy_index" not in json.dumps(data)
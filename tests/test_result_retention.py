@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+
+from ansible_policy.models import (  # noqa: E402
+    EvaluationResult,
+    ResultFormatter,
+    RESULT_RETENTION_ALL,
+    RESULT_RETENTION_VIOLATIONS,
+)
+from ansible_policy.serializer import dumps  # noqa: E402
+
+
+class Target(object):
+    def __init__(self, name: str):
+        self.name = name
+
+
+# (filepath, policy, is target type, decision); an empty decision means that the policy was not evaluated
+decisions = [
+    ("a.yml", "p1", True, {"deny": True}),
+    ("a.yml", "p1", True, {"deny": False}),
+    ("a.yml", "p2", True, {}),
+    ("a.yml", "p2", False, {}),
+    ("b.yml", "p1", True, {"deny": False}),
+    ("b.yml", "p2", False, {}),
+]
+
+
+def make_result(retention: str):
+    result = EvaluationResult(retention=retention)
+    for i, (filepath, policy_name, is_target_type, value) in enumerate(decisions):
+        result.add_single_result(
+            eval_result={"value": value, "message": "denied\n" if value.get("deny") else ""},
+            is_target_type=is_target_type,
+            policy_name=policy_name,
+            target_type="task",
+            obj=Target(f"task {i}"),
+            filepath=filepath,
+            lines={"begin": i, "end": i + 1},
+        )
+    return result
+
+
+def test_counts_match_all_mode():
+    all_result = make_result(RESULT_RETENTION_ALL)
+    violations_result = make_result(RESULT_RETENTION_VIOLATIONS)
+    assert violations_result.get_summary() == all_result.get_summary()
+    for all_file, violations_file in zip(all_result.files, violations_result.files):
+        assert violations_file.violation == all_file.violation
+        for all_policy, violations_policy in zip(all_file.policies, violations_file.policies):
+            assert violations_policy.violation == all_policy.violation
+            assert violations_policy.passed == all_policy.passed
+            assert violations_policy.skipped == all_policy.skipped
+            assert violations_policy.not_applicable == all_policy.not_applicable
+            assert violations_policy.targets == [t for t in all_policy.targets if t.validated is False]
+            assert violations_policy.passed + violations_policy.skipped + len(violations_policy.targets) == len(all_policy.targets)
+
+
+def test_default_json_has_no_retention_fields():
+    data = json.loads(dumps(make_result(RESULT_RETENTION_ALL)))
+    assert list(data) == ["summary", "files"]
+    assert list(data["files"][0]["policies"][0]) == ["policy_name", "target_type", "violation", "targets"]
+
+    data = json.loads(dumps(make_result(RESULT_RETENTION_VIOLATIONS)))
+    assert data["retention"] == RESULT_RETENTION_VIOLATIONS
+    assert data["files"][0]["policies"][0]["passed"] == 1
+
+
+def test_rest_output_for_passed_input(capsys):
+    formatter = ResultFormatter(format_type="rest", isatty=False, term_width=80)
+    outputs = []
+    for retention in [RESULT_RETENTION_ALL, RESULT_RETENTION_VIOLATIONS]:
+        result = EvaluationResult(retention=retention)
+        result.add_single_result(
+            eval_result={"value": {"deny": False}, "message": ""},
+            is_target_type=True,
+            policy_name="check_method",
+            target_type="rest",
+            obj=Target("request"),
+            filepath="__no_filepath__",
+            lines=None,
+        )
+        formatter.print(result)
+        outputs.append(capsys.readouterr().out)
+    assert "check_method" in outputs[0]
+    assert outputs[1] == outputs[0]
@@ -0,0 +1,73 @@
+import glob
+import os
+
+import pytest
+
+from ansible_policy.routing import PolicyRoutingTable
+from ansible_policy.utils import PolicyMetadata, get_policy_metadata, match_str_expression
+
+
+examples_dir = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+input_types = ["task", "play", "role", "task_result", "event", "rest", "project"]
+module_names = ["", "ansible.builtin.copy", "ansible.builtin.copy_file", "ansible.posix.mount", "community.general.ufw", "copy"]
+
+
+def route_without_table(metadata_list: list, input_type: str, module_fqcn: str):
+    # the same checks as `PolicyEvaluator.check_target()` for each policy
+    target_type = "task" if input_type == "task_result" else input_type
+    target_paths = []
+    eval_paths = []
+    for metadata in metadata_list:
+        if not match_str_expression(metadata.target, target_type):
+            continue
+        target_paths.append(metadata.path)
+        if input_type == "task" and not match_str_expression(metadata.target_module, module_fqcn):
+            continue
+        eval_paths.append(metadata.path)
+    return target_paths, eval_paths
+
+
+def assert_same_routes(metadata_list: list):
+    routing_table = PolicyRoutingTable.build(metadata_list)
+    for input_type in input_types:
+        for module_fqcn in module_names:
+            expected = route_without_table(metadata_list, input_type, module_fqcn)
+            assert routing_table.route(input_type=input_type, module_fqcn=module_fqcn) == expected, (input_type, module_fqcn)
+            # a cached route is the same
+            assert routing_table.route(input_type=input_type, module_fqcn=module_fqcn) == expected
+
+
+def test_route_is_same_as_unrouted_loop():
+    targets = [
+        ("task", None),
+        ("task", ""),
+        ("task", "*"),
+        ("task", "ansible.builtin.copy"),
+        ("task", "ansible.builtin.*"),
+        ("task", "*.copy"),
+        ("play", None),
+        ("*", None),
+        ("*", "ansible.posix.mount"),
+        ("", None),
+        ("event", None),
+        ("rest", None),
+        ("ta*", "community.*"),
+    ]
+    metadata_list = [
+        PolicyMetadata(path=f"/policies/p{i}.rego", package=f"p{i}", target=target, target_module=target_module)
+        for i, (target, target_module) in enumerate(targets)
+    ]
+    assert_same_routes(metadata_list)
+
+
+def test_route_example_policies(tmp_path):
+    pytest.importorskip("ansible_rulebook")
+    from ansible_policy.policybook.transpiler import PolicyTranspiler
+
+    transpiler = PolicyTranspiler()
+    for policy_path in sorted(glob.glob(os.path.join(examples_dir, "*", "policies", "*.yml"))):
+        transpiler.run(input=policy_path, outdir=str(tmp_path))
+    rego_paths = sorted(glob.glob(os.path.join(str(tmp_path), "**", "*.rego"), recursive=True))
+    assert rego_paths
+    assert_same_routes([get_policy_metadata(rego_path) for rego_path in rego_paths])
@@ -0,0 +1,54 @@
+import sqlite3
+
+from ansible_policy.scan_cache import ScanCache, scan_cache_filename
+
+
+def make_project(tmp_path):
+    project_dir = tmp_path / "project"
+    (project_dir / "templates").mkdir(parents=True)
+    (project_dir / "playbook.yml").write_text("- hosts: all\n  tasks: []\n")
+    (project_dir / "templates" / "app.conf.j2").write_text("port={{ port }}\n")
+    return project_dir
+
+
+def test_cached_scan_is_reused(tmp_path):
+    project_dir = make_project(tmp_path)
+    cache = ScanCache(cache_dir=str(tmp_path / "cache"), key_path=str(tmp_path / "key"))
+    scans = []
+
+    def scan():
+        scans.append(1)
+        return {"task": [len(scans)]}
+
+    assert cache.load(project_dir=str(project_dir), scan_func=scan) == {"task": [1]}
+    assert cache.load(project_dir=str(project_dir), scan_func=scan) == {"task": [1]}
+    assert len(scans) == 1
+
+    # a change of a file which is not YAML (e.g. a template) makes the project scanned again
+    (project_dir / "templates" / "app.conf.j2").write_text("port=8080\n")
+    assert cache.load(project_dir=str(project_dir), scan_func=scan) == {"task": [2]}
+    assert cache.changed_files == ["templates/app.conf.j2"]
+    cache.close()
+
+
+def test_entries_not_signed_with_the_key_are_ignored(tmp_path):
+    project_dir = make_project(tmp_path)
+    cache_dir = tmp_path / "cache"
+    cache = ScanCache(cache_dir=str(cache_dir), key_path=str(tmp_path / "key"))
+    cache.load(project_dir=str(project_dir), scan_func=lambda: {"task": ["original"]})
+    cache.close()
+
+    # an entry written by someone else who can write the cache directory
+    conn = sqlite3.connect(str(cache_dir / scan_cache_filename))
+    conn.execute("UPDATE scans SET data = ?", (b"\0" * 32 + b"not a pickle",))
+    conn.commit()
+    conn.close()
+
+    cache = ScanCache(cache_dir=str(cache_dir), key_path=str(tmp_path / "key"))
+    assert cache.load(project_dir=str(project_dir), scan_func=lambda: {"task": ["scanned"]}) == {"task": ["scanned"]}
+    cache.close()
+
+    # another key does not accept the entries signed with the original one
+    cache = ScanCache(cache_dir=str(cache_dir), key_path=str(tmp_path / "other_key"))
+    assert cache.load(project_dir=str(project_dir), scan_func=lambda: {"task": ["rescanned"]}) == {"task": ["rescanned"]}
+    cache.close()
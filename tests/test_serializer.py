@@ -0,0 +1,164 @@
+import jsonpickle
+import pytest
+
+from ansible_policy import serializer
+from ansible_policy.serializer import dumps, register_encoder
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Node(object):
+    def __init__(self, name: str):
+        self.name = name
+        self.children = []
+        self.parent = None
+
+
+class Encoded(object):
+    def __init__(self):
+        self.value = "v"
+        self._index = {"hidden": True}
+
+
+register_encoder(Encoded, lambda obj: {"value": obj.value})
+
+
+def jsonpickle_encode(value):
+    return jsonpickle.encode(value, unpicklable=False, make_refs=False, separators=(",", ":"))
+
+
+def make_tree():
+    root = Node("root")
+    child = Node("child")
+    child.parent = root
+    root.children.append(child)
+    return root
+
+
+plain_values = [
+    {"a": 1, "b": [True, None, "x"], "c": {"d": ("e", "f")}},
+    {"name": "café 日本", "emoji": "\U0001f600"},
+    {"floats": [0.1, 1.5, 1e16, 1e-07, -0.0, float("nan"), float("inf"), float("-inf")]},
+    {"big": 2**70, "small": -(2**70)},
+    {1: "int key", None: "none key", ("a", 1): "tuple key"},
+    {"point": Point(1, 2.5), "points": [Point("a", "é")]},
+    {"tree": make_tree()},
+    {"encoded": Encoded()},
+    [Encoded(), {"nested": Encoded()}],
+    "plain string",
+    3.14,
+]
+
+
+@pytest.mark.parametrize("value", plain_values)
+def test_dumps_is_same_as_jsonpickle(value):
+    assert dumps(value) == jsonpickle_encode(value)
+
+
+@pytest.mark.parametrize("value", plain_values)
+def test_dumps_without_orjson_is_same_as_jsonpickle(value, monkeypatch):
+    monkeypatch.setattr(serializer, "orjson", None)
+    assert dumps(value) == jsonpickle_encode(value)
+
+
+def test_check_compatibility_compares_bytes():
+    value = {"name": "é"}
+    with pytest.raises(ValueError):
+        serializer.check_compatibility(value=value, json_str='{"name":"é"}')
+    serializer.check_compatibility(value=value, json_str=jsonpickle_encode(value))
+
+
+def test_encoded_object_can_be_decoded():
+    encoded = jsonpickle.encode(Encoded())
+    assert jsonpickle.decode(encoded)["value"] == "v"
+
+
+@pytest.fixture(scope="module")
+def model_values():
+    pytest.importorskip("ansible_content_capture")
+    from ansible_policy import models, rego_data
+
+    task = rego_data.Task(
+        key="task task:a.yml#play:[0]#task:[0]",
+        name="install café",
+        module="ansible.builtin.package",
+        filepath="a.yml",
+        module_options={"name": "nginx", "state": "present", "timeout": 1.5},
+        line_num_in_file=[3, 6],
+        module_fqcn="ansible.builtin.package",
+    )
+    play = rego_data.Play(key="play play:a.yml#play:[0]", name="play", filepath="a.yml", tasks=[task.key])
+    taskfile = rego_data.TaskFile(key="taskfile taskfile:tasks/main.yml", name="main.yml", filepath="tasks/main.yml", tasks=[task])
+    playbook = rego_data.Playbook(key="playbook playbook:a.yml", name="a.yml", filepath="a.yml", tasks=[task], plays=[play])
+    role = rego_data.Role(key="role role:r", name="r", filepath="roles/r", taskfiles={"main.yml": taskfile})
+    event = rego_data.Event(filepath="a.yml", line=3, event_type="runner_on_ok", uuid="u", event_data={"res": {"changed": True}})
+    api_request = rego_data.APIRequest(headers={"Accept": "*/*"}, path="/", method="POST", post_data={"n": 0.5})
+    policy_input = rego_data.PolicyInput(
+        type="task",
+        source={"type": "project"},
+        playbooks={playbook.key: playbook},
+        taskfiles={taskfile.key: taskfile},
+        roles={role.key: role},
+        task=task,
+        play=play,
+        event=event,
+        rest=api_request,
+        variables={"x": "y"},
+    )
+
+    result = models.EvaluationResult()
+    result.add_single_result(
+        eval_result={"value": {"deny": True}, "message": "méssage"},
+        is_target_type=True,
+        policy_name="check_package",
+        target_type="task",
+        obj=task,
+        filepath="a.yml",
+        lines={"begin": 3, "end": 6},
+    )
+    result.get_summary()
+    file_result = result.files[0]
+    policy_result = file_result.policies[0]
+    return {
+        "task": task,
+        "play": play,
+        "role": role,
+        "taskfile": taskfile,
+        "playbook": playbook,
+        "event": event,
+        "api_request": api_request,
+        "policy_input": policy_input,
+        # the result classes are encoded by their public fields, as jsonpickle does with the same handlers
+        "evaluation_result": result,
+        "file_result": file_result,
+        "policy_result": policy_result,
+        "target_result": policy_result.targets[0],
+        "summary": result.summary,
+    }
+
+
+model_names = [
+    "task",
+    "play",
+    "role",
+    "taskfile",
+    "playbook",
+    "event",
+    "api_request",
+    "policy_input",
+    "evaluation_result",
+    "file_result",
+    "policy_result",
+    "target_result",
+    "summary",
+]
+
+
+@pytest.mark.parametrize("name", model_names)
+def test_model_classes_are_same_as_jsonpickle(model_values, name):
+    value = model_values[name]
+    assert dumps(value) == jsonpickle_encode(value)
@@ -0,0 +1,68 @@
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("ansible_content_capture")
+if not shutil.which("opa"):
+    pytest.skip("`opa` command is not available", allow_module_level=True)
+
+from ansible_policy.models import PolicyEvaluator, ResultFormatter  # noqa: E402
+from ansible_policy.watch import WatchSession  # noqa: E402
+
+
+examples_dir = os.path.join(os.path.dirname(__file__), "..", "examples", "check_project")
+
+
+def make_session(tmp_path):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    shutil.copy(os.path.join(examples_dir, "playbook.yml"), project_dir / "playbook.yml")
+    policy_dir = tmp_path / "policies"
+    shutil.copytree(os.path.join(examples_dir, "policies"), policy_dir)
+    evaluator = PolicyEvaluator(policy_dir=str(policy_dir), root_dir=str(tmp_path / "installed"))
+    session = WatchSession(evaluator=evaluator, project_dir=str(project_dir), formatter=ResultFormatter(format_type="plain"))
+    return session, project_dir, policy_dir
+
+
+def collection_findings(findings):
+    return [f for f in findings if "collection" in f.policy_name.lower()]
+
+
+def test_watch_policybook_edit(tmp_path):
+    session, _, policy_dir = make_session(tmp_path)
+    try:
+        result, _ = session.run()
+        assert result.summary.policies["violation_detected"] > 0
+
+        # allowing the collection resolves the finding
+        policy_path = policy_dir / "check_collection.yml"
+        original = policy_path.read_text()
+        policy_path.write_text(original.replace("      - amazon.aws\n", "      - amazon.aws\n      - community.mysql\n"))
+        delta = session.on_change([str(policy_path)])
+        assert collection_findings(delta.resolved)
+        assert not delta.added
+        # only the decisions of the changed policy are evaluated
+        assert delta.reused > 0
+
+        # reverting the edit brings the finding back
+        policy_path.write_text(original)
+        delta = session.on_change([str(policy_path)])
+        assert collection_findings(delta.added)
+        assert not delta.resolved
+    finally:
+        session.close()
+
+
+def test_watch_playbook_edit(tmp_path):
+    session, project_dir, _ = make_session(tmp_path)
+    try:
+        session.run()
+
+        playbook_path = project_dir / "playbook.yml"
+        playbook_path.write_text(playbook_path.read_text().replace("community.mysql.mysql_user", "ansible.builtin.user"))
+        delta = session.on_change([str(playbook_path)])
+        assert collection_findings(delta.resolved)
+        assert not delta.added
+    finally:
+        session.close()